@@ -2,6 +2,7 @@
 
 import pygame, sys, math, random
 from pygame.locals import *
+from engine import fonts, headless, options, overlay, profiler, render, rotation, shapes
 
 FPS = 30
 MAX_X, MAX_Y = 1024, 768
@@ -11,6 +12,8 @@ C_MAIN    = (192, 192, 192)
 C_KEY     = (255,   0, 255)
 C_BG      = (  0,   0,   0)
 
+ROTATIONS = rotation.RotationCache(resolution=10)
+
 
 
 #---- class: GameObject --------------------------------------------------
@@ -26,6 +29,7 @@ class GameObject(pygame.sprite.Sprite):
         self.vel_x = vel[0]
         self.vel_y = vel[1]
         self.angle = 0
+        self.drawn_angle = None
 
     def update(self, *args):
         self.pos_x += self.vel_x
@@ -39,8 +43,10 @@ class GameObject(pygame.sprite.Sprite):
         self.angle %= 360
 
     def prepare_for_draw(self):
-        self.image = pygame.transform.rotate(self.image_orig, -self.angle)
-        self.rect = self.image.get_rect()
+        if self.angle != self.drawn_angle:
+            self.image = ROTATIONS.rotate(self.image_orig, -self.angle)
+            self.rect.size = self.image.get_size()
+            self.drawn_angle = self.angle
         self.rect.center = (self.pos_x, self.pos_y)
 
     def create_sprite(self, size=32, pts=None ):
@@ -48,11 +54,10 @@ class GameObject(pygame.sprite.Sprite):
             w = size-3
             # minus 3 because of the line thickness
             pts = ((0, 0),(0, w),(w, w),(w, 0))
-        img = pygame.Surface((size,size))
-        img.fill(C_KEY)
-        img.set_colorkey(C_KEY)
-        pygame.draw.polygon(img, C_MAIN, pts, 3)
+        img = shapes.factory.polygon(size, pts, C_MAIN, 3, colorkey=C_KEY)
         self.image_orig = img
+        self.rect = img.get_rect()
+        self.drawn_angle = None
 
 
 
@@ -62,6 +67,7 @@ class Ship(GameObject):
     def __init__(self):
         GameObject.__init__(self)
         self.create_sprite( size=32, pts=((32,16), (0,28), (0,4)) )
+        ROTATIONS.prewarm(self.image_orig)
         self.reset()
         self.prepare_for_draw()
 
@@ -131,17 +137,18 @@ def terminate():
     sys.exit()
 
 
-def init(max_x, max_y, title = 'pyGame Template'):
+def init(max_x, max_y, title = 'pyGame Template', seed = None):
     pygame.init()
     clk = pygame.time.Clock()
     disp = pygame.display.set_mode((max_x, max_y))
     pygame.display.set_caption(title)
-    random.seed()
+    random.seed(seed)
     return disp, clk
 
 
-def handle_events(cmd):
-    for event in pygame.event.get():
+def handle_events(cmd, events, profile_overlay):
+    for event in events:
+        profile_overlay.handle_event(event)
 
         if event.type == QUIT:
             cmd['quit'] = True
@@ -168,15 +175,16 @@ def handle_events(cmd):
 
 #---- main() -------------------------------------------------------------
 def main():
+    opts = options.parse_args('Asteroids, the classic version.')
     level = 1
     score = 0
     lives = 2
     highscore = 0
     commands = {'quit': False, 'left': 0, 'right': 0, 'thrust': 0, 'fire': 0}
 
-    DISPLAY, CLOCK = init(MAX_X, MAX_Y, "Asteroid Classic")
-    FONT1 = pygame.font.SysFont('courier', 45)
-    FONT2 = pygame.font.SysFont('courier', 15)
+    DISPLAY, CLOCK = init(MAX_X, MAX_Y, "Asteroid Classic", opts.seed)
+    FONT1 = fonts.registry.get('courier', 45)
+    FONT2 = fonts.registry.get('courier', 15)
 
     asteroids = pygame.sprite.RenderPlain()
     asteroids.add( LargeAsteroid((MAX_X/4, MAX_Y/4)) )
@@ -184,17 +192,24 @@ def main():
     asteroids.add( SmallAsteroid((MAX_X*3/4, MAX_Y*3/4)) )
     ship = Ship()
     allsprites = pygame.sprite.Group(ship)
+    renderer = render.Renderer(DISPLAY, C_BG, opts.dirty, enabled=not opts.no_draw)
+    driver = headless.Driver(opts, keys=(K_LEFT, K_RIGHT, K_UP))
+    profile_overlay = overlay.Overlay(FPS, pos=(10, 40))
 
     #main game loop
     while True:
 
-        handle_events(commands)
+        profiler.frames.begin()
+        driver.frame()
+        handle_events(commands, driver.events(), profile_overlay)
 
         if commands['quit']:
             terminate()
+        profiler.frames.mark('events')
 
         allsprites.update(commands)
         asteroids.update(commands)
+        profiler.frames.mark('update')
 
         # detect collisions
         #for a in pygame.sprite.spritecollide(ship, asteroids, False):
@@ -204,13 +219,22 @@ def main():
 
 
         # draw main screen
-        DISPLAY.fill(C_BG)
-        allsprites.draw(DISPLAY)
-        asteroids.draw(DISPLAY)
+        renderer.draw(allsprites)
+        renderer.draw(asteroids)
+        profiler.frames.mark('draw')
+
+        if opts.debug:
+            debug_img = FONT2.render(renderer.stats_text(), True, C_MAIN, C_BG)
+            renderer.blit('debug', debug_img, (10, 10))
+
+        profile_overlay.draw(renderer)
+        profiler.frames.mark('hud')
 
         # advance game frame
-        pygame.display.update()
-        CLOCK.tick(FPS)
+        renderer.update()
+        profiler.frames.end('flip')
+        if not opts.headless:
+            CLOCK.tick(FPS)
 
 
     terminate()
@@ -2,8 +2,13 @@
 
 import pygame, sys, math, random, os
 from pygame.locals import *
+from engine import assets, atlas, checksum, collision, fonts, headless, loop, options, overlay, preload, profiler, render, rotation, shapes, text, timers
 
-DEBUG = False
+parser = options.create_parser('Asteroids, using sprites.')
+parser.add_argument('--asteroids', type=int, default=1, metavar='N',
+                    help='start with N asteroids')
+OPTIONS = options.parse(parser)
+DEBUG = OPTIONS.debug
 FPS = 30
 MAX_X = 800
 MAX_Y = 600
@@ -15,6 +20,17 @@ DARKGRAY  = ( 40,  40,  40)
 RED       = (255,  40,  40)
 BGCOLOR   = BLACK
 
+ROTATIONS = rotation.RotationCache(resolution=10)
+
+# collision layers, objects wrap around the screen edges so the grid does too
+SHIP      = 1
+ASTEROID  = 2
+SHOT      = 4
+COLLISIONS = collision.SpatialHash(64, world_size=(MAX_X, MAX_Y))
+
+# everything the game loads, decoded up front by the preloader
+ASSETS = ('background', 'ship', 'asteroid', 'explosion')
+
 
 #### Class: GameObject ######################################################
 class GameObject(pygame.sprite.Sprite):
@@ -24,6 +40,7 @@ class GameObject(pygame.sprite.Sprite):
         self.pos = (0, 0)
         self.vel = (0, 0)
         self.angle = None
+        self.drawn_angle = None
         self.is_animated = False
 
     def update(self):
@@ -33,8 +50,10 @@ class GameObject(pygame.sprite.Sprite):
 
         if self.angle is not None:
             self.angle %= 360
-            self.image = pygame.transform.rotate(self.image_orig, self.angle)
-            self.rect = self.image.get_rect()
+            if self.angle != self.drawn_angle:
+                self.image = ROTATIONS.rotate(self.image_orig, self.angle)
+                self.rect.size = self.image.get_size()
+                self.drawn_angle = self.angle
 
         self.set_position((x, y))
         if self.is_animated:
@@ -47,17 +66,12 @@ class GameObject(pygame.sprite.Sprite):
         except AttributeError:
             pass
 
-    def load_image(self, filename):
-        self.image = pygame.image.load(filename).convert_alpha()
+    def load_image(self, name):
+        self.image = atlas.sprites.image(name)
         self.rect = self.image.get_rect( center=self.pos )
 
-    def load_animation(self, filename, size, width, height, loop=True):
-        self.spritesheet = pygame.image.load(filename).convert_alpha()
-        self.frames = []
-        for y in range(0, height):
-            for x in range (0, width):
-                sub_img = self.spritesheet.subsurface( (x*size, y*size, size, size) )
-                self.frames.append(sub_img)
+    def load_animation(self, name, loop=True):
+        self.frames = atlas.sprites.animation(name)
         self.is_animated = True
         self.animation_loops = loop
         self.reset_animation()
@@ -81,6 +95,23 @@ class GameObject(pygame.sprite.Sprite):
         vel_y = -1 * math.sin(math.radians(self.angle)) * speed
         self.vel = (vel_x, vel_y)
 
+    def get_state(self):
+        """Position, motion and animation as plain data, for replay keyframes."""
+        frame = self.next_frame_idx if self.is_animated else None
+        return (self.pos, self.vel, self.angle, self.drawn_angle, frame)
+
+    def set_state(self, state):
+        """Put back what get_state() returned, on a new object of the
+        same class."""
+        pos, self.vel, self.angle, self.drawn_angle, frame = state
+        if frame is not None:
+            self.image = self.frames[(frame - 1) % len(self.frames)]
+            self.next_frame_idx = frame
+        elif self.drawn_angle is not None:
+            self.image = ROTATIONS.rotate(self.image_orig, self.drawn_angle)
+            self.rect.size = self.image.get_size()
+        self.set_position(pos)
+
 
 #### Class: Asteroid ########################################################
 class Asteroid(GameObject):
@@ -97,7 +128,7 @@ class Asteroid(GameObject):
         s = random.randint(3, 6)
         self.vel = (random.randint(-s, s), random.randint(-s, s))
 
-        self.load_animation('assets/asteroid2.png', 64, 5, 6)
+        self.load_animation('asteroid')
 
 
 #### Class: Explosion ######################################################
@@ -105,11 +136,9 @@ class Explosion(GameObject):
 
     def __init__(self, pos):
         GameObject.__init__(self)
-        self.load_animation('assets/explosion1_64x64.png', 64, 5, 5, False)
+        self.load_animation('explosion', False)
         self.set_position(pos)
-
-    def is_done(self):
-        return self.is_animation_done()
+        self.expiry = timers.scheduler.schedule(len(self.frames) - 1, self.kill)
 
 
 #### class: Shot ############################################################
@@ -120,32 +149,25 @@ class Shot(GameObject):
         self.set_position(pos)
         self.angle = angle
         self.set_velocity(self.angle, speed)
-        self.time_to_live = FPS//2
+        self.expiry = timers.scheduler.schedule(FPS//2, self.kill)
 
     def create_sprite(self):
         size = 8
-        self.image = pygame.Surface((size, size))
-        self.image.fill(BLACK)
-        self.image.set_colorkey(BLACK)
-        pygame.draw.circle(self.image, (192,  10,  10), (size//2, size//2), size//2)
-        pygame.draw.circle(self.image, (192, 128, 128), (size//2, size//2), size//4)
+        self.image = shapes.factory.shape(size, (
+            ('circle', (192,  10,  10), (size//2, size//2), size//2),
+            ('circle', (192, 128, 128), (size//2, size//2), size//4),
+        ), colorkey=BLACK)
         self.image_orig = self.image
         self.rect = self.image.get_rect()
 
-    def update(self):
-        GameObject.update(self)
-        self.time_to_live -= 1
-
-    def is_done(self):
-        return self.time_to_live <= 0
-
 #### class: Ship ##########################################################
 class Ship(GameObject):
 
     def __init__(self):
         GameObject.__init__(self)
-        self.load_image('assets/ship1_32x32.png')
+        self.load_image('ship')
         self.image_orig = self.image
+        ROTATIONS.prewarm(self.image_orig)
         self.reset()
 
     def reset(self):
@@ -171,23 +193,107 @@ def terminate():
     pygame.quit()
     sys.exit()
 
+def next_level():
+    global level
+    level += 1
+    ship.reset()
+    for i in range (0, level):
+        asteroids.add( Asteroid() )
+
+def respawn():
+    global ship, lives
+    lives -= 1
+    ship = Ship()
+    ships.add(ship)
+
+TRANSITIONS = { 'next_level': next_level, 'respawn': respawn }
+
+def save_state():
+    """Everything the game needs to carry on, for replay keyframes."""
+    waiting = transition is not None and transition.active
+    return {
+        'random': random.getstate(),
+        'now': timers.scheduler.now,
+        'game': (score, level, lives, cmd_thrust, cmd_left, cmd_right),
+        'ship': (ship.get_state(), ship.alive()),
+        'asteroids': [ a.get_state() for a in asteroids.sprites() ],
+        'shots': [ (s.get_state(), s.expiry.due) for s in shots.sprites() ],
+        'explosions': [ (e.get_state(), e.expiry.due) for e in explosions.sprites() ],
+        'transition': (transition.callback.__name__, transition.due) if waiting else None,
+    }
+
+def load_state(state):
+    global score, level, lives, cmd_thrust, cmd_left, cmd_right, transition, ship
+    score, level, lives, cmd_thrust, cmd_left, cmd_right = state['game']
+
+    ship = Ship()
+    ship.set_state(state['ship'][0])
+    ships.empty()
+    if state['ship'][1]:
+        ships.add(ship)
+    asteroids.empty()
+    for s in state['asteroids']:
+        a = Asteroid()
+        a.set_state(s)
+        asteroids.add(a)
+    expiring = []
+    shots.empty()
+    for s, due in state['shots']:
+        shot = Shot(s[0], s[2])
+        shot.set_state(s)
+        shots.add(shot)
+        expiring.append((shot, due))
+    explosions.empty()
+    for s, due in state['explosions']:
+        e = Explosion(s[0])
+        e.set_state(s)
+        explosions.add(e)
+        expiring.append((e, due))
+
+    # the objects made above scheduled timers of their own, start over
+    timers.scheduler.clear()
+    now = timers.scheduler.now = state['now']
+    for obj, due in expiring:
+        obj.expiry = timers.scheduler.schedule(due - now, obj.kill)
+    transition = None
+    if state['transition'] is not None:
+        name, due = state['transition']
+        transition = timers.scheduler.schedule(due - now, TRANSITIONS[name])
+    random.setstate(state['random'])
+
+def hash_state(frame):
+    """Log a hash of the state at the end of frame, for --hash-log."""
+    hashes.entities('ship', ships, GameObject.get_state)
+    hashes.entities('asteroids', asteroids, GameObject.get_state)
+    hashes.entities('shots', shots, GameObject.get_state)
+    hashes.entities('explosions', explosions, GameObject.get_state)
+    hashes.value('game', (score, level, lives, cmd_thrust, cmd_left, cmd_right,
+                          timers.scheduler.now))
+    hashes.value('random', checksum.random_state())
+    hashes.end_frame(frame)
+
 
 
 #### main ################################################################
 pygame.init()
 FPSCLOCK = pygame.time.Clock()
 DISPLAYSURF = pygame.display.set_mode((MAX_X, MAX_Y))
-BASICFONT = pygame.font.SysFont('arial', 12, True)
+BASICFONT = fonts.registry.get('arial', 12, True)
 pygame.display.set_caption('pyGame Template')
-random.seed()
+random.seed(OPTIONS.seed)
 
-background = pygame.image.load(f"assets/space_background.jpg").convert()
+preload.loading_screen(DISPLAYSURF, FPSCLOCK, preload.Preloader(ASSETS), BASICFONT)
+background = atlas.sprites.image("background")
+renderer = render.Renderer(DISPLAYSURF, background, OPTIONS.dirty, enabled=not OPTIONS.no_draw)
 
-asteroids = pygame.sprite.RenderPlain( Asteroid() )
+asteroids = pygame.sprite.RenderPlain([ Asteroid() for i in range(OPTIONS.asteroids) ])
 explosions = pygame.sprite.RenderPlain()
 shots = pygame.sprite.RenderPlain()
 ship = Ship()
 ships = pygame.sprite.RenderPlain(ship)
+COLLISIONS.set_layer(ships, SHIP, mask=ASTEROID)
+COLLISIONS.set_layer(asteroids, ASTEROID, mask=SHIP|SHOT)
+COLLISIONS.set_layer(shots, SHOT, mask=ASTEROID)
 
 score = 0
 level = 1
@@ -195,13 +301,21 @@ lives = 2
 cmd_thrust = False
 cmd_left = False
 cmd_right = False
-delay_game = 0
+transition = None   # timer of the next level or ship
+timestep = loop.FixedStep(FPS, clock=FPSCLOCK, realtime=not OPTIONS.headless)
+driver = headless.Driver(OPTIONS, keys=(K_UP, K_LEFT, K_RIGHT, K_LCTRL), timestep=timestep)
+profile_overlay = overlay.Overlay(FPS, pos=(10, MAX_Y - 130))
+driver.set_state_handlers(save_state, load_state)
+hashes = checksum.FrameHash(OPTIONS.hash_log) if OPTIONS.hash_log else None
 
 #main game loop
 while True:
 
     #event handling
-    for event in pygame.event.get():
+    profiler.frames.begin()
+    driver.frame()
+    for event in driver.events():
+        profile_overlay.handle_event(event)
         if event.type == QUIT:
             terminate()
 
@@ -223,73 +337,75 @@ while True:
                 asteroids.add( Asteroid() )
             if event.key == K_ESCAPE:
                 terminate()
-
-    #update game objects
-    asteroids.update()
-    explosions.update()
-    shots.update()
-    if ship.alive():
-        ships.update(cmd_thrust, cmd_left, cmd_right)
-
-    for exp in explosions.sprites():
-        if exp.is_done():
-            exp.kill()
-
-    for sh in shots.sprites():
-        if sh.is_done():
-            sh.kill()
-
-    # detect collisions
-    for a in pygame.sprite.spritecollide(ship, asteroids, False):
+    profiler.frames.mark('events')
+
+    #update game objects, in fixed steps
+    for step in timestep.steps():
+        timestep.snapshot(asteroids, explosions, shots, ships)
+        asteroids.update()
+        explosions.update()
+        shots.update()
         if ship.alive():
-            explosions.add(Explosion(ship.pos))
-            ship.kill()
-
-    for a in pygame.sprite.groupcollide(asteroids, shots, True, True).keys():
-        explosions.add(Explosion(a.pos))
-        score += 10
-
+            ships.update(cmd_thrust, cmd_left, cmd_right)
+
+        # expire shots and explosions, run state transitions
+        timers.scheduler.tick()
+        profiler.frames.mark('update')
+
+        # detect collisions
+        COLLISIONS.tests = 0
+        for a in COLLISIONS.spritecollide(ship, asteroids, False):
+            if ship.alive():
+                explosions.add(Explosion(ship.pos))
+                ship.kill()
+
+        for a in COLLISIONS.groupcollide(asteroids, shots, True, True).keys():
+            explosions.add(Explosion(a.pos))
+            score += 10
+        profiler.frames.mark('collide')
+
+        # after a short pause, start the next level or bring in the next ship
+        waiting = transition is not None and transition.active
+        if len(asteroids) == 0 and len(explosions) == 0 and not waiting:
+            transition = timers.scheduler.schedule(FPS*2, next_level)
+        elif len(ships) == 0 and len(explosions) == 0 and lives > 0 and not waiting:
+            transition = timers.scheduler.schedule(FPS*2, respawn)
+
+    if hashes is not None:
+        hash_state(driver.frames)
+        profiler.frames.mark('update')
 
     # draw frame
-    DISPLAYSURF.blit(background, (0, 0))
-    shots.draw(DISPLAYSURF)
-    ships.draw(DISPLAYSURF)
-    asteroids.draw(DISPLAYSURF)
-    explosions.draw(DISPLAYSURF)
+    timestep.draw(renderer, shots)
+    timestep.draw(renderer, ships)
+    timestep.draw(renderer, asteroids)
+    timestep.draw(renderer, explosions)
+    profiler.frames.mark('draw')
 
     msg = f"LEVEL: {level}   SCORE: {score}    LIVES: {lives}"
-    msg_disp = BASICFONT.render(msg, True, WHITE, BLACK)
-    DISPLAYSURF.blit(msg_disp, (10, 10))
+    msg_disp = text.cache.render(BASICFONT, msg, True, WHITE, BLACK)
+    renderer.blit('score', msg_disp, (10, 10))
 
     # show some debuging info
     if DEBUG is True:
-        real_fps = FPSCLOCK.get_fps()
+        real_fps = timestep.get_fps()
         sprite_count = len(asteroids) + len(explosions) + len (shots) + len(ships)
-        debug_msg = f"FPS: {real_fps:.2f}   SPRITES: {sprite_count}"
+        cache = assets.cache.stats()
+        debug_msg = (f"FPS: {real_fps:.2f}   SPRITES: {sprite_count}   "
+                     f"CACHE: {cache['hits']} hits, {cache['misses']} misses, "
+                     f"{cache['bytes']//1024} KB   SHAPES: {shapes.factory.live()}   "
+                     f"COLLISION TESTS: {COLLISIONS.tests}")
         debug_msg_surf = BASICFONT.render(debug_msg, True, WHITE, BLACK)
-        DISPLAYSURF.blit(debug_msg_surf, (10, 28))
-
-
-    if len(asteroids) == 0 and len(explosions) == 0:
-        level += 1
-        ship.reset()
-        for i in range (0, level):
-            asteroids.add( Asteroid() )
-        delay_game = FPS*2
-
-    if len(ships) == 0 and len(explosions) == 0 and lives > 0:
-        lives -= 1
-        ship = Ship()
-        ships.add(ship)
-        delay_game = FPS*2
+        renderer.blit('debug', debug_msg_surf, (10, 28))
+        render_msg_surf = BASICFONT.render(renderer.stats_text(), True, WHITE, BLACK)
+        renderer.blit('render', render_msg_surf, (10, 46))
 
-    if delay_game > 0:
-        delay_game -= 1
+    profile_overlay.draw(renderer)
+    profiler.frames.mark('hud')
 
     #advance frame
-    #pygame.display.update()
-    pygame.display.flip()
-    FPSCLOCK.tick(FPS)
+    renderer.update()
+    profiler.frames.end('flip')
 
 
 terminate()   # won't actually get called
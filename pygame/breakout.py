@@ -1,7 +1,13 @@
 #!/usr/bin/env python
 
-import pygame, sys, math, random
+import pygame, sys, math, random, time
 from pygame.locals import *
+from engine import checksum, fonts, headless, levels, loop, options, overlay, profiler, render, shapes, text
+
+try:
+    import numpy
+except ImportError:
+    numpy = None    # only needed for multi-ball mode
 
 FPS = 60
 MAX_X = 800
@@ -19,6 +25,18 @@ BLUE      = ( 0,    0, 255)
 VIOLET    = (255,   0, 255)
 BGCOLOR = BLACK
 
+BALL_SPEED = 6          # pixels per frame on level 1
+BALL_SPEED_STEP = 1     # added each level
+MAX_BALL_SPEED = 24
+
+LEVELS = levels.LevelLoader()
+
+BENCHMARK_BALLS = (1, 10, 50, 100, 250, 500, 1000)
+BENCHMARK_WARMUP = 10       # frames
+BENCHMARK_FRAMES = 200
+BENCHMARK_BRICK = (8, 4)    # brick size of --bricks boards
+BENCHMARK_COLORS = (RED, ORANGE, YELLOW, GREEN, BLUE, VIOLET)
+
 
 #### class: Paddle ##########################################################
 class Paddle(pygame.sprite.Sprite):
@@ -32,12 +50,11 @@ class Paddle(pygame.sprite.Sprite):
         self.balls_held = []
 
     def load_sprite(self):
-        self.image = pygame.Surface((70, 20))
-        self.image.fill(WHITE)
-        self.image.set_colorkey(WHITE)
-        pygame.draw.rect(self.image, GRAY, (10, 0, 50, 20))
-        pygame.draw.circle(self.image, GRAY, (10, 10), 10)
-        pygame.draw.circle(self.image, GRAY, (60, 10), 10)
+        self.image = shapes.factory.shape((70, 20), (
+            ('rect', GRAY, (10, 0, 50, 20)),
+            ('circle', GRAY, (10, 10), 10),
+            ('circle', GRAY, (60, 10), 10),
+        ), colorkey=WHITE)
 
     def catch_ball(self, sprite):
         self.balls_held.append(sprite)
@@ -50,53 +67,49 @@ class Paddle(pygame.sprite.Sprite):
         x-axis"""
         return x - self.rect.centerx
 
-    def update(self, arena):
-        self.rect.centerx = pygame.mouse.get_pos()[0]
+    def update(self, arena, x):
+        """Follow the mouse, x is where the last MOUSEMOTION event put it."""
+        self.rect.centerx = x
         self.rect.clamp_ip(arena)
 
 
 #### class: Ball ############################################################
 class Ball(pygame.sprite.Sprite):
-
-    def __init__(self, paddle = None):
+    """
+    The ball moves continuously: each frame its box is swept along its
+    velocity and it bounces off the first thing in its way (wall, paddle or
+    brick), then carries on with the rest of the frame's movement.  So it
+    can't tunnel through anything however fast it goes.  Every bounce is a
+    sub-step, at most MAX_STEPS per frame; movement left after that is
+    dropped for the frame.
+    """
+
+    MAX_STEPS = 8
+
+    def __init__(self, paddle = None, speed = 6):
         pygame.sprite.Sprite.__init__(self)
         self.load_sprite()
         self.rect = self.image.get_rect()
 
         #self.rect.center = pos
         self.rect.center = (paddle.rect.centerx, paddle.rect.top-8)
+        self.x, self.y = self.rect.topleft    # exact position, rect is rounded
 
         self.paddle = paddle
         self.paddle_pos = 10
-        self.set_velocity(300, 6)
+        self.set_velocity(300, speed)
         self.dead = False
+        self.steps = 0
 
     def load_sprite(self):
-        self.image = pygame.Surface((12, 12))
-        self.image.fill(WHITE)
-        self.image.set_colorkey(WHITE)
-        pygame.draw.circle(self.image, GRAY, (6, 6), 6)
+        self.image = shapes.factory.circle(6, GRAY, colorkey=WHITE)
 
     def bounce_paddle(self, sprite):
         pct = (self.rect.centerx - sprite.rect.centerx) / (float(sprite.rect.width) / 2.0)
+        pct = max(-1.0, min(pct, 1.0))
         angle = 270 + (50*pct)
         self.set_velocity(angle)
 
-    def bounce_walls(self, walls):
-        """Ensure ball remains contained within the given Rect (walls)"""
-        if self.rect.bottom >= walls.bottom:
-            #kill the ball
-            self.dead = True
-            self.vel_x = 0
-            self_vel_y = 0
-            self.kill()
-        elif self.rect.left <= walls.left:
-            self.vel_x = -self.vel_x
-        elif self.rect.right >= walls.right:
-            self.vel_x = -self.vel_x
-        elif self.rect.top <= walls.top:
-            self.vel_y = -self.vel_y
-
     def set_velocity(self, angle, speed = -1):
         if speed != -1:
             self.speed = speed
@@ -114,13 +127,273 @@ class Ball(pygame.sprite.Sprite):
         self.bounce_paddle(self.paddle)
         self.paddle = None
 
-
-    def update(self, arena):
+    def sweep(self, dx, dy, rect):
+        """When moving by (dx, dy) would make the ball hit rect, return the
+        fraction of the move done at that moment and the hit side's normal
+        as (t, nx, ny), else None.  Already overlapping doesn't count."""
+        w, h = self.rect.size
+        if dx > 0:
+            tx_entry = (rect.left - (self.x + w)) / dx
+            tx_exit = (rect.right - self.x) / dx
+        elif dx < 0:
+            tx_entry = (rect.right - self.x) / dx
+            tx_exit = (rect.left - (self.x + w)) / dx
+        elif self.x + w <= rect.left or self.x >= rect.right:
+            return None
+        else:
+            tx_entry, tx_exit = -math.inf, math.inf
+
+        if dy > 0:
+            ty_entry = (rect.top - (self.y + h)) / dy
+            ty_exit = (rect.bottom - self.y) / dy
+        elif dy < 0:
+            ty_entry = (rect.bottom - self.y) / dy
+            ty_exit = (rect.top - (self.y + h)) / dy
+        elif self.y + h <= rect.top or self.y >= rect.bottom:
+            return None
+        else:
+            ty_entry, ty_exit = -math.inf, math.inf
+
+        t = max(tx_entry, ty_entry)
+        if t < 0 or t >= 1 or t >= min(tx_exit, ty_exit):
+            return None
+        nx = -math.copysign(1, dx) if tx_entry >= ty_entry else 0
+        ny = -math.copysign(1, dy) if ty_entry >= tx_entry else 0
+        return (t, nx, ny)
+
+    def sweep_walls(self, dx, dy, walls):
+        """Like sweep() for the inside of the walls; the bottom is open."""
+        w = self.rect.width
+        hit = None
+        if dx < 0 and self.x + dx < walls.left:
+            hit = (max((walls.left - self.x) / dx, 0), 1, 0)
+        elif dx > 0 and self.x + w + dx > walls.right:
+            hit = (max((walls.right - (self.x + w)) / dx, 0), -1, 0)
+        if dy < 0 and self.y + dy < walls.top:
+            t = max((walls.top - self.y) / dy, 0)
+            if hit is None or t < hit[0]:
+                hit = (t, 0, 1)
+            elif t == hit[0]:
+                hit = (t, hit[1], 1)
+        return hit
+
+    def update(self, arena, paddle, field):
+        """Move the ball for one frame, returns the blocks it broke."""
+        broken = []
+        self.steps = 0
         if self.paddle:
             self.rect.centerx = self.paddle.rect.centerx + self.paddle_pos
+            self.x, self.y = self.rect.topleft
+            return broken
+
+        # the paddle moves by jumps and may have landed on the ball
+        if self.vel_y > 0 and self.rect.colliderect(paddle.rect):
+            self.bounce_paddle(paddle)
+
+        remaining = 1.0
+        while remaining > 0 and self.steps < self.MAX_STEPS:
+            dx = self.vel_x * remaining
+            dy = self.vel_y * remaining
+
+            # find the first thing in the way, bricks are looked up in the
+            # grid cells covered by the whole move
+            hit = self.sweep_walls(dx, dy, arena)
+            thing = None
+            x1 = math.floor(min(self.x, self.x + dx))
+            y1 = math.floor(min(self.y, self.y + dy))
+            x2 = math.ceil(max(self.x, self.x + dx)) + self.rect.width
+            y2 = math.ceil(max(self.y, self.y + dy)) + self.rect.height
+            path = pygame.Rect(x1, y1, x2 - x1, y2 - y1)
+            for target in field.collide(path) + [paddle]:
+                h = self.sweep(dx, dy, target.rect)
+                if h is not None and (hit is None or h[0] < hit[0]):
+                    hit, thing = h, target
+
+            if hit is None:
+                self.x += dx
+                self.y += dy
+                break
+
+            t, nx, ny = hit
+            self.x += dx * t
+            self.y += dy * t
+            remaining *= 1 - t
+            self.steps += 1
+            if thing is paddle:
+                self.rect.topleft = (round(self.x), round(self.y))
+                self.bounce_paddle(paddle)
+                continue
+            if nx:
+                self.vel_x = nx * abs(self.vel_x)
+            if ny:
+                self.vel_y = ny * abs(self.vel_y)
+            if thing is not None:
+                thing.kill()
+                broken.append(thing)
+
+        self.rect.topleft = (round(self.x), round(self.y))
+        if self.rect.bottom >= arena.bottom:
+            #kill the ball
+            self.dead = True
+            self.vel_x = 0
+            self.vel_y = 0
+            self.kill()
+        return broken
+
+
+
+#### class: BallSwarm #######################################################
+class BallSwarm():
+    """
+    Multi-ball mode: lots of balls kept in numpy arrays instead of sprites,
+    so walls, paddle and bricks are handled for all of them at once.  The
+    balls move in sub-steps of at most half a brick, so their leading edges
+    can't jump over a row or column of bricks, and a ball bounces off a
+    brick on the side it came in from.  The brick size is read when the
+    swarm is made.
+    """
+
+    RADIUS = 6
+    EDGE = 0.001    # the right and bottom edges are just inside the ball, as in a Rect
+
+    def __init__(self):
+        self.image = shapes.factory.circle(self.RADIUS, GRAY, colorkey=WHITE)
+        self.max_step = max(1, min(Block.WIDTH, Block.HEIGHT) // 2)
+        # most columns and rows of bricks a ball can touch at once
+        self.span = (2 * self.RADIUS // Block.WIDTH + 2, 2 * self.RADIUS // Block.HEIGHT + 2)
+        self.pos = None     # (n, 2) ball centers
+        self.vel = None     # (n, 2)
+
+    def __len__(self):
+        return 0 if self.pos is None else len(self.pos)
+
+    def empty(self):
+        self.pos = None
+        self.vel = None
+
+    def launch(self, pos, count, speed):
+        """Add count balls at pos, fanned out upwards."""
+        angles = numpy.radians(numpy.linspace(225, 315, count + 2)[1:-1])
+        pos = numpy.tile(numpy.array(pos, dtype=float), (count, 1))
+        vel = numpy.column_stack((numpy.cos(angles), numpy.sin(angles))) * speed
+        if self.pos is None:
+            self.pos, self.vel = pos, vel
         else:
-            self.rect.move_ip( self.vel_x, self.vel_y )
-            self.rect.clamp_ip(arena)
+            self.pos = numpy.concatenate((self.pos, pos))
+            self.vel = numpy.concatenate((self.vel, vel))
+
+    def update(self, arena, paddle, field):
+        """Move all the balls for one frame, returns the blocks they broke."""
+        broken = []
+        if not len(self):
+            return broken
+        speed = numpy.hypot(self.vel[:, 0], self.vel[:, 1]).max()
+        steps = max(1, math.ceil(speed / self.max_step))
+        for i in range(steps):
+            self.step(arena, paddle, field, 1 / steps, broken)
+
+        alive = self.pos[:, 1] + self.RADIUS < arena.bottom
+        if not alive.all():
+            self.pos = self.pos[alive]
+            self.vel = self.vel[alive]
+            if not len(self.pos):
+                self.empty()
+        return broken
+
+    def step(self, arena, paddle, field, dt, broken):
+        pos, vel, r = self.pos, self.vel, self.RADIUS
+        x, y = pos[:, 0], pos[:, 1]
+        vx, vy = vel[:, 0], vel[:, 1]
+        old_lead = self.leading_cells(pos, vel, field)
+        old_pos = pos.copy()
+        pos += vel * dt
+
+        # walls
+        hit = x < arena.left + r
+        x[hit] = 2 * (arena.left + r) - x[hit]
+        vx[hit] = numpy.abs(vx[hit])
+        hit = x > arena.right - r
+        x[hit] = 2 * (arena.right - r) - x[hit]
+        vx[hit] = -numpy.abs(vx[hit])
+        hit = y < arena.top + r
+        y[hit] = 2 * (arena.top + r) - y[hit]
+        vy[hit] = numpy.abs(vy[hit])
+
+        # paddle, same angles as Ball.bounce_paddle()
+        p = paddle.rect
+        hit = ((vy > 0) & (numpy.abs(x - p.centerx) < p.width / 2 + r)
+               & (y + r >= p.top) & (y - r < p.bottom))
+        if hit.any():
+            pct = numpy.clip((x[hit] - p.centerx) / (p.width / 2), -1, 1)
+            angle = numpy.radians(270 + 50 * pct)
+            speed = numpy.hypot(vx[hit], vy[hit])
+            vx[hit] = speed * numpy.cos(angle)
+            vy[hit] = speed * numpy.sin(angle)
+
+        # bricks: when a leading edge moves into a new row or column of
+        # cells, look along it in the field's occupancy grid
+        lead_col, lead_row = self.leading_cells(pos, vel, field)
+        first_col, first_row = self.first_cells(pos, field)
+        new_col, new_row = lead_col != old_lead[0], lead_row != old_lead[1]
+        hit_x = numpy.zeros(len(pos), bool)
+        hit_y = numpy.zeros(len(pos), bool)
+        cells = []
+        for k in range(self.span[1]):
+            row = first_row + k
+            cell = self.block_cells(field, lead_col, row)
+            cell[~new_col | (row > self.last_row(pos, field))] = -1
+            hit_x |= cell >= 0
+            cells.append(cell)
+        for k in range(self.span[0]):
+            col = first_col + k
+            cell = self.block_cells(field, col, lead_row)
+            cell[~new_row | (col > self.last_col(pos, field))] = -1
+            hit_y |= cell >= 0
+            cells.append(cell)
+        hit = hit_x | hit_y
+        if hit.any():
+            vx[hit_x] = -vx[hit_x]
+            vy[hit_y] = -vy[hit_y]
+            pos[hit] = old_pos[hit]
+            cells = numpy.concatenate(cells)
+            for i in numpy.unique(cells[cells >= 0]):
+                block = field.grid[i]
+                block.kill()
+                broken.append(block)
+
+    def leading_cells(self, pos, vel, field):
+        """Column of the balls' left or right edge and row of their top or
+        bottom edge, whichever they are moving towards."""
+        r = self.RADIUS
+        x = pos[:, 0] + numpy.where(vel[:, 0] > 0, r - self.EDGE, -r)
+        y = pos[:, 1] + numpy.where(vel[:, 1] > 0, r - self.EDGE, -r)
+        return ((x - field.rect.x) // Block.WIDTH, (y - field.rect.y) // Block.HEIGHT)
+
+    def first_cells(self, pos, field):
+        """Column and row of the balls' top left corners."""
+        r = self.RADIUS
+        return ((pos[:, 0] - r - field.rect.x) // Block.WIDTH,
+                (pos[:, 1] - r - field.rect.y) // Block.HEIGHT)
+
+    def last_col(self, pos, field):
+        return (pos[:, 0] + self.RADIUS - self.EDGE - field.rect.x) // Block.WIDTH
+
+    def last_row(self, pos, field):
+        return (pos[:, 1] + self.RADIUS - self.EDGE - field.rect.y) // Block.HEIGHT
+
+    def block_cells(self, field, cols, rows):
+        """Grid cells at cols, rows holding a block, -1 where there is none."""
+        inside = (cols >= 0) & (cols < field.cols) & (rows >= 0) & (rows < field.rows)
+        cell = numpy.where(inside, cols * field.rows + rows, 0).astype(int)
+        occupied = numpy.frombuffer(field.occupied, dtype=numpy.uint8)
+        return numpy.where(inside & (occupied[cell] != 0), cell, -1)
+
+    def draw(self, renderer):
+        if not len(self):
+            return
+        r = self.RADIUS
+        corners = (self.pos - r).astype(int).tolist()
+        renderer.blit_many('balls', self.image, corners)
 
 
 
@@ -133,6 +406,7 @@ class Block(pygame.sprite.Sprite):
     def __init__(self, arena, pos, color = GRAY):
         pygame.sprite.Sprite.__init__(self)
         self.color = color
+        self.field = None
         self.load_sprite()
         self.rect = self.image.get_rect()
         self.offset_x = arena.x
@@ -140,43 +414,201 @@ class Block(pygame.sprite.Sprite):
         self.set_grid_position(pos)
 
     def set_grid_position(self, pos):
+        self.grid_pos = pos
         self.rect.x = (pos[0] * self.WIDTH) + self.offset_x
         self.rect.y = (pos[1] * self.HEIGHT) + self.offset_y
 
     def load_sprite(self):
-        self.image = pygame.Surface((self.WIDTH, self.HEIGHT))
-        self.image.fill(self.color)
-        pygame.draw.rect(self.image, GRAY, (0, 0, self.WIDTH, self.HEIGHT), 1)
+        self.image = shapes.factory.shape((self.WIDTH, self.HEIGHT), (
+            ('rect', GRAY, (0, 0, self.WIDTH, self.HEIGHT), 1),
+        ), fill=self.color)
+
+    def kill(self):
+        if self.field is not None:
+            self.field.erase(self)
+            self.field = None
+        pygame.sprite.Sprite.kill(self)
 
     def generate_level(arena, level):
         pass
 
 
+#### class: BrickField ######################################################
+class BrickField():
+    """All the blocks of a level pre-rendered into one layer surface, so the
+    whole brick wall is drawn with a single blit.  Blocks never move; when one
+    is killed only its cell is erased from the layer.
+
+    The blocks are also kept in an occupancy grid of Block.WIDTH by
+    Block.HEIGHT cells, so finding the blocks a ball touches only looks at
+    the few cells under the ball, however many blocks there are."""
+
+    def __init__(self, arena):
+        self.rect = pygame.Rect(arena)
+        self.cols = self.rect.width // Block.WIDTH
+        self.rows = self.rect.height // Block.HEIGHT
+        self.grid = [None] * (self.cols * self.rows)    # column major
+        self.occupied = bytearray(self.cols * self.rows)  # same, 1 = block
+        self.count = 0
+        self.image = pygame.Surface(self.rect.size)
+        self.image.set_colorkey(BGCOLOR)
+        self.image.fill(BGCOLOR)
+        self.erased = []    # screen areas changed since the last draw
+        self.state_hash = None  # of the blocks, once track_hash() is called
+
+    def __len__(self):
+        return self.count
+
+    def track_hash(self):
+        """Keep a hash of the blocks up to date from now on, updated block
+        by block as they go, for --hash-log."""
+        self.state_hash = 0
+        for b in self.grid:
+            if b is not None:
+                self.state_hash += checksum.digest((b.grid_pos, b.color))
+
+    def load(self, level):
+        """Clear the layer and the grid and fill them from a levels.Level,
+        returns the new blocks.  Bricks outside the arena are left out."""
+        self.image.fill(BGCOLOR)
+        self.grid = [None] * (self.cols * self.rows)
+        self.occupied[:] = bytes(len(self.occupied))
+        arena = self.rect
+        blits = []
+        blocks = []
+        for col, row, color in level.bricks():
+            if col >= self.cols or row >= self.rows:
+                continue
+            b = Block(arena, (col, row), color)
+            b.field = self
+            self.grid[col * self.rows + row] = b
+            self.occupied[col * self.rows + row] = 1
+            blits.append((b.image, b.rect.move(-arena.x, -arena.y)))
+            blocks.append(b)
+        self.image.blits(blits, False)
+        self.count = len(blocks)
+        self.erased.append(self.rect)
+        if self.state_hash is not None:
+            self.track_hash()
+        return blocks
+
+    def erase(self, block):
+        col, row = block.grid_pos
+        self.grid[col * self.rows + row] = None
+        self.occupied[col * self.rows + row] = 0
+        self.count -= 1
+        if self.state_hash is not None:
+            self.state_hash -= checksum.digest((block.grid_pos, block.color))
+        self.image.fill(BGCOLOR, block.rect.move(-self.rect.x, -self.rect.y))
+        self.erased.append(block.rect)
+
+    def block_at(self, col, row):
+        if 0 <= col < self.cols and 0 <= row < self.rows:
+            return self.grid[col * self.rows + row]
+        return None
+
+    def collide(self, rect):
+        """The blocks overlapping rect, column by column."""
+        x1 = max((rect.left - self.rect.x) // Block.WIDTH, 0)
+        x2 = min((rect.right - 1 - self.rect.x) // Block.WIDTH, self.cols - 1)
+        y1 = max((rect.top - self.rect.y) // Block.HEIGHT, 0)
+        y2 = min((rect.bottom - 1 - self.rect.y) // Block.HEIGHT, self.rows - 1)
+        hits = []
+        for col in range(x1, x2 + 1):
+            for b in self.grid[col*self.rows + y1 : col*self.rows + y2 + 1]:
+                if b is not None:
+                    hits.append(b)
+        return hits
+
+    def draw(self, renderer):
+        renderer.blit('bricks', self.image, self.rect.topleft)
+        for rect in self.erased:
+            renderer.invalidate(rect)
+        self.erased = []
+
+
 def terminate():
     pygame.quit()
     sys.exit()
 
-def generate_level(arena, level):
-        sprites = []
-        for i in range(1, 15):
-            sprites.append( Block(arena, (i, 4), RED) )
-            sprites.append( Block(arena, (i, 5), ORANGE) )
-            sprites.append( Block(arena, (i, 6), YELLOW) )
-            sprites.append( Block(arena, (i, 7), GREEN) )
-            sprites.append( Block(arena, (i, 8), BLUE) )
-            sprites.append( Block(arena, (i, 9), VIOLET) )
-        return sprites
-        #return []
+def ball_speed(level):
+    """The ball gets faster every level, up to a point."""
+    return min(BALL_SPEED + BALL_SPEED_STEP * (level - 1), MAX_BALL_SPEED)
+
+def generate_level(field, level):
+    """Fill the brick field with level number level, returns the blocks."""
+    if OPTIONS.bricks:
+        return field.load(brick_board(field.cols, field.rows, OPTIONS.bricks))
+    return field.load(LEVELS.number(level))
+
+def brick_board(cols, rows, count):
+    """A level of count bricks filling the field row by row from the top,
+    for stress tests."""
+    count = min(count, cols * rows)
+    palette = list(BENCHMARK_COLORS)
+    cells = bytearray(cols * rows)
+    for i in range(count):
+        cells[i] = 1 + (i // cols) % len(palette)
+    return levels.Level(cols, rows, palette, cells)
+
+def run_benchmark(arena, paddle, field, renderer):
+    """Time frames of multi-ball play against the number of balls, with
+    sprite balls and with a BallSwarm, and print the averages."""
+    print(f"{'balls':>6} {'sprites ms':>11} {'arrays ms':>10}")
+    for count in BENCHMARK_BALLS:
+        times = []
+        for swarm in (None, BallSwarm()):
+            balls = pygame.sprite.RenderPlain()
+            generate_level(field, 1)
+            start = None
+            for frame in range(BENCHMARK_WARMUP + BENCHMARK_FRAMES):
+                if frame == BENCHMARK_WARMUP:
+                    start = time.perf_counter()
+                if not len(field):
+                    generate_level(field, 1)
+
+                # keep the number of balls up
+                if swarm is None:
+                    for i in range(count - len(balls)):
+                        ball = Ball(paddle, ball_speed(1))
+                        ball.paddle = None
+                        ball.set_velocity(225 + 90 * (i + 1) / (count + 1))
+                        balls.add(ball)
+                    for ball in balls.sprites():
+                        ball.update(arena, paddle, field)
+                    renderer.draw(balls)
+                else:
+                    if len(swarm) < count:
+                        swarm.launch((paddle.rect.centerx, paddle.rect.top - 8),
+                                     count - len(swarm), ball_speed(1))
+                    swarm.update(arena, paddle, field)
+                    swarm.draw(renderer)
+
+                field.draw(renderer)
+                renderer.draw(pygame.sprite.GroupSingle(paddle))
+                renderer.update()
+                pygame.event.pump()
+            times.append((time.perf_counter() - start) * 1000 / BENCHMARK_FRAMES)
+        print(f"{count:6d} {times[0]:11.2f} {times[1]:10.2f}")
 
 
 
 #### main ###############################################
+parser = options.create_parser('Breakout')
+parser.add_argument('--balls', type=int, default=1,
+                    help='multi-ball mode, launch this many balls at once (needs numpy)')
+parser.add_argument('--benchmark', action='store_true',
+                    help='print frame times against the number of balls and exit')
+parser.add_argument('--bricks', type=int, default=0, metavar='N',
+                    help='play on a board of N small bricks instead of the levels, a stress test')
+OPTIONS = options.parse(parser)
+if (OPTIONS.balls > 1 or OPTIONS.benchmark) and numpy is None:
+    parser.error('multi-ball mode needs numpy')
 pygame.init()
-FPSCLOCK = pygame.time.Clock()
 DISPLAYSURF = pygame.display.set_mode((MAX_X, MAX_Y))
-BASICFONT = pygame.font.SysFont('courier', 25, True)
+BASICFONT = fonts.registry.get('courier', 25, True)
 pygame.display.set_caption('pyGame Template')
-random.seed()
+random.seed(OPTIONS.seed)
 pygame.mouse.set_visible(False)
 
 score = 0
@@ -186,12 +618,15 @@ highscore = 0
 
 #create sprites and groups
 arena_rect = pygame.Rect(20, 20, 16 * Block.WIDTH, MAX_Y)
+if OPTIONS.bricks:
+    Block.WIDTH, Block.HEIGHT = BENCHMARK_BRICK
 paddle = pygame.sprite.GroupSingle( Paddle(arena_rect) )
-balls = pygame.sprite.RenderPlain( Ball(paddle.sprite) )
+balls = pygame.sprite.RenderPlain( Ball(paddle.sprite, ball_speed(level)) )
 blocks = pygame.sprite.RenderPlain()
+field = BrickField(arena_rect)
+swarm = BallSwarm()     # the balls of multi-ball mode
 
-l = generate_level(arena_rect, level)
-blocks.add(l)
+blocks.add( generate_level(field, level) )
 
 right_margin_center = (MAX_X - arena_rect.right)//2 + arena_rect.right
 
@@ -203,135 +638,189 @@ level_title_img = BASICFONT.render("LEVEL", True, ORANGE, BGCOLOR)
 level_title_x = right_margin_center - level_title_img.get_width()//2
 highscore_title_img = BASICFONT.render("HIGH SCORE", True, ORANGE, BGCOLOR)
 highscore_title_x = right_margin_center - highscore_title_img.get_width()//2
+DIGITS = text.GlyphAtlas(BASICFONT, True, WHITE, BGCOLOR)
+DEBUGFONT = fonts.registry.get('courier', 12)
+
+renderer = render.Renderer(DISPLAYSURF, BGCOLOR, OPTIONS.dirty, enabled=not OPTIONS.no_draw)
+arena_img = pygame.Surface(arena_rect.size)
+arena_img.fill(BGCOLOR)
+arena_img.set_colorkey(BGCOLOR)
+pygame.draw.rect(arena_img, RED, arena_img.get_rect(), 1)
+
+if OPTIONS.benchmark:
+    run_benchmark(arena_rect, paddle.sprite, field, renderer)
+    terminate()
+
+timestep = loop.FixedStep(FPS, realtime=not OPTIONS.headless)
+driver = headless.Driver(OPTIONS, mouse=True, timestep=timestep)
+profile_overlay = overlay.Overlay(FPS, pos=(10, MAX_Y - 130))
+mouse_x = paddle.sprite.rect.centerx
+
+def save_state():
+    """Everything the game needs to carry on, for replay keyframes."""
+    return {
+        'random': random.getstate(),
+        'game': (score, lives, level, highscore, mouse_x),
+        'paddle': paddle.sprite.rect.topleft,
+        'balls': [ (b.x, b.y, b.rect.topleft, b.vel_x, b.vel_y, b.speed,
+                    b.paddle is not None, b.paddle_pos) for b in balls.sprites() ],
+        'swarm': (swarm.pos.tolist(), swarm.vel.tolist()) if swarm else None,
+        'bricks': [ (b.grid_pos, b.color) for b in blocks.sprites() ],
+    }
+
+def load_state(state):
+    global score, lives, level, highscore, mouse_x, balls
+    random.setstate(state['random'])
+    score, lives, level, highscore, mouse_x = state['game']
+    paddle.sprite.rect.topleft = state['paddle']
+
+    balls = pygame.sprite.RenderPlain()
+    for x, y, topleft, vel_x, vel_y, speed, stuck, paddle_pos in state['balls']:
+        b = Ball(paddle.sprite, speed)
+        b.x, b.y = x, y
+        b.rect.topleft = topleft
+        b.vel_x, b.vel_y = vel_x, vel_y
+        b.paddle = paddle.sprite if stuck else None
+        b.paddle_pos = paddle_pos
+        balls.add(b)
+
+    swarm.empty()
+    if state['swarm'] is not None:
+        swarm.pos = numpy.array(state['swarm'][0], dtype=float)
+        swarm.vel = numpy.array(state['swarm'][1], dtype=float)
+
+    # the bricks left, as a level
+    palette = sorted({ color for pos, color in state['bricks'] })
+    cells = bytearray(field.cols * field.rows)
+    for (col, row), color in state['bricks']:
+        cells[row * field.cols + col] = palette.index(color) + 1
+    blocks.empty()
+    blocks.add( field.load(levels.Level(field.cols, field.rows, palette, cells)) )
+
+def hash_state(frame):
+    """Log a hash of the state at the end of frame, for --hash-log."""
+    hashes.entities('paddle', paddle, lambda p: p.rect.topleft)
+    hashes.entities('balls', balls, lambda b: (b.x, b.y, b.rect.topleft, b.vel_x, b.vel_y,
+                                               b.speed, b.paddle is not None, b.paddle_pos))
+    hashes.value('swarm', swarm.pos.tobytes() + swarm.vel.tobytes() if swarm else None)
+    hashes.total('bricks', field.state_hash)
+    hashes.value('game', (score, lives, level, highscore, mouse_x))
+    hashes.value('random', checksum.random_state())
+    hashes.end_frame(frame)
+
+driver.set_state_handlers(save_state, load_state)
+hashes = None
+if OPTIONS.hash_log:
+    hashes = checksum.FrameHash(OPTIONS.hash_log)
+    field.track_hash()
 
 while True:
 
     #event handling
-    for event in pygame.event.get():
+    profiler.frames.begin()
+    driver.frame()
+    for event in driver.events():
+        profile_overlay.handle_event(event)
         if event.type == QUIT:
             terminate()
 
+        elif event.type == MOUSEMOTION:
+            mouse_x = event.pos[0]
+
         elif event.type == MOUSEBUTTONUP:
             if event.button == 1:
-                for ball in balls:
-                    if ball.paddle:
+                for ball in balls.sprites():
+                    if ball.paddle and OPTIONS.balls > 1:
+                        swarm.launch(ball.rect.center, OPTIONS.balls, ball.speed)
+                        ball.kill()
+                    elif ball.paddle:
                         ball.unstick_from_paddle()
 
         elif event.type == KEYUP:
             if event.key == K_ESCAPE:
                 terminate()
-
-
-    #update game state
-    paddle.update(arena_rect)
-    balls.update(arena_rect)
-    blocks.update()
-
-    # detect collisions with paddle
-    for ball in pygame.sprite.spritecollide(paddle.sprite, balls, 0):
-        ball.bounce_paddle(paddle.sprite)
-        #ball.stick_to_paddle(paddle.sprite)
-
-
-    # detect collisions with walls
-    for ball in balls.sprites():
-        ball.bounce_walls(arena_rect)
-
-
-    # detect collisions with blocks
-    for ball in balls.sprites():
-        blocks_collided = pygame.sprite.spritecollide(ball, blocks, False)
-
-        if blocks_collided:
-            orig_rect = ball.rect
-            left = right = up = down = 0
-            for b in blocks_collided:
-                # block = []  ball = ()
-
-                # ([)]
-                if orig_rect.left < b.rect.left < orig_rect.right < b.rect.right:
-                    ball.rect.right = b.rect.left
-                    left = -1
-
-                # [(])
-                if b.rect.left < orig_rect.left < b.rect.right < orig_rect.right:
-                    ball.rect.left = b.rect.right
-                    right = 1
-
-                # top ([)] bottom
-                if orig_rect.top < b.rect.top < orig_rect.bottom < b.rect.bottom:
-                    ball.rect.bottom = b.rect.top
-                    up = -1
-
-                # top [(]) bottom
-                if b.rect.top < orig_rect.top < b.rect.bottom < orig_rect.bottom:
-                    ball.rect.top = b.rect.bottom
-                    down = 1
-
-                b.kill()
-                score += 10
-
-            #print left, up, right, down
-            if (left + right ) != 0:
-                ball.vel_x = (left + right)*abs(ball.vel_x)
-            if (up + down) != 0:
-                ball.vel_y = (up + down)*abs(ball.vel_y)
-
-
-    if not balls:
-        if lives == 0:
-            if score > highscore:
-                highscore = score
-            score = 0
-            lives = 2
-            level = 1
-            l = generate_level(arena_rect, level)
-            blocks.add(l)
-            balls = pygame.sprite.RenderPlain( Ball(paddle.sprite) )
-
-        else:
-            lives -= 1
-            balls.add( Ball(paddle.sprite) )
-
-    if not blocks:
-        level += 1
-        score += level*100
-        balls.empty()
-        balls.add( Ball(paddle.sprite) )
-        blocks.empty()
-        blocks.add( generate_level(arena_rect, level) )
-
-
+    profiler.frames.mark('events')
+
+
+    #update game state in fixed steps, the balls do their own collision detection
+    for step in timestep.steps():
+        timestep.snapshot(paddle, balls)
+        paddle.update(arena_rect, mouse_x)
+        blocks.update()
+        profiler.frames.mark('update')
+        for ball in balls.sprites():
+            score += 10 * len(ball.update(arena_rect, paddle.sprite, field))
+        score += 10 * len(swarm.update(arena_rect, paddle.sprite, field))
+        profiler.frames.mark('collide')
+
+
+        if not balls and not swarm:
+            if lives == 0:
+                if score > highscore:
+                    highscore = score
+                score = 0
+                lives = 2
+                level = 1
+                blocks.empty()
+                blocks.add( generate_level(field, level) )
+                balls = pygame.sprite.RenderPlain( Ball(paddle.sprite, ball_speed(level)) )
+
+            else:
+                lives -= 1
+                balls.add( Ball(paddle.sprite, ball_speed(level)) )
+
+        if not blocks:
+            level += 1
+            score += level*100
+            balls.empty()
+            swarm.empty()
+            balls.add( Ball(paddle.sprite, ball_speed(level)) )
+            blocks.empty()
+            blocks.add( generate_level(field, level) )
+        profiler.frames.mark('update')
+
+    if hashes is not None:
+        hash_state(driver.frames)
+        profiler.frames.mark('update')
 
     # draw frame
-    DISPLAYSURF.fill(BGCOLOR)
-    paddle.draw(DISPLAYSURF)
-    balls.draw(DISPLAYSURF)
-    blocks.draw(DISPLAYSURF)
-
-    level_img = BASICFONT.render("%d"%(level), True, WHITE, BGCOLOR)
-    x = right_margin_center - level_img.get_width()//2
-    DISPLAYSURF.blit(level_title_img, (level_title_x, 200))
-    DISPLAYSURF.blit(level_img, (x, 230))
-
-    score_img = BASICFONT.render("%d"%(score), True, WHITE, BGCOLOR)
-    x = right_margin_center - score_img.get_width()//2
-    DISPLAYSURF.blit(score_title_img, (score_title_x, 300))
-    DISPLAYSURF.blit(score_img, (x, 330))
-
-    lives_img = BASICFONT.render("%d"%(lives), True, WHITE, BGCOLOR)
-    x = right_margin_center - lives_img.get_width()//2
-    DISPLAYSURF.blit(lives_title_img, (lives_title_x, 400))
-    DISPLAYSURF.blit(lives_img, (x, 430))
-
-    highscore_img = BASICFONT.render("%d"%(highscore), True, WHITE, BGCOLOR)
-    x = right_margin_center - highscore_img.get_width()//2
-    DISPLAYSURF.blit(highscore_title_img, (highscore_title_x, 500))
-    DISPLAYSURF.blit(highscore_img, (x, 530))
-
-    pygame.draw.rect(DISPLAYSURF, RED, arena_rect, 1)
-    #pygame.display.update()
-    pygame.display.flip()
-    FPSCLOCK.tick(FPS)
+    timestep.draw(renderer, paddle)
+    timestep.draw(renderer, balls)
+    swarm.draw(renderer)
+    field.draw(renderer)
+    profiler.frames.mark('draw')
+
+    level_msg = "%d"%(level)
+    x = right_margin_center - DIGITS.width(level_msg)//2
+    renderer.blit('level title', level_title_img, (level_title_x, 200))
+    renderer.glyphs('level', DIGITS, level_msg, (x, 230))
+
+    score_msg = "%d"%(score)
+    x = right_margin_center - DIGITS.width(score_msg)//2
+    renderer.blit('score title', score_title_img, (score_title_x, 300))
+    renderer.glyphs('score', DIGITS, score_msg, (x, 330))
+
+    lives_msg = "%d"%(lives)
+    x = right_margin_center - DIGITS.width(lives_msg)//2
+    renderer.blit('lives title', lives_title_img, (lives_title_x, 400))
+    renderer.glyphs('lives', DIGITS, lives_msg, (x, 430))
+
+    highscore_msg = "%d"%(highscore)
+    x = right_margin_center - DIGITS.width(highscore_msg)//2
+    renderer.blit('highscore title', highscore_title_img, (highscore_title_x, 500))
+    renderer.glyphs('highscore', DIGITS, highscore_msg, (x, 530))
+
+    renderer.blit('arena', arena_img, arena_rect.topleft)
+
+    if OPTIONS.debug:
+        debug_img = DEBUGFONT.render(renderer.stats_text(), True, WHITE, BGCOLOR)
+        renderer.blit('debug', debug_img, (arena_rect.right + 10, MAX_Y-20))
+        loop_img = DEBUGFONT.render(timestep.stats_text(), True, WHITE, BGCOLOR)
+        renderer.blit('loop', loop_img, (arena_rect.right + 10, MAX_Y-36))
+
+    profile_overlay.draw(renderer)
+    profiler.frames.mark('hud')
+    renderer.update()
+    profiler.frames.end('flip')
 
 terminate()
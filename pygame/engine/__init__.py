@@ -0,0 +1,6 @@
+"""
+Shared helpers used by the pygame arcade games.  Each module is
+independent; import only the pieces a game needs, e.g.
+
+    from engine import assets
+"""
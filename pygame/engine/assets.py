@@ -0,0 +1,145 @@
+"""
+Process-wide asset cache.  Image files are decoded and sprite sheets are
+sliced only once, then the same Surface (or tuple of frames) is handed out
+to every sprite that asks for it.
+
+    from engine import assets
+    frames = assets.cache.load_frames('assets/asteroid2.png', 64, 5, 6)
+"""
+
+from collections import OrderedDict
+import pygame
+
+DEFAULT_BUDGET = 64 * 1024 * 1024   # bytes of decoded pixel data
+
+
+def surface_bytes(surf):
+    """Approximate memory used by the pixels of a Surface."""
+    return surf.get_width() * surf.get_height() * surf.get_bytesize()
+
+
+def slice_sheet(sheet, size, columns, rows):
+    """Cut a sprite sheet into square frames of the given size, left to
+    right then top to bottom.  Frames are subsurfaces sharing the sheet's
+    pixels."""
+    frames = []
+    for y in range(0, rows):
+        for x in range(0, columns):
+            frames.append( sheet.subsurface( (x*size, y*size, size, size) ) )
+    return tuple(frames)
+
+
+#---- class: AssetCache ---------------------------------------------------
+class AssetCache():
+    """
+    LRU cache of decoded images and sliced animations.  When the total size
+    of the cached pixel data goes over the budget the least recently used
+    entries are dropped.  Sprites still holding an evicted Surface keep
+    working, the cache simply forgets about it and will decode it again the
+    next time it is asked for.
+
+    Returned surfaces are shared, treat them as read-only.
+    """
+
+    def __init__(self, budget=DEFAULT_BUDGET):
+        self.budget = budget
+        self.entries = OrderedDict()   # key -> (value, size in bytes)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def load_image(self, filename, alpha=True):
+        """Return the decoded image, converted to the display format if a
+        display has been set up."""
+        key = ('image', filename, alpha)
+        img = self.get(key)
+        if img is None:
+            img = self.decode(filename, alpha)
+            self.put(key, img, surface_bytes(img))
+        return img
+
+    def load_frames(self, filename, size, columns, rows, alpha=True):
+        """Return a tuple of animation frames sliced from a sprite sheet."""
+        key = ('frames', filename, size, columns, rows, alpha)
+        frames = self.get(key)
+        if frames is None:
+            # a sheet already decoded as a plain image (e.g. by the
+            # preloader) is moved over to the frames entry
+            sheet = self.take(('image', filename, alpha))
+            if sheet is None:
+                sheet = self.decode(filename, alpha)
+            frames = slice_sheet(sheet, size, columns, rows)
+            self.put(key, frames, surface_bytes(sheet))
+        return frames
+
+    def store_image(self, filename, img, alpha=True):
+        """Add an image decoded elsewhere, it must already be converted to
+        the display format."""
+        self.put(('image', filename, alpha), img, surface_bytes(img))
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    @staticmethod
+    def decode(filename, alpha=True):
+        img = pygame.image.load(filename)
+        if pygame.display.get_surface() is not None:
+            img = img.convert_alpha() if alpha else img.convert()
+        return img
+
+    def get(self, key):
+        try:
+            value, size = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def take(self, key):
+        """Remove an entry and return its value, or None."""
+        try:
+            value, size = self.entries.pop(key)
+        except KeyError:
+            return None
+        self.bytes -= size
+        return value
+
+    def put(self, key, value, size):
+        if key in self.entries:
+            self.bytes -= self.entries.pop(key)[1]
+        self.entries[key] = (value, size)
+        self.bytes += size
+        self.evict()
+
+    def evict(self):
+        # never drop the entry that was just added, even if it alone is
+        # bigger than the budget
+        while self.bytes > self.budget and len(self.entries) > 1:
+            key, (value, size) = self.entries.popitem(last=False)
+            self.bytes -= size
+            self.evictions += 1
+
+    def set_budget(self, budget):
+        self.budget = budget
+        self.evict()
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+    def stats(self):
+        return {
+            'entries': len(self.entries),
+            'bytes': self.bytes,
+            'budget': self.budget,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+# the one cache shared by everything in the process
+cache = AssetCache()
@@ -0,0 +1,290 @@
+"""
+Texture atlas support.  A sprite manifest (assets/sprites.json) names every
+sprite and animation and says where its frames come from:
+
+    "asteroid":   {"file": "asteroid2.png", "size": 64, "columns": 5, "rows": 6},
+    "background": {"file": "space_background.jpg", "alpha": false}
+
+Packing the manifest copies all the frames into one or a few atlas pages
+plus a JSON index of named regions.  Run from the pygame directory:
+
+    python -m engine.atlas
+
+At runtime the games ask for sprites by name through a SpriteSet, which
+reads from the atlas when it has been built and is up to date, and falls
+back to slicing the loose files listed in the manifest otherwise.
+"""
+
+import argparse, hashlib, json, os
+import pygame
+from engine import assets
+
+MANIFEST = 'assets/sprites.json'
+INDEX = 'assets/atlas.json'
+MAX_PAGE_SIZE = 1024
+PADDING = 1
+
+
+def read_manifest(filename):
+    """The manifest's entries."""
+    with open(filename) as f:
+        return json.load(f)
+
+
+def source_files(manifest, entries):
+    """The manifest and the image files it names."""
+    folder = os.path.dirname(manifest)
+    names = sorted({ entry['file'] for entry in entries.values() })
+    return [manifest] + [ os.path.join(folder, name) for name in names ]
+
+
+def source_stamps(manifest, entries):
+    """{file: [size, modification time]} of the manifest and its images.
+    Stored in the index when packing; at runtime a stat of each file tells
+    whether the atlas is still up to date without reading any of them."""
+    stamps = {}
+    for filename in source_files(manifest, entries):
+        st = os.stat(filename)
+        stamps[os.path.basename(filename)] = [st.st_size, st.st_mtime_ns]
+    return stamps
+
+
+def content_digest(manifest, entries):
+    """Digest of the manifest and of every image it names."""
+    digest = hashlib.sha1()
+    for filename in source_files(manifest, entries):
+        with open(filename, 'rb') as f:
+            digest.update(os.path.basename(filename).encode() + b'\0' + f.read())
+    return digest.hexdigest()
+
+
+def source_rects(entry):
+    """Frame rectangles of a manifest entry within its source image.  Entries
+    without a frame size are a single frame covering the whole image."""
+    if 'size' not in entry:
+        return None
+    size = entry['size']
+    return [ (x*size, y*size, size, size)
+             for y in range(entry['rows']) for x in range(entry['columns']) ]
+
+
+#---- class: ShelfPacker --------------------------------------------------
+class ShelfPacker():
+    """
+    Simple shelf packer.  Rectangles are placed left to right in rows
+    (shelves); a new shelf starts when a row is full and a new page when a
+    page is full.  Feed it the tallest rectangles first for best results.
+    """
+
+    def __init__(self, max_size=MAX_PAGE_SIZE, padding=PADDING):
+        self.max_size = max_size
+        self.padding = padding
+        self.pages = []    # [width, height] used so far
+        self.new_page()
+
+    def new_page(self):
+        self.pages.append([0, 0])
+        self.x = 0
+        self.y = 0
+        self.shelf_h = 0
+
+    def place(self, w, h):
+        """Return (page, x, y) for a w x h rectangle."""
+        if w > self.max_size or h > self.max_size:
+            raise ValueError(f"{w}x{h} does not fit in a {self.max_size} atlas page")
+        if self.x + w > self.max_size:
+            self.x = 0
+            self.y += self.shelf_h + self.padding
+            self.shelf_h = 0
+        if self.y + h > self.max_size:
+            self.new_page()
+
+        page = len(self.pages) - 1
+        pos = (page, self.x, self.y)
+        self.x += w + self.padding
+        self.shelf_h = max(self.shelf_h, h)
+        used = self.pages[page]
+        used[0] = max(used[0], self.x - self.padding)
+        used[1] = max(used[1], self.y + self.shelf_h)
+        return pos
+
+
+def pack(manifest=MANIFEST, index=INDEX, max_size=MAX_PAGE_SIZE, padding=PADDING):
+    """Pack every frame named in the manifest into atlas pages next to the
+    index file.  Sprites with and without alpha go on separate pages."""
+    entries = read_manifest(manifest)
+    folder = os.path.dirname(manifest)
+    out_dir = os.path.dirname(index)
+    prefix = os.path.splitext(os.path.basename(index))[0]
+
+    # (name, frame number, source surface, rect in source)
+    frames = {True: [], False: []}
+    for name, entry in entries.items():
+        img = pygame.image.load(os.path.join(folder, entry['file']))
+        rects = source_rects(entry) or [img.get_rect()]
+        for n, rect in enumerate(rects):
+            frames[entry.get('alpha', True)].append((name, n, img, pygame.Rect(rect)))
+
+    pages = []
+    regions = {}
+    animations = {name: [] for name in entries}
+    for alpha in (True, False):
+        if not frames[alpha]:
+            continue
+        packer = ShelfPacker(max_size, padding)
+        placed = []
+        for name, n, img, rect in sorted(frames[alpha], key=lambda f: -f[3].h):
+            placed.append((name, n, img, rect, packer.place(rect.w, rect.h)))
+
+        first = len(pages)
+        surfaces = []
+        for w, h in packer.pages:
+            flags = pygame.SRCALPHA if alpha else 0
+            surfaces.append(pygame.Surface((w, h), flags, 32 if alpha else 24))
+            surfaces[-1].fill((0, 0, 0, 0))
+            pages.append({'file': f"{prefix}{len(pages)}.png", 'alpha': alpha})
+
+        for name, n, img, rect, (page, x, y) in placed:
+            surfaces[page].blit(img, (x, y), rect)
+            region = f"{name}/{n}"
+            regions[region] = [first + page, x, y, rect.w, rect.h]
+            animations[name].append((n, region))
+
+        for page, surf in enumerate(surfaces):
+            pygame.image.save(surf, os.path.join(out_dir, pages[first + page]['file']))
+
+    data = {
+        'manifest': content_digest(manifest, entries),
+        'sources': source_stamps(manifest, entries),
+        'pages': pages,
+        'regions': regions,
+        'animations': {name: [r for n, r in sorted(frames)]
+                       for name, frames in animations.items()},
+    }
+    with open(index, 'w') as f:
+        json.dump(data, f, indent=1, sort_keys=True)
+    return data
+
+
+#---- class: Atlas --------------------------------------------------------
+class Atlas():
+    """
+    Runtime view of a packed atlas.  Each page is loaded once through the
+    shared asset cache, regions are handed out as subsurfaces of the page.
+    """
+
+    def __init__(self, index=INDEX):
+        with open(index) as f:
+            self.index = json.load(f)
+        self.folder = os.path.dirname(index)
+        self.regions = {}
+
+    def page(self, n):
+        info = self.index['pages'][n]
+        return assets.cache.load_image(os.path.join(self.folder, info['file']),
+                                       info['alpha'])
+
+    def region(self, name):
+        img = self.regions.get(name)
+        if img is None:
+            page, x, y, w, h = self.index['regions'][name]
+            img = self.regions[name] = self.page(page).subsurface((x, y, w, h))
+        return img
+
+    def frames(self, name):
+        return tuple(self.region(r) for r in self.index['animations'][name])
+
+    def sources(self, name):
+        pages = []
+        for region in self.index['animations'][name]:
+            n = self.index['regions'][region][0]
+            info = self.index['pages'][n]
+            source = (os.path.join(self.folder, info['file']), info['alpha'])
+            if source not in pages:
+                pages.append(source)
+        return pages
+
+    def __contains__(self, name):
+        return name in self.index['animations']
+
+
+#---- class: SpriteSet ----------------------------------------------------
+class SpriteSet():
+    """
+    Sprites and animations by name.  Uses the atlas when the manifest and
+    its images have the size and modification time they had when it was
+    packed, otherwise loads the loose files.  Nothing is read from disk
+    until the first sprite is asked for, so a SpriteSet can be created
+    before the display is set up.
+    """
+
+    def __init__(self, manifest=MANIFEST, index=INDEX):
+        self.manifest_file = manifest
+        self.index_file = index
+        self.entries = None
+        self.atlas = None
+        self.animations = {}
+
+    def load(self):
+        self.entries = read_manifest(self.manifest_file)
+        if os.path.exists(self.index_file):
+            atlas = Atlas(self.index_file)
+            if atlas.index.get('sources') == source_stamps(self.manifest_file, self.entries):
+                self.atlas = atlas
+
+    def animation(self, name):
+        """Return the tuple of frames for the named sprite."""
+        frames = self.animations.get(name)
+        if frames is None:
+            if self.entries is None:
+                self.load()
+            if self.atlas is not None:
+                frames = self.atlas.frames(name)
+            else:
+                frames = self.load_loose(name)
+            self.animations[name] = frames
+        return frames
+
+    def image(self, name):
+        """Return the first (or only) frame of the named sprite."""
+        return self.animation(name)[0]
+
+    def sources(self, name):
+        """List the (filename, alpha) image files the named sprite is loaded
+        from, for the preloader."""
+        if self.entries is None:
+            self.load()
+        if self.atlas is not None:
+            return self.atlas.sources(name)
+        entry = self.entries[name]
+        filename = os.path.join(os.path.dirname(self.manifest_file), entry['file'])
+        return [ (filename, entry.get('alpha', True)) ]
+
+    def load_loose(self, name):
+        entry = self.entries[name]
+        filename = os.path.join(os.path.dirname(self.manifest_file), entry['file'])
+        alpha = entry.get('alpha', True)
+        if 'size' in entry:
+            return assets.cache.load_frames(filename, entry['size'],
+                                            entry['columns'], entry['rows'], alpha)
+        return (assets.cache.load_image(filename, alpha),)
+
+
+# sprites of the shared manifest, relative to the pygame directory
+sprites = SpriteSet()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pack the sprite manifest into atlas pages.')
+    parser.add_argument('manifest', nargs='?', default=MANIFEST)
+    parser.add_argument('-o', '--index', default=INDEX, help='index file to write')
+    parser.add_argument('--max-size', type=int, default=MAX_PAGE_SIZE)
+    parser.add_argument('--padding', type=int, default=PADDING)
+    args = parser.parse_args()
+
+    data = pack(args.manifest, args.index, args.max_size, args.padding)
+    print(f"packed {len(data['regions'])} frames into {len(data['pages'])} page(s): {args.index}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""
+Per-frame state hashes, to prove that two runs of a game (a recording and
+its replay, two machines) went exactly the same way.  Once a frame the
+game hands over its entities and anything else its state depends on:
+
+    hashes = checksum.FrameHash('run.hashes')
+    ...
+    hashes.entities('asteroids', asteroids.sprites(), GameObject.get_state)
+    hashes.value('game', (score, level, lives))
+    hashes.value('random', checksum.random_state())
+    hashes.end_frame(frame)
+
+and a line with the frame's hash, and the hash of each part, goes to the
+log.  The hash of a group of entities is the sum of its entities' hashes,
+so it doesn't depend on their order.  entities() is not incremental: it
+asks every entity for its state every frame, a full scan of the group;
+what it saves is the digest of the entities whose state didn't change,
+which are kept from the last frame.  State that changes a little at a
+time, like breakout's bricks, can be hashed incrementally by the game
+itself, adding and subtracting digest()s as things come and go, and
+handed over with total().
+
+States are hashed through their repr(), so they have to print the same
+in every process: tuples of numbers, None and strings are fine, objects
+showing their address are not (nor hash(), which is salted for strings
+and address based for None).  bytes are hashed as they are.  To find where
+two logs part:
+
+    python -m engine.checksum run1.hashes run2.hashes
+"""
+
+import argparse, array, atexit, hashlib, random, sys
+
+MASK = (1 << 64) - 1
+
+
+def digest(state):
+    """64 bit hash of a state."""
+    if not isinstance(state, bytes):
+        state = repr(state).encode()
+    return int.from_bytes(hashlib.blake2b(state, digest_size=8).digest(), 'little')
+
+
+def random_state(rng=random):
+    """The state of a random.Random as bytes, faster to hash than its repr."""
+    version, internal, gauss = rng.getstate()
+    return array.array('Q', internal).tobytes() + repr(gauss).encode()
+
+
+#---- class: FrameHash ----------------------------------------------------
+class FrameHash():
+
+    def __init__(self, filename):
+        self.log = open(filename, 'w')
+        atexit.register(self.log.close)
+        self.groups = {}    # name -> {entity: (state, hash)}
+        self.totals = {}    # name -> hash of the group
+        self.parts = {}     # name -> hash, this frame
+        self.rehashed = 0   # entities hashed again, for profiling
+
+    def entities(self, name, entities, state_of):
+        """Hash a group of entities, state_of(entity) returns its state.
+        Every entity is asked, and its state compared with the one of the
+        last frame to reuse its digest, so the state has to be a copy, not
+        a list the entity goes on changing."""
+        old = self.groups.get(name, {})
+        new = {}
+        total = self.totals.get(name, 0)
+        for e in entities:
+            state = state_of(e)
+            previous = old.pop(e, None)
+            if previous is not None and previous[0] == state:
+                new[e] = previous
+                continue
+            h = digest(state)
+            total += h - (previous[1] if previous is not None else 0)
+            new[e] = (state, h)
+            self.rehashed += 1
+        for state, h in old.values():     # the entities that went away
+            total -= h
+        total &= MASK
+        self.groups[name] = new
+        self.totals[name] = total
+        self.parts[name] = total
+
+    def value(self, name, state):
+        """Hash a state that is rehashed whole every frame."""
+        self.parts[name] = digest(state)
+
+    def total(self, name, h):
+        """A hash kept up to date by the game itself."""
+        self.parts[name] = h & MASK
+
+    def end_frame(self, frame):
+        """Log the frame's hash and its parts, returns the frame's hash."""
+        parts = self.parts
+        frame_hash = digest(tuple(parts.values()))
+        self.log.write(f"{frame} {frame_hash:016x} "
+                       + ' '.join(f"{name}={h:016x}" for name, h in parts.items()) + '\n')
+        self.parts = {}
+        return frame_hash
+
+
+def read_log(filename):
+    """{frame: (hash, {part: hash})} of a hash log."""
+    frames = {}
+    with open(filename) as f:
+        for line in f:
+            fields = line.split()
+            if not fields or fields[0].startswith('#'):
+                continue
+            frames[int(fields[0])] = (fields[1], dict(p.split('=', 1) for p in fields[2:]))
+    return frames
+
+
+def first_difference(a, b):
+    """The first frame in both logs whose hashes differ, and the parts that
+    differ, or None."""
+    for frame in sorted(a.keys() & b.keys()):
+        if a[frame][0] != b[frame][0]:
+            pa, pb = a[frame][1], b[frame][1]
+            parts = [ name for name in pa.keys() | pb.keys() if pa.get(name) != pb.get(name) ]
+            return frame, sorted(parts)
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Find the first frame where two hash logs differ.')
+    parser.add_argument('logs', nargs=2)
+    args = parser.parse_args()
+
+    a, b = (read_log(f) for f in args.logs)
+    common = a.keys() & b.keys()
+    if not common:
+        print('the logs have no frames in common')
+        sys.exit(1)
+    found = first_difference(a, b)
+    if found is not None:
+        frame, parts = found
+        print(f"first difference at frame {frame}: {', '.join(parts)}")
+        sys.exit(1)
+    print(f"same state on all {len(common)} frames in both logs ({min(common)}-{max(common)})")
+    for name, log in zip(args.logs, (a, b)):
+        extra = len(log) - len(common)
+        if extra:
+            print(f"{name} has {extra} more frames")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""
+Spatial hash broadphase for sprite collisions.  Sprites are bucketed into a
+uniform grid by their rect, and only sprites sharing a cell are tested
+against each other, instead of every pair like pygame.sprite.groupcollide.
+
+    COLLISIONS = collision.SpatialHash(64, world_size=(MAX_X, MAX_Y))
+    COLLISIONS.set_layer(asteroids, ASTEROID, mask=SHIP|SHOT)
+    COLLISIONS.set_layer(shots, SHOT, mask=ASTEROID)
+    hits = COLLISIONS.groupcollide(asteroids, shots, True, True)
+
+With a world size the grid wraps around at the edges, the way the game
+objects do, so a sprite poking out past the right edge is found next to
+the ones on the left edge.  Groups can be put on collision layers; pairs of
+groups whose layers and masks don't match are never tested at all.
+"""
+
+ALL_LAYERS = ~0
+
+
+def wrapped_cells(start, length, world, size):
+    """Grid columns (or rows) covered by the pixels start .. start+length-1
+    of a world that wraps around at world pixels.  The span is wrapped
+    pixel by pixel, split at the seam, so the last column may be narrower
+    than the others."""
+    if length >= world:
+        return range(-(-world // size))
+    first = start % world
+    last = first + max(length, 1) - 1
+    if last < world:
+        return range(first // size, last // size + 1)
+    # the wrapped part can run into the columns of the first
+    return set(range(first // size, (world - 1) // size + 1)) | \
+           set(range(0, (last - world) // size + 1))
+
+
+#---- class: SpatialHash --------------------------------------------------
+class SpatialHash():
+
+    def __init__(self, cell_size=64, world_size=None):
+        self.cell_size = cell_size
+        self.world_size = world_size
+        self.layers = {}    # group -> (layer, mask)
+        self.tests = 0      # narrow phase tests done, for profiling
+
+    def set_layer(self, group, layer, mask=ALL_LAYERS):
+        """Put a group on a collision layer (a bit), colliding only with the
+        groups whose layer is in mask."""
+        self.layers[group] = (layer, mask)
+
+    def can_collide(self, groupa, groupb):
+        layer_a, mask_a = self.layers.get(groupa, (ALL_LAYERS, ALL_LAYERS))
+        layer_b, mask_b = self.layers.get(groupb, (ALL_LAYERS, ALL_LAYERS))
+        return bool(layer_a & mask_b) and bool(layer_b & mask_a)
+
+    def cells(self, rect):
+        """Keys of all the grid cells a rect touches."""
+        size = self.cell_size
+        if self.world_size is None:
+            x1, x2 = rect.left // size, (rect.right - 1) // size
+            y1, y2 = rect.top // size, (rect.bottom - 1) // size
+            return [ (x, y) for x in range(x1, x2 + 1) for y in range(y1, y2 + 1) ]
+        w, h = self.world_size
+        xs = wrapped_cells(rect.left, rect.width, w, size)
+        ys = wrapped_cells(rect.top, rect.height, h, size)
+        return [ (x, y) for x in xs for y in ys ]
+
+    def build(self, group):
+        """Bucket the sprites of a group, returns {cell: [(index, sprite)]}."""
+        grid = {}
+        for i, spr in enumerate(group.sprites()):
+            for key in self.cells(spr.rect):
+                try:
+                    grid[key].append((i, spr))
+                except KeyError:
+                    grid[key] = [(i, spr)]
+        return grid
+
+    def overlap(self, a, b):
+        """colliderect() that also works across the edges of a wrapping
+        world.  Compares twice the distance between the centers to avoid
+        rounding."""
+        self.tests += 1
+        if self.world_size is None:
+            return a.colliderect(b)
+        w, h = self.world_size
+        dx = ((b.x*2 + b.w) - (a.x*2 + a.w) + w) % (2*w) - w
+        dy = ((b.y*2 + b.h) - (a.y*2 + a.h) + h) % (2*h) - h
+        return abs(dx) < a.w + b.w and abs(dy) < a.h + b.h
+
+    def query(self, grid, sprite, collided=None):
+        """Sprites in the grid colliding with sprite, in group order."""
+        found = {}
+        for key in self.cells(sprite.rect):
+            for i, other in grid.get(key, ()):
+                if i in found:
+                    continue
+                if collided is None:
+                    found[i] = other if self.overlap(sprite.rect, other.rect) else None
+                else:
+                    self.tests += 1
+                    found[i] = other if collided(sprite, other) else None
+        return [ found[i] for i in sorted(found) if found[i] is not None ]
+
+    def spritecollide(self, sprite, group, dokill, collided=None):
+        """Same as pygame.sprite.spritecollide()."""
+        if not self.can_collide_sprite(sprite, group):
+            return []
+        hits = self.query(self.build(group), sprite, collided)
+        if dokill:
+            for spr in hits:
+                spr.kill()
+        return hits
+
+    def can_collide_sprite(self, sprite, group):
+        layered = [ g for g in sprite.groups() if g in self.layers ]
+        if not layered:
+            return True
+        return any( self.can_collide(g, group) for g in layered )
+
+    def groupcollide(self, groupa, groupb, dokilla, dokillb, collided=None):
+        """Same as pygame.sprite.groupcollide(), returns a dict mapping each
+        sprite of groupa to the list of sprites of groupb it hit."""
+        if not self.can_collide(groupa, groupb):
+            return {}
+        grid = self.build(groupb)
+        killed = set()
+        crashed = {}
+        for a in groupa.sprites():
+            hits = self.query(grid, a, collided)
+            if killed:
+                hits = [ b for b in hits if b not in killed ]
+            if hits:
+                crashed[a] = hits
+                if dokillb:
+                    for b in hits:
+                        b.kill()
+                        killed.add(b)
+                if dokilla:
+                    a.kill()
+        return crashed
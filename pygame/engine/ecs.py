@@ -0,0 +1,277 @@
+"""
+Entities kept as rows of arrays, one numpy array per component, so the
+per-frame work of thousands of objects runs as a few array operations
+instead of one update() call per sprite.  The components every entity has:
+
+    id      unique, in creation order
+    pos     x, y
+    vel     x, y per step
+    angle   degrees
+    spin    degrees per step
+    ttl     steps left to live, FOREVER for none
+    kind    index of the Kind (images, animation) it is drawn with
+    frame   animation frame
+
+Games can give a world components of their own.  Systems are functions
+that run over the whole world at once:
+
+    world = ecs.World()
+    rock = world.add_kind(atlas.sprites.animation('asteroid'))
+    world.spawn(100, pos=positions, vel=velocities, kind=rock)
+    ...
+    ecs.integrate(world)
+    ecs.wrap(world, (MAX_X, MAX_Y))
+    ecs.expire(world)
+    ecs.animate(world)
+
+Component arrays are views of the live rows (world.pos[:, 0] are all the x
+coordinates); they change size as entities come and go, so don't hold on
+to them across spawn() or kill().  A SpriteGroup stands in for the world
+wherever the games use sprite groups: it holds a sprite for each entity on
+screen, so renderer.draw(), FixedStep.draw() and the collision tests work
+with it as they do with any other group.  Needs numpy.
+"""
+
+import numpy
+import pygame
+
+FOREVER = -1        # ttl of entities that don't expire
+
+COMPONENTS = {
+    'id':    (numpy.int64, ()),
+    'pos':   (numpy.float64, (2,)),
+    'vel':   (numpy.float64, (2,)),
+    'angle': (numpy.float64, ()),
+    'spin':  (numpy.float64, ()),
+    'ttl':   (numpy.int32, ()),
+    'kind':  (numpy.int16, ()),
+    'frame': (numpy.int32, ()),
+}
+DEFAULTS = {'ttl': FOREVER}
+
+
+#---- class: Kind ---------------------------------------------------------
+class Kind():
+    """How a kind of entity is drawn: its animation frames, whether the
+    animation loops or the entity goes when it ends, and a
+    rotation.RotationCache if the images turn with the entity's angle."""
+
+    def __init__(self, frames, loop=True, rotations=None):
+        self.frames = list(frames)
+        self.loop = loop
+        self.rotations = rotations
+        self.size = max(max(img.get_size()) for img in self.frames)
+        if rotations is not None:
+            self.size = int(self.size * 1.5) + 1     # diagonal, roughly
+
+    def image(self, frame, angle):
+        img = self.frames[frame % len(self.frames)]
+        if self.rotations is not None:
+            img = self.rotations.rotate(img, angle)
+        return img
+
+
+#---- class: World --------------------------------------------------------
+class World():
+    """
+    The entities and their components.  extra adds components of the
+    game's own, as name=dtype, one number per entity, default 0.
+    """
+
+    def __init__(self, capacity=64, **extra):
+        components = dict(COMPONENTS)
+        components.update((name, (dtype, ())) for name, dtype in extra.items())
+        self.__dict__['data'] = { name: numpy.zeros((capacity,) + shape, dtype)
+                                  for name, (dtype, shape) in components.items() }
+        self.count = 0
+        self.next_id = 0
+        self.kinds = []
+        self.frame_counts = numpy.zeros(0, numpy.int32)     # per kind
+        self.loops = numpy.zeros(0, bool)                   # per kind
+
+    def __len__(self):
+        return self.count
+
+    def __getattr__(self, name):
+        data = self.__dict__['data']
+        if name in data:
+            return data[name][:self.count]
+        raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        # world.pos += vel ends in an assignment, write it into the array
+        if name in self.data:
+            self.data[name][:self.count] = value
+        else:
+            self.__dict__[name] = value
+
+    def add_kind(self, frames, loop=True, rotations=None):
+        """Register a Kind, returns its index for the kind component."""
+        kind = Kind(frames, loop, rotations)
+        self.kinds.append(kind)
+        self.frame_counts = numpy.array([ len(k.frames) for k in self.kinds ], numpy.int32)
+        self.loops = numpy.array([ k.loop for k in self.kinds ], bool)
+        return len(self.kinds) - 1
+
+    def reserve(self, capacity):
+        """Make room for capacity entities, growing the arrays by doubling."""
+        size = len(self.data['id'])
+        if capacity <= size:
+            return
+        while size < capacity:
+            size *= 2
+        for name, array in self.data.items():
+            grown = numpy.zeros((size,) + array.shape[1:], array.dtype)
+            grown[:self.count] = array[:self.count]
+            self.data[name] = grown
+
+    def spawn(self, count=1, **components):
+        """Add count entities, returns their ids.  Components are given as
+        one value for all of them or one per entity, the rest get their
+        defaults."""
+        start, end = self.count, self.count + count
+        self.reserve(end)
+        for name, array in self.data.items():
+            if name in components:
+                array[start:end] = components[name]
+            else:
+                array[start:end] = DEFAULTS.get(name, 0)
+        ids = numpy.arange(self.next_id, self.next_id + count)
+        self.data['id'][start:end] = ids
+        self.next_id += count
+        self.count = end
+        return ids
+
+    def rows(self, ids):
+        """The rows of the live entities among ids.  Rows stay in id order,
+        so a binary search finds them."""
+        ids = numpy.atleast_1d(ids)
+        live = self.id
+        if not len(live):
+            return numpy.zeros(0, numpy.intp)
+        rows = numpy.minimum(numpy.searchsorted(live, ids), len(live) - 1)
+        return rows[live[rows] == ids]
+
+    def remove(self, mask):
+        """Remove the entities of the rows where mask is true."""
+        if not mask.any():
+            return
+        keep = ~mask
+        count = int(keep.sum())
+        for name, array in self.data.items():
+            array[:count] = array[:self.count][keep]
+        self.count = count
+
+    def kill(self, ids):
+        mask = numpy.zeros(self.count, bool)
+        mask[self.rows(ids)] = True
+        self.remove(mask)
+
+    def clear(self):
+        self.count = 0
+
+
+#### systems ###############################################################
+
+def integrate(world, dt=1.0):
+    """Move everything by its velocity and turn it by its spin."""
+    pos = world.pos
+    pos += world.vel * dt
+    angle = world.angle
+    angle += world.spin * dt
+    angle %= 360
+
+
+def wrap(world, size):
+    """Wrap positions around the edges of a world of size (w, h)."""
+    pos = world.pos
+    pos %= size
+
+
+def expire(world):
+    """Count down the time to live, removing the entities that ran out."""
+    ttl = world.ttl
+    counting = ttl > 0
+    ttl[counting] -= 1
+    world.remove(counting & (ttl == 0))
+
+
+def animate(world):
+    """Advance the animations: looping ones wrap around, the others remove
+    their entity after the last frame."""
+    frame = world.frame
+    frame += 1
+    kind = world.kind
+    counts = world.frame_counts[kind]
+    done = frame >= counts
+    loops = world.loops[kind]
+    frame[done & loops] = 0
+    world.remove(done & ~loops)
+
+
+#---- class: EntitySprite -------------------------------------------------
+class EntitySprite(pygame.sprite.Sprite):
+    """An entity in a SpriteGroup.  Its image and rect are set by the
+    group; killing it kills the entity."""
+
+    def __init__(self, world, id):
+        pygame.sprite.Sprite.__init__(self)
+        self.world = world
+        self.id = id
+        self.image = None
+        self.rect = pygame.Rect(0, 0, 0, 0)
+
+    def kill(self):
+        self.world.kill(self.id)
+        pygame.sprite.Sprite.kill(self)
+
+
+#---- class: SpriteGroup --------------------------------------------------
+class SpriteGroup(pygame.sprite.Group):
+    """
+    A sprite group showing the entities of a world, or of some of its
+    kinds, that are on screen.  sync() brings it up to date after the
+    systems ran; camera is the world position of the screen's top left
+    corner.  An entity keeps the same sprite as long as it stays on screen,
+    which is what FixedStep needs to blend its movement.  With screen None
+    every entity gets a sprite.
+    """
+
+    def __init__(self, world, kinds=None, screen=None):
+        pygame.sprite.Group.__init__(self)
+        self.world = world
+        self.kinds = kinds
+        self.screen = None if screen is None else pygame.Rect(screen)
+        self.entity_sprites = {}    # id -> EntitySprite
+
+    def sync(self, camera=(0, 0)):
+        world = self.world
+        screen_pos = world.pos - camera
+        mask = numpy.ones(len(world), bool)
+        if self.kinds is not None:
+            mask &= numpy.isin(world.kind, self.kinds)
+        if self.screen is not None and len(world.kinds):
+            margin = max(k.size for k in world.kinds) / 2
+            x, y = screen_pos[:, 0], screen_pos[:, 1]
+            mask &= (x > self.screen.left - margin) & (x < self.screen.right + margin)
+            mask &= (y > self.screen.top - margin) & (y < self.screen.bottom + margin)
+        rows = numpy.flatnonzero(mask)
+
+        kinds = world.kinds
+        old = self.entity_sprites
+        new = {}
+        # columns to lists, not rows: thousands of little lists wake the GC up
+        xs, ys = screen_pos[rows, 0].tolist(), screen_pos[rows, 1].tolist()
+        for id, x, y, kind, frame, angle in zip(world.id[rows].tolist(), xs, ys,
+                                                world.kind[rows].tolist(), world.frame[rows].tolist(),
+                                                world.angle[rows].tolist()):
+            spr = old.get(id)
+            if spr is None:
+                spr = EntitySprite(world, id)
+            spr.image = kinds[kind].image(frame, angle)
+            spr.rect.size = spr.image.get_size()
+            spr.rect.center = (x, y)
+            new[id] = spr
+        self.entity_sprites = new
+        self.empty()
+        self.add(*new.values())
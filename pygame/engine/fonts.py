@@ -0,0 +1,96 @@
+"""
+Font registry, a drop-in for pygame.font.SysFont.  SysFont scans the system
+font directories every time it is called, which is slow at startup and
+ruinous inside a draw loop.  The registry resolves each family once, keeps
+the resolved path in an on-disk index between runs, and hands out one
+shared Font per (family, size, style):
+
+    FONT = fonts.registry.get('arial', 20)
+
+Families that aren't installed fall back to the TTF bundled in assets/.
+Delete the index file (see INDEX) to make it look for fonts again.
+"""
+
+import json, os
+import pygame
+
+FALLBACK = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'assets', 'font.ttf')
+INDEX = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')),
+                     'arcade', 'fonts.json')
+
+
+#---- class: FontRegistry -------------------------------------------------
+class FontRegistry():
+    """
+    Resolves font families to files and shares Font objects.  The index maps
+    "family:bold:italic" to [path, fake bold, fake italic]; when only the
+    regular face of a family exists the style is faked by pygame, same as
+    SysFont does.
+    """
+
+    def __init__(self, index=INDEX, fallback=FALLBACK):
+        self.index_file = index
+        self.fallback = fallback
+        self.paths = None
+        self.fonts = {}
+
+    def load_index(self):
+        try:
+            with open(self.index_file) as f:
+                self.paths = json.load(f)
+        except (OSError, ValueError):
+            self.paths = {}
+
+    def save_index(self):
+        try:
+            os.makedirs(os.path.dirname(self.index_file), exist_ok=True)
+            tmp = self.index_file + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(self.paths, f, indent=1, sort_keys=True)
+            os.replace(tmp, self.index_file)
+        except OSError:
+            pass   # no cache this time, we'll just scan again next run
+
+    def resolve(self, name, bold=False, italic=False):
+        """Return (path, fake_bold, fake_italic) for a family.  path is None
+        if neither the family nor the fallback font can be found."""
+        if self.paths is None:
+            self.load_index()
+        key = f"{name}:{int(bold)}:{int(italic)}"
+        entry = self.paths.get(key)
+        if entry is not None and (entry[0] is None or os.path.exists(entry[0])):
+            return tuple(entry)
+
+        entry = self.match(name, bold, italic)
+        self.paths[key] = list(entry)
+        self.save_index()
+        return entry
+
+    def match(self, name, bold, italic):
+        if name:
+            path = pygame.font.match_font(name, bold, italic)
+            if path:
+                return (path, False, False)
+            path = pygame.font.match_font(name)
+            if path:
+                return (path, bold, italic)
+        if os.path.exists(self.fallback):
+            return (os.path.abspath(self.fallback), bold, italic)
+        return (None, bold, italic)
+
+    def get(self, name, size, bold=False, italic=False):
+        """Return the shared Font for a family, same arguments as SysFont.
+        Don't change the style of the returned Font, it is shared."""
+        key = (name, size, bool(bold), bool(italic))
+        font = self.fonts.get(key)
+        if font is None:
+            path, fake_bold, fake_italic = self.resolve(name, bold, italic)
+            font = pygame.font.Font(path, size)
+            font.set_bold(fake_bold)
+            font.set_italic(fake_italic)
+            self.fonts[key] = font
+        return font
+
+
+# the one registry shared by everything in the process
+registry = FontRegistry()
@@ -0,0 +1,265 @@
+"""
+Running the games without a window and as fast as they go, for soak tests
+and benchmarks:
+
+    python asteroids2.py --headless --no-draw --frames 100000 --bot 1
+
+--headless selects SDL's dummy video and audio drivers and stops
+throttling the frame rate: every frame runs exactly one game step.  Input
+comes from a bot pressing the game's keys at random (--bot SEED) or from
+a script (--script FILE).  Either way it goes through the event queue, so
+the games handle it like real input.  Each game calls driver.frame() at
+the top of every frame; that posts the frame's input events, and a QUIT
+event once --frames frames have run.  Headless runs print how many frames
+ran and how fast when the game exits, whatever ended it.  The driver also
+records and plays back replays (--record, --replay, see
+engine/replay.py).
+"""
+
+import atexit, os, random, sys, time
+import pygame
+from pygame.locals import *
+from engine import replay
+
+
+def use_dummy_drivers():
+    """Must be called before the display is opened."""
+    os.environ['SDL_VIDEODRIVER'] = 'dummy'
+    os.environ['SDL_AUDIODRIVER'] = 'dummy'
+
+
+def key_event(type, key):
+    return pygame.event.Event(type, key=key, mod=0, unicode='', scancode=0)
+
+
+def click_events(pos, button=1):
+    return [ pygame.event.Event(MOUSEBUTTONDOWN, pos=pos, button=button),
+             pygame.event.Event(MOUSEBUTTONUP, pos=pos, button=button) ]
+
+
+#---- class: Bot ----------------------------------------------------------
+class Bot():
+    """
+    Random input: now and then presses or releases one of keys, and with
+    mouse=True moves the mouse around and clicks.
+    """
+
+    def __init__(self, seed, keys=(), mouse=False, key_rate=0.1):
+        self.rng = random.Random(seed)
+        self.keys = keys
+        self.mouse = mouse
+        self.key_rate = key_rate
+        self.held = set()
+        self.pos = (0, 0)
+
+    def events(self, frame):
+        rng = self.rng
+        events = []
+        if self.keys and rng.random() < self.key_rate:
+            key = rng.choice(self.keys)
+            if key in self.held:
+                self.held.remove(key)
+                events.append(key_event(KEYUP, key))
+            else:
+                self.held.add(key)
+                events.append(key_event(KEYDOWN, key))
+        if self.mouse:
+            if rng.random() < 0.2:
+                w, h = pygame.display.get_surface().get_size()
+                pos = (rng.randrange(w), rng.randrange(h))
+                rel = (pos[0] - self.pos[0], pos[1] - self.pos[1])
+                self.pos = pos
+                events.append(pygame.event.Event(MOUSEMOTION, pos=pos, rel=rel, buttons=(0, 0, 0)))
+            if rng.random() < 0.02:
+                events.extend(click_events(self.pos))
+        return events
+
+
+#---- class: Script -------------------------------------------------------
+class Script():
+    """
+    Input read from a text file, one event per line, by frame number:
+
+        30 down up          # press the up arrow on frame 30
+        45 up up            # and release it
+        50 down left ctrl
+        60 move 300 200     # mouse
+        61 click
+    """
+
+    def __init__(self, filename):
+        self.frames = {}
+        pos = (0, 0)
+        with open(filename) as f:
+            for n, line in enumerate(f, 1):
+                line = line.split('#')[0].split()
+                if not line:
+                    continue
+                try:
+                    frame, what, args = int(line[0]), line[1], line[2:]
+                    if what in ('down', 'up'):
+                        key = pygame.key.key_code(' '.join(args))
+                        events = [ key_event(KEYDOWN if what == 'down' else KEYUP, key) ]
+                    elif what == 'move':
+                        pos = (int(args[0]), int(args[1]))
+                        events = [ pygame.event.Event(MOUSEMOTION, pos=pos, rel=(0, 0), buttons=(0, 0, 0)) ]
+                    elif what == 'click':
+                        events = click_events(pos, int(args[0]) if args else 1)
+                    else:
+                        raise ValueError(f"unknown input {what!r}")
+                except (IndexError, ValueError) as e:
+                    raise ValueError(f"{filename}, line {n}: {e}")
+                self.frames.setdefault(frame, []).extend(events)
+
+    def events(self, frame):
+        return self.frames.get(frame, [])
+
+
+#---- class: Driver -------------------------------------------------------
+class Driver():
+    """
+    Feeds a game its scripted, bot or replayed input, records it, and stops
+    the game after a number of frames.  keys are the keys the bot may
+    press, mouse whether it uses the mouse; timestep is the game's
+    loop.FixedStep, if it has one, so replays run the steps recorded.  Does
+    nothing unless asked to by the command line options.
+
+    The game reads its events with driver.events() instead of
+    pygame.event.get().
+    """
+
+    def __init__(self, opts, keys=(), mouse=False, timestep=None):
+        self.headless = opts.headless
+        self.max_frames = opts.frames
+        self.timestep = timestep
+        self.input = None
+        self.recorder = None
+        self.replayer = None
+        if opts.replay:
+            self.replayer = replay.Replayer(opts.replay)
+        elif opts.script:
+            self.input = Script(opts.script)
+        elif opts.bot is not None:
+            self.input = Bot(opts.bot, keys, mouse)
+        if opts.record:
+            game = os.path.basename(sys.argv[0])
+            self.recorder = replay.Recorder(opts.record, game, opts.seed, opts.argv)
+            atexit.register(self.finish_recording)
+        self.seek = opts.seek
+        self.save_state = self.load_state = None
+        self.replayed = []      # this frame's events from the replay
+        self.mouse_pos = (0, 0)
+        self.desync = None      # first frame a replay's state didn't match
+        self.frames = 0
+        self.first_frame = 1
+        self.frame_start_steps = 0
+        self.start = time.perf_counter()
+        if opts.headless or opts.frames or opts.replay:
+            # however the game ends: --frames, the end of a replay, game over
+            atexit.register(self.report)
+
+    def set_state_handlers(self, save, load):
+        """save() returns the game's state as plain data (numbers, strings,
+        tuples, lists and dicts), load(state) puts it back.  With them a
+        recording gets keyframes, and a replay can be checked and seeked."""
+        self.save_state = save
+        self.load_state = load
+        if self.replayer is not None and self.seek:
+            found = self.replayer.seek(self.seek)
+            if found is None:
+                print(f"no keyframe at or before frame {self.seek}, replaying from the start")
+                return
+            frame, state = found
+            load(state)
+            self.frames = frame - 1
+            self.first_frame = frame
+            print(f"replaying from frame {frame}")
+
+    def steps_done(self):
+        if self.timestep is None:
+            return 1
+        return self.timestep.step_count - self.frame_start_steps
+
+    def frame(self):
+        """Post this frame's input events, call before handling events."""
+        if self.seek and self.save_state is None and self.replayer is not None:
+            # the game runs its first frame without having set handlers
+            print("this game has no keyframes to seek to, replaying from the start")
+            self.seek = 0
+        if self.recorder is not None and self.frames:
+            self.recorder.end_frame(self.steps_done())
+        if self.timestep is not None:
+            self.frame_start_steps = self.timestep.step_count
+        self.frames += 1
+
+        if self.save_state is not None:
+            if self.recorder is not None and (self.frames - 1) % self.recorder.keyframe_every == 0:
+                self.recorder.keyframe(self.frames, self.save_state())
+            if self.replayer is not None and self.frames != self.first_frame:
+                self.check_state()
+
+        if self.replayer is not None:
+            frame = self.replayer.frame(self.frames)
+            if frame is None:
+                self.quit()
+                return
+            events, steps = frame
+            self.replayed = [ self.make_event(tag, value) for tag, value in events ]
+            if self.timestep is not None:
+                self.timestep.force(steps)
+        elif self.input is not None:
+            for event in self.input.events(self.frames):
+                pygame.event.post(event)
+        if self.max_frames and self.frames == self.max_frames + 1:
+            self.quit()
+
+    def events(self):
+        """This frame's events, in place of pygame.event.get().  A replay
+        ignores real input other than closing the window."""
+        events = pygame.event.get()
+        if self.replayer is not None:
+            events = [ e for e in events if e.type == QUIT ] + self.replayed
+            self.replayed = []
+        if self.recorder is not None:
+            self.recorder.input(events)
+        return events
+
+    def make_event(self, tag, value):
+        if tag == replay.KEY_DOWN:
+            return key_event(KEYDOWN, value)
+        if tag == replay.KEY_UP:
+            return key_event(KEYUP, value)
+        if tag == replay.MOUSE_MOVE:
+            rel = (value[0] - self.mouse_pos[0], value[1] - self.mouse_pos[1])
+            self.mouse_pos = value
+            return pygame.event.Event(MOUSEMOTION, pos=value, rel=rel, buttons=(0, 0, 0))
+        if tag == replay.BUTTON_DOWN or tag == replay.BUTTON_UP:
+            type = MOUSEBUTTONDOWN if tag == replay.BUTTON_DOWN else MOUSEBUTTONUP
+            return pygame.event.Event(type, pos=self.mouse_pos, button=value)
+        return pygame.event.Event(QUIT)
+
+    def check_state(self):
+        recorded = self.replayer.state(self.frames)
+        if recorded is None or self.desync is not None:
+            return
+        if self.save_state() != recorded:
+            self.desync = self.frames
+            print(f"replay out of sync at the keyframe of frame {self.frames}")
+
+    def finish_recording(self):
+        self.recorder.end_frame(self.steps_done())
+        self.recorder.close()
+
+    def quit(self):
+        pygame.event.post(pygame.event.Event(QUIT))
+
+    def report(self):
+        print(self.stats_text())
+
+    def stats_text(self):
+        frames = self.frames - self.first_frame
+        seconds = time.perf_counter() - self.start
+        text = f"{frames} frames in {seconds:.2f} s, {frames / max(seconds, 1e-9):.1f} frames/s"
+        if self.replayer is not None and self.save_state is not None:
+            text += ", out of sync" if self.desync else ", in sync"
+        return text
@@ -0,0 +1,203 @@
+"""
+Brick levels for breakout.  Levels are authored as text files in
+assets/levels, a palette of one letter colors followed by the brick grid,
+one character per brick and '.' for no brick:
+
+    # level 1
+    R: 255 0 0
+    O: 255 128 0
+
+    ................
+    .RRRRRRRRRRRRRR.
+    .OOOOOOOOOOOOOO.
+
+and shipped compiled to a compact binary (.lvl): a header, the palette and
+one byte per cell.  Compile them from the pygame directory with:
+
+    python -m engine.levels
+
+The loader reads the compiled file when it is there and up to date with
+its text (it records the text's hash), and parses the text otherwise.
+Loaded levels are kept by content hash, so loading a level again costs a
+file read and a dictionary lookup.
+"""
+
+import argparse, glob, hashlib, os, struct
+
+LEVELS = 'assets/levels'
+MAGIC = b'BRKL'
+VERSION = 1
+HEADER = struct.Struct('<4sBHHB20s')   # magic, version, cols, rows, colors, text sha1
+EMPTY = '.'
+
+
+#---- class: Level --------------------------------------------------------
+class Level():
+    """
+    A grid of cols x rows cells, row by row, each 0 for no brick or 1 + the
+    index of the brick's color in the palette.
+    """
+
+    def __init__(self, cols, rows, palette, cells, source_hash=bytes(20)):
+        if len(cells) != cols * rows:
+            raise ValueError(f"{len(cells)} cells for a {cols}x{rows} level")
+        self.cols = cols
+        self.rows = rows
+        self.palette = palette
+        self.cells = bytes(cells)
+        self.source_hash = source_hash
+
+    def __len__(self):
+        return self.cols * self.rows - self.cells.count(0)
+
+    def bricks(self):
+        """(col, row, color) of every brick, column by column."""
+        cols, rows, cells, palette = self.cols, self.rows, self.cells, self.palette
+        for col in range(cols):
+            for row in range(rows):
+                c = cells[row * cols + col]
+                if c:
+                    yield (col, row, palette[c - 1])
+
+
+def parse(text, source_hash=None):
+    """Level from its text form.  source_hash is the sha1 of the file the
+    text was read from, by default of the text itself."""
+    if source_hash is None:
+        source_hash = hashlib.sha1(text.encode()).digest()
+    letters = {}
+    palette = []
+    lines = []
+    for n, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if ':' in line:
+            letter, rgb = line.split(':', 1)
+            letter = letter.strip()
+            if len(letter) != 1 or letter == EMPTY:
+                raise ValueError(f"line {n}: bad color letter {letter!r}")
+            color = tuple(int(v) for v in rgb.split())
+            if len(color) != 3:
+                raise ValueError(f"line {n}: a color is three numbers")
+            palette.append(color)
+            letters[letter] = len(palette)
+        else:
+            lines.append((n, line))
+
+    cols = max((len(line) for n, line in lines), default=0)
+    cells = bytearray(cols * len(lines))
+    for row, (n, line) in enumerate(lines):
+        for col, c in enumerate(line):
+            if c == EMPTY:
+                continue
+            if c not in letters:
+                raise ValueError(f"line {n}: no color for {c!r}")
+            cells[row * cols + col] = letters[c]
+    return Level(cols, len(lines), palette, cells, source_hash)
+
+
+def pack(level):
+    """Compiled binary form of a level."""
+    header = HEADER.pack(MAGIC, VERSION, level.cols, level.rows,
+                         len(level.palette), level.source_hash)
+    palette = bytes(v for color in level.palette for v in color)
+    return header + palette + level.cells
+
+
+def unpack(data):
+    """Level from its compiled form."""
+    magic, version, cols, rows, colors, source_hash = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError('not a compiled level, or from another version')
+    start = HEADER.size
+    palette = [ tuple(data[i:i+3]) for i in range(start, start + colors*3, 3) ]
+    cells = data[start + colors*3:]
+    return Level(cols, rows, palette, cells, source_hash)
+
+
+def compile_file(filename):
+    """Compile a level text file into a .lvl next to it, returns its name."""
+    # hash the bytes as they are on disk, the way LevelLoader.load() does
+    with open(filename, 'rb') as f:
+        data = f.read()
+    level = parse(data.decode('utf-8'), hashlib.sha1(data).digest())
+    output = os.path.splitext(filename)[0] + '.lvl'
+    with open(output, 'wb') as f:
+        f.write(pack(level))
+    return output
+
+
+#---- class: LevelLoader --------------------------------------------------
+class LevelLoader():
+    """
+    Loads the levels of a directory by name (the file name without its
+    extension), levels are numbered in name order.
+    """
+
+    def __init__(self, path=LEVELS):
+        self.path = path
+        self.levels = {}    # content sha1 -> Level
+        self.hits = 0
+        self.misses = 0
+
+    def names(self):
+        files = glob.glob(os.path.join(self.path, '*.txt'))
+        files += glob.glob(os.path.join(self.path, '*.lvl'))
+        return sorted({ os.path.splitext(os.path.basename(f))[0] for f in files })
+
+    def load(self, name):
+        base = os.path.join(self.path, name)
+        text = None
+        if os.path.exists(base + '.txt'):
+            with open(base + '.txt', 'rb') as f:
+                text = f.read()
+
+        if os.path.exists(base + '.lvl'):
+            with open(base + '.lvl', 'rb') as f:
+                data = f.read()
+            level = self.levels.get(hashlib.sha1(data).digest())
+            if level is None:
+                level = unpack(data)
+            if text is None or level.source_hash == hashlib.sha1(text).digest():
+                return self.remember(data, level)
+
+        # no compiled level or an old one, use the text
+        if text is None:
+            raise FileNotFoundError(f"no level {name!r} in {self.path}")
+        source_hash = hashlib.sha1(text).digest()
+        level = self.levels.get(source_hash)
+        if level is None:
+            level = parse(text.decode('utf-8'), source_hash)
+        return self.remember(text, level)
+
+    def remember(self, data, level):
+        key = hashlib.sha1(data).digest()
+        if key in self.levels:
+            self.hits += 1
+        else:
+            self.misses += 1
+            self.levels[key] = level
+        return level
+
+    def number(self, n):
+        """Level n, counting from 1; past the last level they start over."""
+        names = self.names()
+        return self.load(names[(n - 1) % len(names)])
+
+    def stats(self):
+        return {'levels': len(self.levels), 'hits': self.hits, 'misses': self.misses}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compile breakout level text files.')
+    parser.add_argument('files', nargs='*', help=f"default: {LEVELS}/*.txt")
+    args = parser.parse_args()
+
+    for filename in args.files or sorted(glob.glob(os.path.join(LEVELS, '*.txt'))):
+        output = compile_file(filename)
+        print(f"{filename} -> {output} ({os.path.getsize(output)} bytes)")
+
+
+if __name__ == '__main__':
+    main()
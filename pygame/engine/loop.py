@@ -0,0 +1,118 @@
+"""
+Fixed timestep game loop.  The game state advances in steps of exactly
+1/rate seconds, as many per frame as the time that went by calls for, so
+the game runs at the same speed however long frames take.  Drawing happens
+once per frame and blends between the last two steps:
+
+    timestep = loop.FixedStep(FPS)
+    while True:
+        handle_events()
+        for step in timestep.steps():
+            timestep.snapshot(asteroids, shots)
+            asteroids.update()
+            shots.update()
+        timestep.draw(renderer, asteroids)
+        timestep.draw(renderer, shots)
+        renderer.update()
+
+After a long frame at most max_steps steps are run to catch up; the rest
+of the backlog is dropped, so a slow machine gets a slower game instead of
+a frozen one.  With realtime=False (headless runs) the clock is ignored:
+every frame is exactly one step, as fast as the machine goes.  Replays
+force() the number of steps each frame ran when it was recorded.
+"""
+
+import pygame
+from engine import profiler
+
+MAX_STEPS = 5       # catch up steps per frame
+MAX_FPS = 120       # frames drawn per second, 0 for no limit
+MAX_JUMP = 128      # moved further than this in a step (wrapped around the
+                    # screen, respawned), don't blend
+
+
+def blend(previous, current, alpha, max_jump=MAX_JUMP):
+    """Position alpha of the way from previous to current, or current when
+    the two are too far apart to be the same movement."""
+    x0, y0 = previous
+    x1, y1 = current
+    if abs(x1 - x0) > max_jump or abs(y1 - y0) > max_jump:
+        return current
+    return (x0 + (x1 - x0) * alpha, y0 + (y1 - y0) * alpha)
+
+
+#---- class: FixedStep ----------------------------------------------------
+class FixedStep():
+
+    def __init__(self, rate, max_steps=MAX_STEPS, max_fps=MAX_FPS, max_jump=MAX_JUMP, clock=None,
+                 realtime=True):
+        self.rate = rate
+        self.dt = 1.0 / rate
+        self.max_steps = max_steps
+        self.max_fps = max_fps
+        self.max_jump = max_jump
+        self.realtime = realtime
+        self.forced = None      # steps of the next frame, for replays
+        self.clock = clock or pygame.time.Clock()
+        self.clock.tick()       # don't count the time before the loop started
+        self.accumulator = self.dt      # so the first frame has a step
+        self.alpha = 1.0        # how far drawing is between the last two steps
+        self.previous = {}      # sprite -> rect.topleft before the last step
+
+        # counters for debugging
+        self.step_count = 0
+        self.dropped = 0
+
+    def steps(self):
+        """Wait for the next frame, then yield once for every step due."""
+        if self.forced is not None or not self.realtime:
+            n = 1 if self.forced is None else self.forced
+            self.forced = None
+            self.clock.tick(self.max_fps if self.realtime else 0)
+            profiler.frames.mark('flip')
+            for i in range(n):
+                self.step_count += 1
+                yield i + 1
+            self.alpha = 1.0
+            return
+        self.accumulator += self.clock.tick(self.max_fps) / 1000.0
+        profiler.frames.mark('flip')    # waiting for the frame counts as flip/tick
+        n = 0
+        while self.accumulator >= self.dt:
+            if n == self.max_steps:
+                self.dropped += int(self.accumulator / self.dt)
+                self.accumulator %= self.dt
+                break
+            self.accumulator -= self.dt
+            n += 1
+            self.step_count += 1
+            yield n
+        self.alpha = self.accumulator / self.dt
+
+    def force(self, steps):
+        """Run exactly this many steps next frame, whatever the time."""
+        self.forced = steps
+
+    def snapshot(self, *groups):
+        """Remember where the sprites of groups are before a step."""
+        self.previous = { spr: spr.rect.topleft for g in groups for spr in g.sprites() }
+
+    def position(self, sprite):
+        """Where to draw a sprite this frame."""
+        previous = self.previous.get(sprite)
+        if previous is None:
+            return sprite.rect.topleft
+        x, y = blend(previous, sprite.rect.topleft, self.alpha, self.max_jump)
+        return (round(x), round(y))
+
+    def draw(self, renderer, group):
+        """Queue the sprites of a group on a render.Renderer, blended
+        between their last two positions."""
+        for spr in group.sprites():
+            renderer.blit(spr, spr.image, self.position(spr))
+
+    def get_fps(self):
+        return self.clock.get_fps()
+
+    def stats_text(self):
+        return f"LOOP: {self.rate} steps/s  {self.get_fps():.1f} fps  {self.dropped} dropped"
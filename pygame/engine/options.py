@@ -0,0 +1,82 @@
+"""
+Command line options shared by all the games.  Games with options of their
+own add them to the parser before parsing:
+
+    parser = options.create_parser('Breakout')
+    parser.add_argument('--balls', type=int, default=1)
+    OPTIONS = options.parse(parser)
+
+Parse before pygame opens the display: --headless has to switch SDL to its
+dummy drivers first.  Replays (--replay) bring their own seed and game
+options; only the options about how to run them are taken from the
+command line, see REPLAY_OPTIONS.
+"""
+
+import argparse, os, random, sys
+from engine import headless, profiler, replay
+
+# the options of a replay that come from the command line, not the recording
+REPLAY_OPTIONS = ('debug', 'dirty', 'headless', 'no_draw', 'frames', 'profile',
+                  'replay', 'seek', 'hash_log')
+
+
+def create_parser(description):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--debug', action='store_true',
+                        help='show debugging info on screen')
+    parser.add_argument('--dirty', action='store_true',
+                        help='only redraw the parts of the screen that changed')
+    parser.add_argument('--headless', action='store_true',
+                        help='no window, no sound and no frame rate limit')
+    parser.add_argument('--no-draw', action='store_true',
+                        help='skip drawing, for headless runs')
+    parser.add_argument('--frames', type=int, default=0, metavar='N',
+                        help='quit after N frames')
+    parser.add_argument('--bot', type=int, metavar='SEED',
+                        help='random input from a bot')
+    parser.add_argument('--script', metavar='FILE',
+                        help='input from a script, see engine/headless.py')
+    parser.add_argument('--seed', type=int, metavar='N',
+                        help='seed the random numbers, for repeatable runs')
+    parser.add_argument('--profile', metavar='FILE',
+                        help='time the phases of every frame, write a JSON report to FILE on exit')
+    parser.add_argument('--record', metavar='FILE',
+                        help='record the game to a replay file')
+    parser.add_argument('--replay', metavar='FILE',
+                        help='play back a replay file')
+    parser.add_argument('--seek', type=int, default=0, metavar='FRAME',
+                        help='start a replay at the last keyframe before FRAME')
+    parser.add_argument('--hash-log', metavar='FILE',
+                        help='write a hash of the game state every frame to FILE')
+    return parser
+
+
+def parse(parser, argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    opts = parser.parse_args(argv)
+    opts.argv = argv
+    if opts.replay:
+        header = replay.read_header(opts.replay)
+        game = os.path.basename(sys.argv[0])
+        if header['game'] != game:
+            parser.error(f"{opts.replay} is a replay of {header['game']}, not {game}")
+        recorded = parser.parse_args(header['argv'])
+        for name in REPLAY_OPTIONS:
+            setattr(recorded, name, getattr(opts, name))
+        recorded.seed = header['seed']
+        recorded.record = recorded.bot = recorded.script = None
+        recorded.argv = argv
+        opts = recorded
+    elif opts.record and opts.seed is None:
+        # the replay needs the seed
+        opts.seed = random.SystemRandom().randrange(1 << 32)
+    if opts.headless:
+        headless.use_dummy_drivers()
+    if opts.profile:
+        profiler.frames.record(opts.profile)
+    return opts
+
+
+def parse_args(description, argv=None):
+    return parse(create_parser(description), argv)
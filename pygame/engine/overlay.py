@@ -0,0 +1,144 @@
+"""
+Frame profiler overlay: a rolling bar graph of how long each phase of the
+last frames took, stacked one color per phase, with a line at the frame
+budget (1/FPS) and frames over it flagged in red.  F3 shows and hides it.
+The times come from profiler.frames, so the game has to mark its phases
+(see engine/profiler.py), then:
+
+    profile_overlay = overlay.Overlay(FPS)
+    ...
+    for event in pygame.event.get():
+        profile_overlay.handle_event(event)
+    ...
+    profile_overlay.draw(renderer)      # with the HUD
+
+While the overlay is hidden the profiler is switched off (unless it is
+recording a --profile report), so a hidden overlay costs the games one
+attribute check per phase mark.  When shown it draws one new bar a frame
+into a scrolling surface, and redraws its legend a few times a second.
+"""
+
+import pygame
+from pygame.locals import *
+from engine import fonts, profiler
+
+HOTKEY = K_F3
+HISTORY = 120       # frames in the graph
+BAR_WIDTH = 2
+HEIGHT = 90
+BUDGET_HEIGHT = 60  # the budget line, in pixels from the bottom
+TEXT_EVERY = 10     # frames between legend updates
+
+BGCOLOR = (16, 16, 16)
+BUDGET_COLOR = (200, 200, 200)
+OVER_COLOR = (255, 40, 40)
+COLORS = {
+    'events':  ( 90,  90, 255),
+    'update':  ( 40, 200,  40),
+    'collide': (255, 200,   0),
+    'draw':    (  0, 200, 200),
+    'hud':     (200,   0, 200),
+    'flip':    (140, 140, 140),
+}
+
+
+#---- class: Overlay ------------------------------------------------------
+class Overlay():
+
+    def __init__(self, fps, pos=(10, 10), profile=None):
+        self.profile = profile or profiler.frames
+        self.budget = 1e9 / fps     # ns per frame
+        self.scale = BUDGET_HEIGHT / self.budget
+        self.pos = pos
+        self.visible = False
+        self.graph = None
+        self.legend = None
+        self.font = None
+        self.seen = 0       # profile.frame_count already in the graph
+
+    def handle_event(self, event):
+        """Toggle on the hotkey, returns whether the event was used."""
+        if event.type == KEYUP and event.key == HOTKEY:
+            self.toggle()
+            return True
+        return False
+
+    def toggle(self):
+        self.visible = not self.visible
+        profile = self.profile
+        if self.visible:
+            if not profile.recording:
+                profile.set_history(HISTORY)
+            profile.enabled = True
+            if self.graph is None:
+                self.graph = pygame.Surface((HISTORY * BAR_WIDTH, HEIGHT)).convert()
+                self.font = fonts.registry.get('courier', 12)
+            self.graph.fill(BGCOLOR)
+            self.seen = profile.frame_count
+        else:
+            profile.enabled = profile.recording
+
+    def add_bar(self, index):
+        """Scroll the graph left and draw the frame at index (negative, from
+        the newest) of the profile's history at its right edge."""
+        graph = self.graph
+        graph.scroll(-BAR_WIDTH, 0)
+        x = graph.get_width() - BAR_WIDTH
+        graph.fill(BGCOLOR, (x, 0, BAR_WIDTH, HEIGHT))
+        y = HEIGHT
+        for phase in self.profile.phases:
+            h = self.profile.times[phase][index] * self.scale
+            if h >= 0.5:
+                top = max(round(y - h), 0)
+                graph.fill(COLORS.get(phase, BUDGET_COLOR), (x, top, BAR_WIDTH, y - top))
+                y = top
+        graph.fill(BUDGET_COLOR, (x, HEIGHT - BUDGET_HEIGHT, BAR_WIDTH, 1))
+        if self.profile.totals[index] > self.budget:
+            graph.fill(OVER_COLOR, (x, 0, BAR_WIDTH, 4))
+
+    def render_legend(self):
+        """Average ms per phase over the graph on one line, the frames over
+        budget on the next."""
+        profile = self.profile
+        count = min(len(profile.totals), HISTORY)
+        if not count:
+            return
+        font = self.font
+        phases = []
+        for phase in profile.phases:
+            times = profile.times[phase]
+            ms = sum(times[-i] for i in range(1, count + 1)) / count / 1e6
+            phases.append((f"{phase} {ms:.2f}  ", COLORS.get(phase, BUDGET_COLOR)))
+        over = sum(1 for i in range(1, count + 1) if profile.totals[-i] > self.budget)
+        budget = [(f"over {self.budget / 1e6:.1f} ms: {over}/{count} frames",
+                   OVER_COLOR if over else BUDGET_COLOR)]
+
+        lines = [ [ font.render(msg, True, color, BGCOLOR) for msg, color in parts ]
+                  for parts in (phases, budget) ]
+        width = max(sum(img.get_width() for img in line) for line in lines)
+        height = font.get_linesize()
+        self.legend = pygame.Surface((width, height * len(lines))).convert()
+        self.legend.fill(BGCOLOR)
+        for y, line in enumerate(lines):
+            x = 0
+            for img in line:
+                self.legend.blit(img, (x, y * height))
+                x += img.get_width()
+
+    def draw(self, renderer):
+        """Queue the overlay on a render.Renderer, if it is shown."""
+        if not self.visible:
+            return
+        profile = self.profile
+        new = profile.frame_count - self.seen
+        for index in range(-min(new, HISTORY, len(profile.totals)), 0):
+            self.add_bar(index)
+        if new and (self.legend is None or profile.frame_count % TEXT_EVERY == 0):
+            self.render_legend()
+        self.seen = profile.frame_count
+
+        # the graph surface is drawn on in place, so tell the renderer
+        renderer.blit('profiler graph', self.graph, self.pos)
+        renderer.invalidate(self.graph.get_rect(topleft=self.pos))
+        if self.legend is not None:
+            renderer.blit('profiler legend', self.legend, (self.pos[0], self.pos[1] + HEIGHT + 2))
@@ -0,0 +1,104 @@
+"""
+Background asset loading.  Image files are decoded on a pool of worker
+threads while the main loop keeps pumping events and drawing a progress
+screen.  Converting to the display format has to happen on the main thread,
+so finished images are converted in poll() and put in the shared cache,
+where the sprite loaders will find them.
+
+    ASSETS = ('background', 'ship', 'asteroid', 'explosion')
+    ...
+    preload.loading_screen(DISPLAY, CLOCK, preload.Preloader(ASSETS), FONT)
+"""
+
+import sys
+from concurrent.futures import ThreadPoolExecutor
+import pygame
+from pygame.locals import *
+from engine import assets, atlas
+
+WORKERS = 4
+
+
+#---- class: Preloader ----------------------------------------------------
+class Preloader():
+    """
+    Loads the image files behind a list of sprite names (see engine.atlas)
+    in the background.  Call poll() once per frame from the main thread until
+    done() is true.
+    """
+
+    def __init__(self, names=(), sprites=atlas.sprites, workers=WORKERS):
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.pending = {}    # future -> (filename, alpha)
+        self.total = 0
+        self.loaded = 0
+        for name in names:
+            for filename, alpha in sprites.sources(name):
+                self.add_file(filename, alpha)
+
+    def add_file(self, filename, alpha=True):
+        """Queue an image file, files that are already cached or queued are
+        skipped."""
+        if ('image', filename, alpha) in assets.cache:
+            return
+        if (filename, alpha) in self.pending.values():
+            return
+        future = self.pool.submit(pygame.image.load, filename)
+        self.pending[future] = (filename, alpha)
+        self.total += 1
+
+    def poll(self):
+        """Convert and cache the images that have finished decoding.  Returns
+        the fraction of files loaded so far."""
+        for future in [f for f in self.pending if f.done()]:
+            filename, alpha = self.pending.pop(future)
+            img = future.result()   # re-raises any error from the worker
+            img = img.convert_alpha() if alpha else img.convert()
+            assets.cache.store_image(filename, img, alpha)
+            self.loaded += 1
+        if not self.pending:
+            self.pool.shutdown(wait=False)
+        return self.progress()
+
+    def progress(self):
+        if self.total == 0:
+            return 1.0
+        return self.loaded / self.total
+
+    def done(self):
+        return not self.pending
+
+    def wait(self):
+        """Block until everything is loaded."""
+        while not self.done():
+            next(iter(self.pending)).result()
+            self.poll()
+
+
+def draw_progress(disp, fraction, font=None, color=(128, 128, 128)):
+    """Draw a centred progress bar, with a caption when a font is given."""
+    w = disp.get_width() // 2
+    h = 16
+    bar = pygame.Rect(0, 0, w, h)
+    bar.center = disp.get_rect().center
+    pygame.draw.rect(disp, color, bar, 1)
+    pygame.draw.rect(disp, color, (bar.x+2, bar.y+2, int((w-4) * fraction), h-4))
+    if font is not None:
+        msg = font.render(f"LOADING {fraction*100:3.0f}%", True, color)
+        disp.blit(msg, (bar.centerx - msg.get_width()//2, bar.y - msg.get_height() - 8))
+
+
+def loading_screen(disp, clock, preloader, font=None, fps=30, bgcolor=(0, 0, 0)):
+    """Run a small event loop showing the loading progress until the
+    preloader is done.  Closing the window or ESC quits the game."""
+    while not preloader.done():
+        for event in pygame.event.get():
+            if event.type == QUIT or (event.type == KEYUP and event.key == K_ESCAPE):
+                pygame.quit()
+                sys.exit()
+
+        fraction = preloader.poll()
+        disp.fill(bgcolor)
+        draw_progress(disp, fraction, font)
+        pygame.display.update()
+        clock.tick(fps)
@@ -0,0 +1,280 @@
+"""
+Per-phase frame timing, and the benchmark suite built on it.  A game marks
+the end of each phase of its frame; the time since the previous mark is
+charged to that phase:
+
+    profiler.frames.begin()
+    handle_events()
+    profiler.frames.mark('events')
+    for step in timestep.steps():
+        update()
+        profiler.frames.mark('update')
+        collide()
+        profiler.frames.mark('collide')
+    draw()
+    profiler.frames.mark('draw')
+    draw_hud()
+    profiler.frames.mark('hud')
+    renderer.update()                   # marks 'draw' before the flip
+    profiler.frames.end('flip')
+
+Calls on a profiler that isn't enabled return straight away.  Enabling
+it takes effect at the next begin(), the frame under way isn't timed.  With
+--profile FILE a game records every frame and writes a JSON report of
+frame time percentiles per phase and of the net growth in allocated
+memory blocks when it quits.  Net growth is not an allocation count:
+blocks allocated and freed within a frame cancel out, and frames that free
+more than they allocate come out negative.  engine/overlay.py shows the same timings on screen.
+
+The benchmark suite runs the games headless with a fixed seed and a bot
+playing, under canned stress scenarios, and compares the reports against a
+stored baseline.  From the pygame directory:
+
+    python -m engine.profiler                   # all scenarios
+    python -m engine.profiler asteroids2-1000   # some of them
+    python -m engine.profiler --save-baseline   # after a deliberate change
+
+It exits with status 1 when a scenario got slower than the baseline by
+more than the threshold.  Baselines only compare on the same machine.
+"""
+
+import argparse, atexit, collections, json, os, platform, subprocess, sys, tempfile
+from time import perf_counter_ns
+
+PHASES = ('events', 'update', 'collide', 'draw', 'hud', 'flip')
+WARMUP = 30         # frames left out of reports, caches filling up
+PERCENTILES = (50, 95, 99)
+
+BASELINE = 'benchmarks/baseline.json'
+FRAMES = 600
+SEED = 1
+THRESHOLD = 0.15    # slower than the baseline by this much is a regression
+NOISE_MS = 0.05     # differences smaller than this never are
+SCENARIOS = {
+    'asteroids':        ['asteroids.py'],
+    'asteroids2':       ['asteroids2.py'],
+    'asteroids2-1000':  ['asteroids2.py', '--asteroids', '1000'],
+    'breakout':         ['breakout.py'],
+    'breakout-5000':    ['breakout.py', '--bricks', '5000'],
+    'lunar_lander':     ['lunar_lander.py', '--endless'],
+    'miner2525':        ['miner2525.py'],
+    'miner2525-10000':  ['miner2525.py', '--asteroids', '10000'],
+    'pong':             ['pong.py'],
+}
+
+
+def percentile(ordered, p):
+    """Nearest rank percentile of a sorted list."""
+    if not ordered:
+        return 0
+    return ordered[min(len(ordered) - 1, max(0, -(-len(ordered) * p // 100) - 1))]
+
+
+def summary(samples, scale=1e-6):
+    """Mean, percentiles and max of samples, in ms for nanoseconds."""
+    ordered = sorted(samples)
+    result = {'mean': sum(ordered) / max(len(ordered), 1) * scale}
+    for p in PERCENTILES:
+        result[f"p{p}"] = percentile(ordered, p) * scale
+    result['max'] = (ordered[-1] if ordered else 0) * scale
+    return result
+
+
+#---- class: Profiler -----------------------------------------------------
+class Profiler():
+    """
+    Frame times per phase in nanoseconds and the net change in allocated
+    memory blocks over each frame (which counts the handful of ints holding the
+    frame's own timings).  history keeps only that many of the latest
+    frames, 0 keeps them all.
+    """
+
+    def __init__(self, phases=PHASES, history=0):
+        self.phases = phases
+        self.enabled = False
+        self.timing = False     # enabled when the current frame began
+        self.recording = False  # for a report, all frames are kept
+        self.set_history(history)
+        self.current = dict.fromkeys(phases, 0)
+        self.start = self.last = 0
+        self.blocks = 0
+
+    def set_history(self, history):
+        maxlen = history or None
+        self.times = { phase: collections.deque(maxlen=maxlen) for phase in self.phases }
+        self.totals = collections.deque(maxlen=maxlen)
+        self.block_growth = collections.deque(maxlen=maxlen)
+        self.frame_count = 0
+
+    def begin(self):
+        """Start of a frame."""
+        self.timing = self.enabled
+        if not self.timing:
+            return
+        self.current = dict.fromkeys(self.phases, 0)
+        self.blocks = sys.getallocatedblocks()
+        self.start = self.last = perf_counter_ns()
+
+    def mark(self, phase):
+        """End of a phase, may come several times a frame."""
+        if not self.timing:
+            return
+        now = perf_counter_ns()
+        self.current[phase] += now - self.last
+        self.last = now
+
+    def end(self, phase):
+        """End of the last phase and of the frame."""
+        if not self.timing:
+            return
+        self.mark(phase)
+        self.timing = False
+        blocks = sys.getallocatedblocks() - self.blocks   # before adding to the history
+        for p in self.phases:
+            self.times[p].append(self.current[p])
+        self.totals.append(self.last - self.start)
+        self.block_growth.append(blocks)
+        self.frame_count += 1
+
+    def report(self, warmup=WARMUP):
+        """Statistics of the frames recorded, times in ms."""
+        skip = min(warmup, max(len(self.totals) - 1, 0))
+        def recorded(samples):
+            return list(samples)[skip:]
+        phases = { p: summary(recorded(self.times[p])) for p in self.phases }
+        phases['frame'] = summary(recorded(self.totals))
+        blocks = recorded(self.block_growth)
+        return {
+            'frames': len(blocks),
+            'phases': phases,
+            'block_growth': {
+                'mean': sum(blocks) / max(len(blocks), 1),
+                'min': min(blocks, default=0),
+                'max': max(blocks, default=0),
+                'total': sum(blocks),
+            },
+        }
+
+    def save(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+
+    def record(self, filename):
+        """Enable, and save a report to filename when the game exits."""
+        self.enabled = True
+        self.recording = True
+        atexit.register(self.save, filename)
+
+
+# the profiler of the running game
+frames = Profiler()
+
+
+#### benchmark suite ####################################################
+
+def run_scenario(name, count=FRAMES, seed=SEED):
+    """Run a scenario for count frames in a fresh interpreter, returns
+    its report."""
+    fd, report = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    try:
+        args = [sys.executable] + SCENARIOS[name] + [
+            '--headless', '--frames', str(count), '--bot', str(seed),
+            '--seed', str(seed), '--profile', report]
+        subprocess.run(args, check=True, stdout=subprocess.DEVNULL)
+        with open(report) as f:
+            return json.load(f)
+    finally:
+        os.remove(report)
+
+
+def compare(results, baseline, threshold=THRESHOLD):
+    """Lines comparing p50 and p95 frame and phase times with the baseline,
+    and the number of regressions among them."""
+    lines = []
+    regressions = 0
+    for name, report in results.items():
+        if name not in baseline:
+            lines.append(f"{name}: no baseline")
+            continue
+        for phase, stats in report['phases'].items():
+            base = baseline[name]['phases'].get(phase)
+            if base is None:
+                continue
+            for key in ('p50', 'p95'):
+                old, new = base[key], stats[key]
+                flag = ''
+                if new - old > NOISE_MS and new > old * (1 + threshold):
+                    flag = '  REGRESSION'
+                    regressions += 1
+                elif old - new > NOISE_MS and old > new * (1 + threshold):
+                    flag = '  faster'
+                if flag or phase == 'frame':
+                    lines.append(f"{name:18} {phase:8} {key}  {old:8.3f} -> {new:8.3f} ms{flag}")
+    return lines, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the game benchmarks.')
+    parser.add_argument('scenarios', nargs='*', help=f"default: all of {', '.join(SCENARIOS)}")
+    parser.add_argument('--frames', type=int, default=FRAMES)
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='store the results as the new baseline')
+    parser.add_argument('--output', help='also write the results to this file')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                        help=f"slowdown counted as a regression (default {THRESHOLD})")
+    args = parser.parse_args()
+
+    for name in args.scenarios:
+        if name not in SCENARIOS:
+            parser.error(f"no scenario {name!r}")
+
+    results = {}
+    for name in args.scenarios or SCENARIOS:
+        report = run_scenario(name, args.frames, args.seed)
+        frame = report['phases']['frame']
+        print(f"{name:18} p50 {frame['p50']:7.3f}  p95 {frame['p95']:7.3f}  "
+              f"p99 {frame['p99']:7.3f} ms  net {report['block_growth']['mean']:+.1f} blocks/frame")
+        results[name] = report
+
+    output = {
+        'frames': args.frames,
+        'seed': args.seed,
+        'machine': platform.platform(),
+        'python': platform.python_version(),
+        'scenarios': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2)
+
+    if args.save_baseline:
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                old = json.load(f)
+            old['scenarios'].update(results)
+            results = old['scenarios']
+        output['scenarios'] = results
+        os.makedirs(os.path.dirname(args.baseline) or '.', exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump(output, f, indent=2)
+        print(f"baseline saved to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"no baseline in {args.baseline}, store one with --save-baseline")
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    print()
+    lines, regressions = compare(results, baseline['scenarios'], args.threshold)
+    print('\n'.join(lines))
+    if regressions:
+        print(f"\n{regressions} regressions")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+"""
+Frame renderer with an optional dirty rectangle mode.  Each frame the game
+hands the renderer everything it wants on screen, in drawing order, then
+calls update():
+
+    renderer.draw(asteroids)                      # a sprite group
+    renderer.blit('score', score_img, (10, 10))   # anything else, by key
+    renderer.update()
+
+In full mode (the default) that is the same as blitting the background,
+drawing everything and flipping the display.  In dirty mode only the areas
+where something appeared, moved, changed image or disappeared since the
+last frame are restored from the background, redrawn and passed to
+display.update(); if too many areas changed it falls back to a full
+redraw.  Anything static (titles, arena walls) belongs in the background.
+A renderer made with enabled=False draws nothing at all (--no-draw).
+"""
+
+import time
+import pygame
+from engine import profiler
+
+MAX_RECTS = 48    # more changed areas than this and a full redraw is cheaper
+
+
+def merge_rects(rects):
+    """Merge overlapping rectangles into their bounding boxes until none of
+    them overlap, so no pixel gets painted (and alpha blended) twice."""
+    merged = []
+    for rect in rects:
+        rect = pygame.Rect(rect)
+        i = rect.collidelist(merged)
+        while i != -1:
+            rect.union_ip(merged.pop(i))
+            i = rect.collidelist(merged)
+        merged.append(rect)
+    return merged
+
+
+#---- class: Renderer -----------------------------------------------------
+class Renderer():
+    """
+    Draws the items queued during a frame, fully or only where the screen
+    changed.  Items are matched to the previous frame by key; sprites are
+    their own key.
+    """
+
+    def __init__(self, display, background, dirty=False, max_rects=MAX_RECTS, enabled=True):
+        self.display = display
+        self.dirty = dirty
+        self.enabled = enabled
+        self.max_rects = max_rects
+        self.items = []         # (key, image, rect) for this frame
+        self.previous = {}      # key -> (image, rect) drawn last frame
+        self.invalid = []       # areas to redraw whatever happens
+        self.set_background(background)
+
+        # stats for the debug overlay
+        self.times = []
+        self.rect_count = 0
+        self.full_redraw = True
+
+    def set_background(self, background):
+        """Change the background, a Surface the size of the display or a
+        color.  The next frame is fully redrawn."""
+        if not isinstance(background, pygame.Surface):
+            color = background
+            background = pygame.Surface(self.display.get_size()).convert()
+            background.fill(color)
+        self.background = background
+        self.invalidate()
+
+    def invalidate(self, rect=None):
+        """Force an area (default: the whole screen) to be redrawn, e.g.
+        after drawing on the background or on a surface already in use."""
+        if rect is None:
+            rect = self.display.get_rect()
+        self.invalid.append(pygame.Rect(rect))
+
+    def draw(self, group):
+        """Queue all the sprites of a group, keyed by sprite."""
+        self.items.extend((spr, spr.image, spr.rect) for spr in group.sprites())
+
+    def blit(self, key, img, pos):
+        """Queue a surface with its top left corner at pos.  The key tells
+        the renderer it's the same thing as last frame's item with that key."""
+        self.items.append((key, img, pygame.Rect(pos, img.get_size())))
+
+    def blit_many(self, key, img, positions):
+        """Queue the same surface at many positions, e.g. particles."""
+        size = img.get_size()
+        self.items.extend(((key, i), img, pygame.Rect(p, size)) for i, p in enumerate(positions))
+
+    def glyphs(self, key, atlas, text, pos):
+        """Queue a string drawn from a text.GlyphAtlas."""
+        for i, (img, p) in enumerate(atlas.blits(text, pos)):
+            self.items.append(((key, i), img, pygame.Rect(p, img.get_size())))
+
+    def update(self):
+        """Draw the queued items and update the display."""
+        if not self.enabled:
+            self.items = []
+            self.invalid = []
+            profiler.frames.mark('draw')
+            return
+        start = time.perf_counter()
+        if self.dirty:
+            self.update_dirty()
+        else:
+            self.update_full()
+        self.items = []
+
+        self.times.append(time.perf_counter() - start)
+        if len(self.times) > 30:
+            del self.times[0]
+
+    def update_full(self):
+        self.display.blit(self.background, (0, 0))
+        self.display.blits([(img, rect) for key, img, rect in self.items], False)
+        profiler.frames.mark('draw')
+        pygame.display.flip()
+        self.invalid = []
+        self.full_redraw = True
+        self.rect_count = 1
+
+    def update_dirty(self):
+        changed = self.invalid
+        previous = self.previous
+        current = {}
+        for key, img, rect in self.items:
+            old = previous.pop(key, None)
+            if old is None:
+                changed.append(rect)
+            elif old[0] is not img or old[1] != rect:
+                changed.append(old[1])
+                changed.append(rect)
+            current[key] = (img, pygame.Rect(rect))
+        for img, rect in previous.values():   # things that went away
+            changed.append(rect)
+        self.previous = current
+
+        changed = merge_rects(changed)
+        if len(changed) > self.max_rects:
+            self.update_full()
+            return
+
+        # restore the background, then repaint every item that overlaps a
+        # changed area, clipped to that area so nothing else is touched
+        blit = self.display.blit
+        background = self.background
+        for rect in changed:
+            blit(background, rect, rect)
+        for key, img, rect in self.items:
+            for i in rect.collidelistall(changed):
+                clip = rect.clip(changed[i])
+                blit(img, clip, clip.move(-rect.x, -rect.y))
+        profiler.frames.mark('draw')
+        pygame.display.update(changed)
+
+        self.invalid = []
+        self.full_redraw = False
+        self.rect_count = len(changed)
+
+    def frame_time(self):
+        """Average time spent in update() over the last frames, in ms."""
+        if not self.times:
+            return 0.0
+        return sum(self.times) * 1000 / len(self.times)
+
+    def stats_text(self):
+        mode = 'dirty' if self.dirty else 'full'
+        if not self.enabled:
+            mode = 'off'
+        if self.dirty and self.full_redraw:
+            mode = 'dirty (full)'
+        return f"RENDER: {mode}  {self.rect_count} rects  {self.frame_time():.2f} ms"
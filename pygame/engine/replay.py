@@ -0,0 +1,219 @@
+"""
+Recording and replaying games.  A replay file holds the random seed and
+command line of the game, then the input of every frame and how many game
+steps the frame ran, so playing it back gives exactly the same game, as
+fast as the machine goes when headless:
+
+    python asteroids2.py --record run.rpl                       # play
+    python asteroids2.py --replay run.rpl --headless --no-draw  # again
+
+The input is stored as a compact stream of tagged records: key presses
+and releases, mouse moves and clicks, and frame ends.  Runs of frames
+without input take a few bytes in all.  Games that hand headless.Driver a
+pair of state functions also get a keyframe of their state every
+KEYFRAME_EVERY frames.  Playing back, the game's state is checked against
+them, and --seek FRAME starts the replay from the last keyframe at or
+before FRAME.
+
+Keyframes are pickled, only replay files you trust.
+"""
+
+import json, pickle, struct
+from pygame.locals import *
+
+MAGIC = b'ARPL'
+VERSION = 1
+KEYFRAME_EVERY = 300    # frames
+
+# record tags
+KEY_DOWN = 1        # key
+KEY_UP = 2          # key
+MOUSE_MOVE = 3      # x, y
+BUTTON_DOWN = 4     # button, at the last mouse position
+BUTTON_UP = 5       # button
+QUIT_GAME = 6
+FRAME = 7           # steps, ends a frame with input
+IDLE = 8            # steps, count: frames without input
+KEYFRAME = 9        # frame, size, pickled state
+
+POSITION = struct.Struct('<hh')
+
+
+def write_varint(out, n):
+    while n >= 0x80:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def read_varint(data, i):
+    """Returns the number at data[i] and the index after it."""
+    n = shift = 0
+    while True:
+        b = data[i]
+        i += 1
+        n |= (b & 0x7f) << shift
+        if b < 0x80:
+            return n, i
+        shift += 7
+
+
+def read_header(filename):
+    """The header of a replay file: game, seed, argv and keyframe_every."""
+    with open(filename, 'rb') as f:
+        return parse_header(f.read())[0]
+
+
+def parse_header(data):
+    if data[:4] != MAGIC or data[4] != VERSION:
+        raise ValueError('not a replay file, or from another version')
+    size, = struct.unpack_from('<I', data, 5)
+    return json.loads(data[9:9+size]), 9 + size
+
+
+#---- class: Recorder -----------------------------------------------------
+class Recorder():
+    """
+    Writes a replay file as the game runs, frame by frame: input(events)
+    for every input event of the frame, then end_frame(steps).
+    """
+
+    def __init__(self, filename, game, seed, argv, keyframe_every=KEYFRAME_EVERY):
+        self.file = open(filename, 'wb')
+        header = json.dumps({'game': game, 'seed': seed, 'argv': argv,
+                             'keyframe_every': keyframe_every}).encode()
+        self.file.write(MAGIC + bytes([VERSION]) + struct.pack('<I', len(header)) + header)
+        self.keyframe_every = keyframe_every
+        self.out = bytearray()
+        self.has_input = False
+        self.idle_steps = 1
+        self.idle_count = 0     # frames in the current run without input
+
+    def input(self, events):
+        out = self.out
+        for event in events:
+            if event.type == KEYDOWN or event.type == KEYUP:
+                self.flush_idle()
+                out.append(KEY_DOWN if event.type == KEYDOWN else KEY_UP)
+                write_varint(out, event.key)
+            elif event.type == MOUSEMOTION:
+                self.flush_idle()
+                out.append(MOUSE_MOVE)
+                out += POSITION.pack(*event.pos)
+            elif event.type == MOUSEBUTTONDOWN or event.type == MOUSEBUTTONUP:
+                self.flush_idle()
+                out.append(BUTTON_DOWN if event.type == MOUSEBUTTONDOWN else BUTTON_UP)
+                out.append(event.button)
+            elif event.type == QUIT:
+                self.flush_idle()
+                out.append(QUIT_GAME)
+            else:
+                continue
+            self.has_input = True
+
+    def end_frame(self, steps):
+        if self.has_input:
+            self.out.append(FRAME)
+            write_varint(self.out, steps)
+            self.has_input = False
+        elif self.idle_count and steps == self.idle_steps:
+            self.idle_count += 1
+        else:
+            self.flush_idle()
+            self.idle_steps = steps
+            self.idle_count = 1
+        if len(self.out) > 4096:
+            self.flush()
+
+    def flush_idle(self):
+        if self.idle_count:
+            self.out.append(IDLE)
+            write_varint(self.out, self.idle_steps)
+            write_varint(self.out, self.idle_count)
+            self.idle_count = 0
+
+    def keyframe(self, frame, state):
+        """The game's state at the start of frame, before its input."""
+        self.flush_idle()
+        data = pickle.dumps(state, protocol=4)
+        self.out.append(KEYFRAME)
+        write_varint(self.out, frame)
+        write_varint(self.out, len(data))
+        self.out += data
+
+    def flush(self):
+        self.file.write(self.out)
+        self.out.clear()
+
+    def close(self):
+        self.flush_idle()
+        self.flush()
+        self.file.close()
+
+
+#---- class: Replayer -----------------------------------------------------
+class Replayer():
+    """
+    A replay file read into memory: frames[i] is (events, steps) of frame
+    i + 1, events being (tag, value) pairs, and keyframes maps frame numbers
+    to pickled states.
+    """
+
+    def __init__(self, filename):
+        with open(filename, 'rb') as f:
+            data = f.read()
+        self.header, i = parse_header(data)
+        self.frames = []
+        self.keyframes = {}
+        no_input = ()
+        events = []
+        while i < len(data):
+            tag = data[i]
+            i += 1
+            if tag == KEY_DOWN or tag == KEY_UP:
+                key, i = read_varint(data, i)
+                events.append((tag, key))
+            elif tag == MOUSE_MOVE:
+                events.append((tag, POSITION.unpack_from(data, i)))
+                i += POSITION.size
+            elif tag == BUTTON_DOWN or tag == BUTTON_UP:
+                events.append((tag, data[i]))
+                i += 1
+            elif tag == QUIT_GAME:
+                events.append((tag, None))
+            elif tag == FRAME:
+                steps, i = read_varint(data, i)
+                self.frames.append((tuple(events), steps))
+                events = []
+            elif tag == IDLE:
+                steps, i = read_varint(data, i)
+                count, i = read_varint(data, i)
+                self.frames.extend([(no_input, steps)] * count)
+            elif tag == KEYFRAME:
+                frame, i = read_varint(data, i)
+                size, i = read_varint(data, i)
+                self.keyframes[frame] = data[i:i+size]
+                i += size
+            else:
+                raise ValueError(f"bad replay record {tag} at byte {i-1}")
+
+    def __len__(self):
+        return len(self.frames)
+
+    def frame(self, n):
+        """(events, steps) of frame n, counting from 1, or None past the end."""
+        if 1 <= n <= len(self.frames):
+            return self.frames[n - 1]
+        return None
+
+    def state(self, frame):
+        """The game state recorded at the start of frame, or None."""
+        data = self.keyframes.get(frame)
+        return None if data is None else pickle.loads(data)
+
+    def seek(self, frame):
+        """The last keyframe at or before frame, as (frame, state), or None."""
+        found = [ k for k in self.keyframes if k <= frame ]
+        if not found:
+            return None
+        return max(found), self.state(max(found))
@@ -0,0 +1,65 @@
+"""
+Cache of rotated sprite images.  Angles are snapped to a fixed angular
+resolution so a ship turning in 10 degree steps only ever needs 36 rotated
+copies of its image, made once and reused every frame after that.
+
+    ROTATIONS = rotation.RotationCache(resolution=10)
+    image = ROTATIONS.rotate(self.image_orig, self.angle)
+"""
+
+import weakref
+import pygame
+
+
+#---- class: RotationCache ------------------------------------------------
+class RotationCache():
+    """
+    Rotated copies of source surfaces keyed by (source, quantized angle).
+    Sources are held weakly so the rotations of a surface nobody uses any
+    more are dropped along with it.
+    """
+
+    def __init__(self, resolution=1):
+        self.resolution = resolution
+        self.steps = max(1, round(360 / resolution))
+        self.rotations = weakref.WeakKeyDictionary()   # source -> {step: image}
+        self.hits = 0
+        self.misses = 0
+
+    def quantize(self, angle):
+        """Return the step index closest to the given angle (degrees)."""
+        return round(angle / self.resolution) % self.steps
+
+    def rotate(self, source, angle):
+        """Return source rotated counter-clockwise by angle, snapped to the
+        cache resolution.  The returned surface is shared, don't draw on it."""
+        step = self.quantize(angle)
+        try:
+            images = self.rotations[source]
+        except KeyError:
+            images = self.rotations[source] = {}
+
+        img = images.get(step)
+        if img is None:
+            self.misses += 1
+            img = pygame.transform.rotate(source, step * self.resolution)
+            images[step] = img
+        else:
+            self.hits += 1
+        return img
+
+    def prewarm(self, source):
+        """Render every angle of the source up front, e.g. at load time, so
+        nothing has to be rotated during play."""
+        images = self.rotations.setdefault(source, {})
+        for step in range(self.steps):
+            if step not in images:
+                images[step] = pygame.transform.rotate(source, step * self.resolution)
+
+    def stats(self):
+        return {
+            'sources': len(self.rotations),
+            'images': sum(len(i) for i in self.rotations.values()),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
@@ -0,0 +1,88 @@
+"""
+Memoized factory for procedurally drawn sprites.  A sprite is described by
+its size, fill/colorkey and a tuple of pygame.draw calls, and every sprite
+with the same description shares one Surface:
+
+    img = shapes.factory.shape((8, 8), (
+              ('circle', (192,  10,  10), (4, 4), 4),
+              ('circle', (192, 128, 128), (4, 4), 2),
+          ), colorkey=BLACK)
+
+Shared surfaces must be treated as immutable, never draw on them.
+"""
+
+import weakref
+from collections import OrderedDict
+import pygame
+
+KEEP = 64   # recently used shapes kept alive even with no sprite using them
+
+
+#---- class: ShapeFactory -------------------------------------------------
+class ShapeFactory():
+    """
+    Builds each distinct shape once.  Surfaces are tracked weakly so live()
+    counts the unique surfaces actually in use; the most recently requested
+    ones are also held strongly so short-lived sprites (shots) don't cause
+    the same bitmap to be drawn over and over.
+    """
+
+    def __init__(self, keep=KEEP):
+        self.surfaces = weakref.WeakValueDictionary()
+        self.recent = OrderedDict()
+        self.keep = keep
+        self.created = 0
+        self.hits = 0
+
+    def shape(self, size, parts, fill=None, colorkey=None):
+        """Return a surface of the given size (int for square) with each
+        part, a tuple of (draw function name, color, *args), drawn in turn.
+        The surface is filled with fill, or with the colorkey if only that
+        is given.  All arguments must be hashable (tuples, not lists)."""
+        if isinstance(size, int):
+            size = (size, size)
+        key = (size, parts, fill, colorkey)
+        img = self.surfaces.get(key)
+        if img is None:
+            img = self.build(size, parts, fill, colorkey)
+            self.surfaces[key] = img
+            self.created += 1
+        else:
+            self.hits += 1
+
+        self.recent[key] = img
+        self.recent.move_to_end(key)
+        if len(self.recent) > self.keep:
+            self.recent.popitem(last=False)
+        return img
+
+    @staticmethod
+    def build(size, parts, fill, colorkey):
+        img = pygame.Surface(size)
+        if fill is not None:
+            img.fill(fill)
+        elif colorkey is not None:
+            img.fill(colorkey)
+        if colorkey is not None:
+            img.set_colorkey(colorkey)
+        for func, *args in parts:
+            getattr(pygame.draw, func)(img, *args)
+        return img
+
+    def polygon(self, size, pts, color, width=0, colorkey=None):
+        return self.shape(size, (('polygon', color, tuple(pts), width),), None, colorkey)
+
+    def circle(self, radius, color, colorkey=None):
+        size = radius * 2
+        return self.shape(size, (('circle', color, (radius, radius), radius),), None, colorkey)
+
+    def live(self):
+        """Number of unique shape surfaces currently alive."""
+        return len(self.surfaces)
+
+    def stats(self):
+        return {'live': self.live(), 'created': self.created, 'hits': self.hits}
+
+
+# the one factory shared by everything in the process
+factory = ShapeFactory()
@@ -0,0 +1,108 @@
+"""
+Cached text rendering for HUDs.  Rendering a string with a Font is slow
+compared to blitting it, and most HUD text is the same from one frame to
+the next, so rendered strings are kept in a small LRU cache:
+
+    img = text.cache.render(FONT, f"SCORE: {score}", True, WHITE, BLACK)
+
+Numbers that change every frame would just churn the cache.  A GlyphAtlas
+renders each character once and composes strings by blitting glyphs:
+
+    DIGITS = text.GlyphAtlas(FONT, True, WHITE, BLACK)
+    DIGITS.draw(DISPLAY, f"{score}", (x, y))
+"""
+
+from collections import OrderedDict
+import pygame
+
+MAXSIZE = 256
+
+
+#---- class: TextCache ----------------------------------------------------
+class TextCache():
+    """
+    Rendered strings keyed by (font, text, antialias, color, background),
+    least recently used strings are dropped once there are maxsize of them.
+    Returned surfaces are shared, don't draw on them.
+    """
+
+    def __init__(self, maxsize=MAXSIZE):
+        self.maxsize = maxsize
+        self.surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, font, text, antialias, color, background=None):
+        key = (font, text, antialias, color, background)
+        img = self.surfaces.get(key)
+        if img is None:
+            self.misses += 1
+            img = font.render(text, antialias, color, background)
+            self.surfaces[key] = img
+            if len(self.surfaces) > self.maxsize:
+                self.surfaces.popitem(last=False)
+        else:
+            self.hits += 1
+            self.surfaces.move_to_end(key)
+        return img
+
+    def clear(self):
+        self.surfaces.clear()
+
+    def stats(self):
+        return {'strings': len(self.surfaces), 'hits': self.hits, 'misses': self.misses}
+
+
+#---- class: GlyphAtlas ---------------------------------------------------
+class GlyphAtlas():
+    """
+    One pre-rendered surface per character, in a single font and color.
+    Strings are drawn glyph by glyph, so kerning is ignored; that is fine
+    for digits and monospaced fonts, which is what it is meant for.
+    Characters missing from the atlas are rendered the first time they are
+    used.
+    """
+
+    def __init__(self, font, antialias, color, background=None, chars='0123456789'):
+        self.font = font
+        self.antialias = antialias
+        self.color = color
+        self.background = background
+        self.height = font.get_height()
+        self.glyphs = {}
+        for c in chars:
+            self.glyph(c)
+
+    def glyph(self, c):
+        img = self.glyphs.get(c)
+        if img is None:
+            img = self.font.render(c, self.antialias, self.color, self.background)
+            self.glyphs[c] = img
+        return img
+
+    def width(self, text):
+        return sum(self.glyph(c).get_width() for c in text)
+
+    def size(self, text):
+        return (self.width(text), self.height)
+
+    def blits(self, text, pos):
+        """Return the (glyph, position) pairs that make up text."""
+        x, y = pos
+        blits = []
+        for c in text:
+            img = self.glyph(c)
+            blits.append((img, (x, y)))
+            x += img.get_width()
+        return blits
+
+    def draw(self, dest, text, pos):
+        """Blit text onto dest with its top left corner at pos, returns the
+        Rect that was drawn over."""
+        blits = self.blits(text, pos)
+        dest.blits(blits, False)
+        return pygame.Rect(pos, (self.width(text), self.height))
+
+
+# the one cache shared by everything in the process
+cache = TextCache()
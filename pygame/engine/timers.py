@@ -0,0 +1,78 @@
+"""
+Frame based timers, so games never have to block (pygame.time.wait) or
+count down and poll by hand.  Delays are in frames (ticks); the game calls
+tick() once per frame and the callbacks that are due run from there:
+
+    timers.scheduler.schedule(FPS//2, shot.kill)          # time to live
+    timers.scheduler.schedule(FPS*2, next_level)          # state transition
+    ...
+    timers.scheduler.tick()
+
+Timers are kept in a hashed timer wheel: a ring of slots indexed by due
+tick, so each tick only looks at one slot, and does work in proportion to
+the timers that expire (plus the few due a whole revolution later).
+"""
+
+SLOTS = 256
+
+
+#---- class: Timer --------------------------------------------------------
+class Timer():
+    """A scheduled callback, returned by TimerWheel.schedule()."""
+
+    def __init__(self, due, callback, args):
+        self.due = due
+        self.callback = callback
+        self.args = args
+        self.active = True
+
+    def cancel(self):
+        self.active = False
+
+
+#---- class: TimerWheel ---------------------------------------------------
+class TimerWheel():
+
+    def __init__(self, slots=SLOTS):
+        self.slots = [ [] for i in range(slots) ]
+        self.now = 0        # ticks so far
+
+    def __len__(self):
+        """Number of timers waiting, cancelled ones included."""
+        return sum(len(slot) for slot in self.slots)
+
+    def schedule(self, delay, callback, *args):
+        """Call callback(*args) in delay ticks (at least one)."""
+        timer = Timer(self.now + max(int(delay), 1), callback, args)
+        self.slots[timer.due % len(self.slots)].append(timer)
+        return timer
+
+    def tick(self):
+        """Advance by one tick and run the callbacks that are due, in the
+        order they were scheduled.  Returns how many ran."""
+        self.now += 1
+        slot = self.slots[self.now % len(self.slots)]
+        if not slot:
+            return 0
+        due = [ t for t in slot if t.due <= self.now ]
+        if len(due) == len(slot):
+            slot.clear()
+        else:
+            slot[:] = [ t for t in slot if t.due > self.now ]
+
+        count = 0
+        for t in due:
+            if t.active:
+                t.active = False
+                t.callback(*t.args)
+                count += 1
+        return count
+
+    def clear(self):
+        """Drop every timer."""
+        for slot in self.slots:
+            slot.clear()
+
+
+# the scheduler of the running game, ticked once per frame
+scheduler = TimerWheel()
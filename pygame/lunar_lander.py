@@ -2,6 +2,7 @@
 
 import pygame, sys, math, random
 from pygame.locals import *
+from engine import fonts, headless, loop, options, overlay, profiler, render, shapes, text, timers
 
 FPS = 30
 MAX_X = 600
@@ -12,6 +13,7 @@ BLACK     = (  0,   0,   0)
 GRAY  =     (128, 128, 128)
 DARKGRAY  = ( 40,  40,  40)
 RED       = (255,  40,  40)
+C_KEY     = (255,   0, 255)
 BGCOLOR = BLACK
 FONTSIZE = 15
 SHIP_ACCEL = 1
@@ -27,12 +29,14 @@ class Ship():
     crashed = False
     landed = False
     color = WHITE
+    wrap = True         # wrap around the screen edges
+    HALF_WIDTH = 10
 
     def __init__(self):
         self.reset()
 
-    def reset(self):
-        self.pos_x = MAX_X//2
+    def reset(self, x = MAX_X//2):
+        self.pos_x = x
         self.pos_y = 40
         self.vel_x = 0
         self.vel_y = 0
@@ -40,6 +44,7 @@ class Ship():
         self.crashed = False
         self.landed = False
         self.color = WHITE
+        self.last_pos = (self.pos_x, self.pos_y)    # before the last step
 
     def thrust_left(self):
         if self.fuel > 0:
@@ -62,20 +67,17 @@ class Ship():
         self.pos_x += self.vel_x
         self.pos_y -= self.vel_y
 
-        if self.pos_x > MAX_X:
-            self.pos_x = 0
-        if self.pos_x < 0:
-            self.pos_x = MAX_X
+        if self.wrap:
+            if self.pos_x > MAX_X:
+                self.pos_x = 0
+            if self.pos_x < 0:
+                self.pos_x = MAX_X
 
-    def detect_crash(self, seg):
-        last_pt = seg[0]
+    def detect_crash(self, planet):
         b = self.get_lower_bound()
-        for pt in seg[1:]:
-            if intersect(b[0], b[1], last_pt, pt):
-                self.crashed = True
-                self.color = RED
-                return self.crashed
-            last_pt = pt
+        if planet.peak_under(self.pos_x) < b[0][1]:
+            self.crashed = True
+            self.color = RED
         return self.crashed
 
     def detect_landing(self, plat):
@@ -97,30 +99,40 @@ class Ship():
 
 
     def get_bounds(self):
-        return ( (self.pos_x-10, self.pos_y-12),
-            (self.pos_x+10, self.pos_y-12),
-            (self.pos_x+10, self.pos_y+6),
-            (self.pos_x-10, self.pos_y+6))
+        w = self.HALF_WIDTH
+        return ( (self.pos_x-w, self.pos_y-12),
+            (self.pos_x+w, self.pos_y-12),
+            (self.pos_x+w, self.pos_y+6),
+            (self.pos_x-w, self.pos_y+6))
 
     def get_lower_bound(self):
         b = self.get_bounds()
         return (b[2], b[3])
 
-    def draw(self, thrust = False):
-        x = int(self.pos_x)
-        y = int(self.pos_y)
+    def get_image(self, thrust):
+        """Image of the ship, centered on (13, 13)."""
+        x = y = 13
+        parts = [
+            ('circle', self.color, (x, y-4), 8),
+            ('line', self.color, (x, y-4), (x+10, y-4+8), 3),
+            ('line', self.color, (x, y-4), (x-10, y-4+8), 3),
+        ]
         if thrust and not self.crashed:
-            pygame.draw.polygon(DISPLAYSURF, RED, ((x-3, y+3), (x, y+12), (x+3, y+3)) )
-        pygame.draw.circle(DISPLAYSURF, self.color, (x, y-4), 8)
-        pygame.draw.line(DISPLAYSURF, self.color, (x, y-4), (x+10, y-4+8), 3)
-        pygame.draw.line(DISPLAYSURF, self.color, (x, y-4), (x-10, y-4+8), 3)
+            parts.insert(0, ('polygon', RED, ((x-3, y+3), (x, y+12), (x+3, y+3))))
+        return shapes.factory.shape((26, 26), tuple(parts), colorkey=C_KEY)
 
-        c = WHITE
+    def draw(self, thrust = False, camera_x = 0, pos = None):
+        if pos is None:
+            pos = (self.pos_x, self.pos_y)
+        x = int(pos[0] - camera_x)
+        y = int(pos[1])
+        renderer.blit('ship', self.get_image(thrust), (x-13, y-13))
+
+        glyphs = HUD_GLYPHS
         if self.fuel < 50:
-            c = RED
+            glyphs = HUD_GLYPHS_LOW
         msg = 'FUEL %3d     ALT %3d     VERT SPD %3d     HORZ SPD %3d'%(self.fuel, MAX_Y-self.pos_y, self.vel_y, self.vel_x)
-        msg_disp = BASICFONT.render(msg, True, c, BLACK)
-        DISPLAYSURF.blit(msg_disp, (25, MAX_Y-FONTSIZE-5))
+        renderer.glyphs('status', glyphs, msg, (25, MAX_Y-FONTSIZE-5))
 
     def animate_crash(self):
         for i in range(1, FPS):
@@ -160,11 +172,145 @@ class Planet():
             self.segments.append( (x,y) )
 
         self.platform = (self.segments[self.platform_seg-1], self.segments[self.platform_seg])
+        self.compile_heightfield()
+
+    def compile_heightfield(self):
+        """Height (y) of the terrain at every pixel column, and the highest
+        point under a ship centered on each column, so detecting a crash is
+        a lookup instead of a walk over all the segments."""
+        heights = [MAX_Y] * (MAX_X + 1)
+        for (x1, y1), (x2, y2) in zip(self.segments, self.segments[1:]):
+            for x in range(max(x1, 0), min(x2, MAX_X) + 1):
+                heights[x] = y1 + (y2 - y1) * (x - x1) / (x2 - x1)
+        # a ship at x, rounded to a column (see peak_under), covers x-w .. x+w
+        w = Ship.HALF_WIDTH
+        self.heights = heights
+        self.peaks = [ min(heights[max(x-w, 0):x+w+1]) for x in range(MAX_X + 1) ]
+
+    def peak_under(self, x):
+        """Highest point (smallest y) of the terrain under a ship at x."""
+        x = min(max(math.floor(x + 0.5), 0), MAX_X)
+        return self.peaks[x]
+
+    def platform_under(self, x):
+        return self.platform
+
+
+    def draw(self, surf):
+        pygame.draw.lines(surf, WHITE, False, self.segments, 1)
+        pygame.draw.line(surf, RED, self.platform[0], self.platform[1], 4)
+
+    def get_background(self):
+        """The terrain doesn't move, so it is drawn into the background."""
+        bg = pygame.Surface((MAX_X, MAX_Y)).convert()
+        bg.fill(BGCOLOR)
+        self.draw(bg)
+        return bg
+
 
+####################################
+class Chunk():
+    """A piece of endless terrain: its own layer surface, the highest point
+    under a ship on each of its columns and its landing platform."""
+
+    def __init__(self, number, x, image, peaks, platform):
+        self.number = number
+        self.x = x
+        self.image = image
+        self.peaks = peaks
+        self.platform = platform
 
-    def draw(self):
-        pygame.draw.lines(DISPLAYSURF, WHITE, False, self.segments, 1)
-        pygame.draw.line(DISPLAYSURF, RED, self.platform[0], self.platform[1], 4)
+
+####################################
+class Terrain():
+    """
+    Endless terrain for --endless mode.  It is generated in chunks of
+    CHUNK_SEGMENTS segments as the camera comes near and dropped again when
+    the camera is far away, so only a few chunks exist at any time.  Every
+    point is seeded from the terrain seed and its number, so flying back
+    over a dropped chunk brings back the same landscape.  Each chunk has
+    one landing platform.
+    """
+
+    seg_size = Planet.seg_size
+    CHUNK_SEGMENTS = 15
+    CHUNK_W = CHUNK_SEGMENTS * seg_size
+    MARGIN = CHUNK_W // 2     # how far out of view chunks are kept
+
+    def __init__(self, seed):
+        self.seed = seed
+        self.chunks = {}
+        self.generated = 0
+
+    def platform_point(self, k):
+        """Number of the point at the right end of chunk k's platform."""
+        rng = random.Random(f"{self.seed}/{k}")
+        return k*self.CHUNK_SEGMENTS + rng.randint(2, self.CHUNK_SEGMENTS-2)
+
+    def height(self, i):
+        """y of terrain point i."""
+        if i == self.platform_point(i // self.CHUNK_SEGMENTS):
+            return self.height(i-1)
+        rand = random.Random(self.seed * 1000003 + i).randint(-20, 50)
+        return int(80 * math.sin(120 * i + 50) + rand + 400)
+
+    def make_chunk(self, k):
+        n, size = self.CHUNK_SEGMENTS, self.seg_size
+        x0 = k * self.CHUNK_W
+
+        # a point more on each side, for the heightfield near the edges
+        first = k*n - 1
+        points = [ (i*size, self.height(i)) for i in range(first, (k+1)*n + 2) ]
+        heights = []
+        for (x1, y1), (x2, y2) in zip(points, points[1:]):
+            heights.extend( y1 + (y2 - y1) * (x - x1) / (x2 - x1) for x in range(x1, x2) )
+        w = Ship.HALF_WIDTH
+        start = x0 - points[0][0]
+        peaks = [ min(heights[x-w:x+w+1]) for x in range(start, start + self.CHUNK_W) ]
+
+        p = self.platform_point(k) - first
+        platform = (points[p-1], points[p])
+
+        image = pygame.Surface((self.CHUNK_W, MAX_Y)).convert()
+        image.fill(BGCOLOR)
+        image.set_colorkey(BGCOLOR)
+        pygame.draw.lines(image, WHITE, False, [ (x-x0, y) for x, y in points ], 1)
+        pygame.draw.line(image, RED, (platform[0][0]-x0, platform[0][1]),
+                         (platform[1][0]-x0, platform[1][1]), 4)
+        self.generated += 1
+        return Chunk(k, x0, image, peaks, platform)
+
+    def chunk_at(self, x):
+        k = int(x // self.CHUNK_W)
+        c = self.chunks.get(k)
+        if c is None:
+            c = self.chunks[k] = self.make_chunk(k)
+        return c
+
+    def update(self, camera_x):
+        """Generate the chunks around the view, drop the others."""
+        first = int((camera_x - self.MARGIN) // self.CHUNK_W)
+        last = int((camera_x + MAX_X + self.MARGIN) // self.CHUNK_W)
+        for k in list(self.chunks):
+            if not first <= k <= last:
+                del self.chunks[k]
+        for k in range(first, last + 1):
+            self.chunk_at(k * self.CHUNK_W)
+
+    def peak_under(self, x):
+        x = math.floor(x + 0.5)     # the column, as in Planet.peak_under
+        c = self.chunk_at(x)
+        return c.peaks[x - c.x]
+
+    def platform_under(self, x):
+        return self.chunk_at(x).platform
+
+    def draw(self, renderer, camera_x):
+        """Queue the chunks in view."""
+        camera_x = int(camera_x)
+        for k, c in sorted(self.chunks.items()):
+            if c.x < camera_x + MAX_X and c.x + self.CHUNK_W > camera_x:
+                renderer.blit(('terrain', k), c.image, (c.x - camera_x, 0))
 
 
 ####################################
@@ -173,116 +319,164 @@ def terminate():
     sys.exit()
 
 def advance_frame():
-    pygame.display.update()
-    FPSCLOCK.tick(FPS)
+    renderer.update()
 
-#http://bryceboe.com/2006/10/23/line-segment-intersection-algorithm/
-def ccw(A,B,C):
-    #return (C.y-A.y)*(B.x-A.x) > (B.y-A.y)*(C.x-A.x)
-    return (C[1]-A[1])*(B[0]-A[0]) > (B[1]-A[1])*(C[0]-A[0])
+def next_level():
+    if OPTIONS.endless:
+        s.reset(s.pos_x)
+    else:
+        p.generate_level()
+        renderer.set_background(p.get_background())
+        s.reset()
 
-def intersect(A,B,C,D):
-    return ccw(A,C,D) != ccw(B,C,D) and ccw(A,B,C) != ccw(A,B,D)
+def relaunch():
+    s.reset(s.pos_x if OPTIONS.endless else MAX_X//2)
 
+def game_over():
+    global gameover
+    gameover = True
 
 
 ####################################
 # main
-pygame.init()
-FPSCLOCK = pygame.time.Clock()
-DISPLAYSURF = pygame.display.set_mode((MAX_X, MAX_Y))
-BASICFONT = pygame.font.SysFont('courier', FONTSIZE)
-pygame.display.set_caption('Lunar Lander')
-random.seed()
-
-s = Ship()
-p = Planet()
-level = 1
-score = 0
-lives = 2
-
-# use name-value pairs (dictionary?) for this?
-cmdLeft = False
-cmdRight = False
-cmdThrust = False
-cmdBrake = False
-
-gameover = False
-
-# MAIN GAME LOOP
-while not gameover:
-
-    #event handling
-    for event in pygame.event.get():
-        if event.type == QUIT:         terminate()
-
-        elif event.type == KEYDOWN:
-            if event.key == K_UP:      cmdThrust = True
-            elif event.key == K_LEFT:  cmdLeft = True
-            elif event.key == K_RIGHT: cmdRight = True
-            elif event.key == K_r:
-                score = 0
-                level = 1
-                lives = 3
-                p.generate_level()
-                s.reset()
-                crashed = True
-
-        elif event.type == KEYUP:
-            if event.key == K_ESCAPE:  terminate()
-            elif event.key == K_UP:    cmdThrust = False
-            elif event.key == K_LEFT:  cmdLeft = False
-            elif event.key == K_RIGHT: cmdRight = False
-
-
-    if not s.landed and not s.crashed:
-        # update game state
-        if cmdThrust:   s.thrust()
-        elif cmdLeft:   s.thrust_left()
-        elif cmdRight:  s.thrust_right()
-
-        s.update()
-
-        s.detect_landing(p.platform)
-        s.detect_crash(p.segments)
-
-
-    # draw frame
-    DISPLAYSURF.fill(BGCOLOR)
-
-    score_msg = "LEVEL: %d    SCORE: %d    SHIPS: %d"%(level, score, lives)
-    score_msg_disp = BASICFONT.render(score_msg, True, WHITE, BLACK)
-    DISPLAYSURF.blit(score_msg_disp, (10, 10))
-
-    if s.crashed:
-        crash_msg = "YOU HAVE CRASHED!"
-        crash_msg_disp = BASICFONT.render(crash_msg, True, RED, BLACK)
-        DISPLAYSURF.blit(crash_msg_disp, (225, 95))
-        lives -= 1
-        if lives < 0:
-            gameover = True
-
-    if s.landed:
-        crash_msg = "Success, you have safely landed!"
-        crash_msg_disp = BASICFONT.render(crash_msg, True, WHITE, BLACK)
-        DISPLAYSURF.blit(crash_msg_disp, (150, 80))
-        score += level * 10
-        score += s.fuel
-        level += 1
-
-    s.draw(cmdThrust)
-    p.draw()
-
-    advance_frame()
-
-    if s.landed:
-        pygame.time.wait(2000)
-        p.generate_level()
-        s.reset()
-
-    if s.crashed:
-        pygame.time.wait(2000)
-        s.reset()
-
-
-terminate()
+if __name__ == '__main__':
+    parser = options.create_parser('Lunar Lander')
+    parser.add_argument('--endless', action='store_true',
+                        help='fly over endless scrolling terrain, --seed picks the landscape')
+    OPTIONS = options.parse(parser)
+    pygame.init()
+    DISPLAYSURF = pygame.display.set_mode((MAX_X, MAX_Y))
+    BASICFONT = fonts.registry.get('courier', FONTSIZE)
+    HUD_GLYPHS = text.GlyphAtlas(BASICFONT, True, WHITE, BLACK)
+    HUD_GLYPHS_LOW = text.GlyphAtlas(BASICFONT, True, RED, BLACK)
+    DEBUGFONT = fonts.registry.get('courier', 12)
+    pygame.display.set_caption('Lunar Lander')
+    random.seed(OPTIONS.seed)
+
+    s = Ship()
+    if OPTIONS.endless:
+        # the terrain scrolls with the ship and is drawn every frame
+        seed = OPTIONS.seed if OPTIONS.seed is not None else random.randrange(1 << 30)
+        p = Terrain(seed)
+        s.wrap = False
+        renderer = render.Renderer(DISPLAYSURF, BGCOLOR, OPTIONS.dirty, enabled=not OPTIONS.no_draw)
+    else:
+        p = Planet()
+        renderer = render.Renderer(DISPLAYSURF, p.get_background(), OPTIONS.dirty, enabled=not OPTIONS.no_draw)
+    camera_x = 0
+    timestep = loop.FixedStep(FPS, realtime=not OPTIONS.headless)
+    driver = headless.Driver(OPTIONS, keys=(K_UP, K_LEFT, K_RIGHT), timestep=timestep)
+    profile_overlay = overlay.Overlay(FPS, pos=(10, 60))
+    level = 1
+    score = 0
+    lives = 2
+
+    # use name-value pairs (dictionary?) for this?
+    cmdLeft = False
+    cmdRight = False
+    cmdThrust = False
+    cmdBrake = False
+
+    gameover = False
+
+    # MAIN GAME LOOP
+    while not gameover:
+
+        #event handling
+        profiler.frames.begin()
+        driver.frame()
+        for event in driver.events():
+            profile_overlay.handle_event(event)
+            if event.type == QUIT:         terminate()
+
+            elif event.type == KEYDOWN:
+                if event.key == K_UP:      cmdThrust = True
+                elif event.key == K_LEFT:  cmdLeft = True
+                elif event.key == K_RIGHT: cmdRight = True
+                elif event.key == K_r:
+                    score = 0
+                    level = 1
+                    lives = 3
+                    timers.scheduler.clear()
+                    next_level()
+
+            elif event.type == KEYUP:
+                if event.key == K_ESCAPE:  terminate()
+                elif event.key == K_UP:    cmdThrust = False
+                elif event.key == K_LEFT:  cmdLeft = False
+                elif event.key == K_RIGHT: cmdRight = False
+        profiler.frames.mark('events')
+
+
+        # update game state in fixed steps
+        for step in timestep.steps():
+            s.last_pos = (s.pos_x, s.pos_y)
+            if not s.landed and not s.crashed:
+                # update game state
+                if cmdThrust:   s.thrust()
+                elif cmdLeft:   s.thrust_left()
+                elif cmdRight:  s.thrust_right()
+
+                s.update()
+                profiler.frames.mark('update')
+
+                s.detect_landing(p.platform_under(s.pos_x))
+                s.detect_crash(p)
+                profiler.frames.mark('collide')
+
+                # show the outcome for two seconds, then carry on
+                if s.crashed:
+                    lives -= 1
+                    if lives < 0:
+                        timers.scheduler.schedule(FPS*2, game_over)
+                    else:
+                        timers.scheduler.schedule(FPS*2, relaunch)
+                elif s.landed:
+                    score += level * 10
+                    score += s.fuel
+                    level += 1
+                    timers.scheduler.schedule(FPS*2, next_level)
+
+            timers.scheduler.tick()
+            profiler.frames.mark('update')
+
+        # the ship is drawn between where it was on the last two steps
+        ship_pos = loop.blend(s.last_pos, (s.pos_x, s.pos_y), timestep.alpha)
+        if OPTIONS.endless:
+            camera_x = ship_pos[0] - MAX_X//2
+            p.update(camera_x)
+            p.draw(renderer, camera_x)
+
+
+        # draw frame
+        score_msg = "LEVEL: %d    SCORE: %d    SHIPS: %d"%(level, score, lives)
+        score_msg_disp = text.cache.render(BASICFONT, score_msg, True, WHITE, BLACK)
+        renderer.blit('score', score_msg_disp, (10, 10))
+
+        if s.crashed:
+            crash_msg = "YOU HAVE CRASHED!"
+            crash_msg_disp = text.cache.render(BASICFONT, crash_msg, True, RED, BLACK)
+            renderer.blit('message', crash_msg_disp, (225, 95))
+
+        if s.landed:
+            crash_msg = "Success, you have safely landed!"
+            crash_msg_disp = text.cache.render(BASICFONT, crash_msg, True, WHITE, BLACK)
+            renderer.blit('message', crash_msg_disp, (150, 80))
+
+        s.draw(cmdThrust, camera_x, ship_pos)
+        profiler.frames.mark('draw')
+
+        if OPTIONS.debug:
+            debug_msg = renderer.stats_text()
+            if OPTIONS.endless:
+                debug_msg += f"  CHUNKS: {len(p.chunks)}"
+            debug_img = DEBUGFONT.render(debug_msg, True, GRAY, BLACK)
+            renderer.blit('debug', debug_img, (10, 30))
+
+        profile_overlay.draw(renderer)
+        profiler.frames.mark('hud')
+        advance_frame()
+        profiler.frames.end('flip')
+
+
+    terminate()
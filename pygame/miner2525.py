@@ -1,8 +1,11 @@
 #!/usr/bin/env python
 
 import pygame, sys, math, random
+import numpy
 from pygame.locals import *
+from engine import ecs, fonts, headless, loop, options, overlay, profiler, render, rotation, shapes, text
 
+DEBUG = False
 FPS = 30
 #MAX_X, MAX_Y = 1024, 768   # XGA
 #MAX_X, MAX_Y = 1280, 720   # HD (720p)
@@ -20,6 +23,9 @@ BLUE      = (64,   64, 255)
 VIOLET    = (255,   0, 255)
 BGCOLOR = BLACK
 
+ROTATIONS = rotation.RotationCache(resolution=10)
+RADAR_REFRESH = 2   # redraw the radar blips every n frames
+
 
 #-----------------------------------------------------------------------------
 class GameObject(pygame.sprite.Sprite):
@@ -31,6 +37,7 @@ class GameObject(pygame.sprite.Sprite):
         self.pos = pos
         self.vel = vel
         self.angle = 0
+        self.drawn_angle = None
         self.drag = 0.9
 
     def __str__(self):
@@ -44,16 +51,21 @@ class GameObject(pygame.sprite.Sprite):
     def load_sprite(self, width, pts=None, color=WHITE):
         if pts == None:
             pts = ( (width-1, width-1), (0, width-1), (0, 0), (width-1, 0) )
-        img = pygame.Surface((width, width))
-        img.fill(VIOLET)
-        img.set_colorkey(VIOLET)
-        pygame.draw.polygon(img, color, pts, 4)
+        img = shapes.factory.polygon(width, pts, color, 4, colorkey=VIOLET)
         self.image_orig = img
         self.image = img
+        self.rect = img.get_rect()
+        self.drawn_angle = None
+
+    def rotate_image(self):
+        """Point the image along self.angle, only when the angle changed."""
+        if self.angle != self.drawn_angle:
+            self.image = ROTATIONS.rotate(self.image_orig, -self.angle)
+            self.rect.size = self.image.get_size()
+            self.drawn_angle = self.angle
 
     def prep_for_draw(self, offset=None):
-        self.image = pygame.transform.rotate(self.image_orig, -self.angle)
-        self.rect = self.image.get_rect()
+        self.rotate_image()
         x = MAX_X/2 + self.pos[0] - offset[0]
         y = MAX_Y/2 + self.pos[1] - offset[1]
         self.rect.center = (x, y)
@@ -75,6 +87,7 @@ class Player(GameObject):
     def __init__(self, pos=(0,0)):
         super().__init__(self)
         self.load_sprite()
+        ROTATIONS.prewarm(self.image_orig)
         self.pos = pos
         self.angle = 270
 
@@ -96,26 +109,10 @@ class Player(GameObject):
         super().update(self)
 
         # prep for draw
-        self.image = pygame.transform.rotate(self.image_orig, -self.angle)
-        self.rect = self.image.get_rect()
+        self.rotate_image()
         self.rect.center = [ MAX_X/2, MAX_Y/2 ]
 
 
-#-----------------------------------------------------------------------------
-class Asteroid(GameObject):
-
-    def __init__(self, pos=(0,0), vel=(0,0)):
-        super().__init__(pos, vel)
-        self.load_sprite()
-
-    def load_sprite(self):
-        super().load_sprite(32, None, RED)
-
-    def update(self, coords):
-        super().update(self)
-        self.prep_for_draw(coords)
-
-
 #-----------------------------------------------------------------------------
 class Station(GameObject):
 
@@ -132,47 +129,72 @@ class Station(GameObject):
 
 
 #-----------------------------------------------------------------------------
-class PolarObject(GameObject):
-    """Extension of the base GameObject to use polar coordinates."""
-    #TODO add a center position (pos) and refactor into GameObject.
-    def __init__(self, angle=0, radius=100, vel=1):
-        super().__init__(self)
-        self.angle = angle
-        self.radius = radius
-        self.vel = vel
-
-    def __str__(self):
-        return f"(angle={self.angle:.1f}, rad={self.radius:.1f}, vel={self.vel:.1f})"
+class Radar():
+    """Radar overlay showing objects around the player.  The static parts
+    (background disc, outer ring, viewport and crosshairs) are drawn once;
+    blips are redrawn into a reused surface every refresh frames."""
 
-    def update(self):
-        self.angle += self.vel
-
-    def get_xy(self):
-        x = self.radius * math.cos(math.radians(self.angle))
-        y = self.radius * math.sin(math.radians(self.angle))
-        return (x, y)
+    SCALE = 20      # world pixels per radar pixel
+    RANGE = 4000    # objects further away than this aren't shown
+    MARGIN = 8      # room for blips sticking out past the outer ring
 
-
-#-----------------------------------------------------------------------------
-class PolarAsteroid(PolarObject):
-
-    def __init__(self, angle=0, radius=100, vel=1):
-        super().__init__(angle, radius, vel)
-        self.load_sprite()
-
-    def load_sprite(self):
-        super().load_sprite(32, None, YELLOW)
-
-    def update(self, coords):
-        super().update()
-        self.pos = self.get_xy()
-
-        # prep for draw
-        #self.image = pygame.transform.rotate(self.image_orig, -self.angle)
-        self.rect = self.image.get_rect()
-        x = MAX_X/2 + self.pos[0] - coords[0]
-        y = MAX_Y/2 + self.pos[1] - coords[1]
-        self.rect.center = (x, y)
+    def __init__(self, pos=(10, 10), radius=200, refresh=RADAR_REFRESH):
+        self.pos = pos
+        self.r = radius
+        self.refresh = refresh
+        self.frame = refresh - 1    # draw blips on the first update
+        self.chrome = self.draw_chrome()
+        size = 2 * (radius + self.MARGIN)
+        self.blips = pygame.Surface((size, size))
+        self.blips.set_colorkey(VIOLET)
+        self.blips.fill(VIOLET)
+        self.blips_pos = (pos[0] - self.MARGIN, pos[1] - self.MARGIN)
+        self.blips_changed = True
+
+    def draw_chrome(self):
+        r = self.r
+        s = pygame.Surface((r*2, r*2))
+        s.set_alpha(192)
+        s.fill(VIOLET)
+        s.set_colorkey(VIOLET)
+        pygame.draw.circle(s, DARKGRAY, (r,r), r)               # background
+        pygame.draw.circle(s, GRAY, (r,r), r, width=2)      # outer circle
+        #pygame.draw.circle(s, GRAY, (r,r), 50, width=1)     # inner circle
+        pts =[
+            (r-MAX_X/2/self.SCALE, r-MAX_Y/2/self.SCALE),
+            (r+MAX_X/2/self.SCALE, r-MAX_Y/2/self.SCALE),
+            (r+MAX_X/2/self.SCALE, r+MAX_Y/2/self.SCALE),
+            (r-MAX_X/2/self.SCALE, r+MAX_Y/2/self.SCALE)
+        ]
+        pygame.draw.polygon(s, GRAY, pts, 2)  # rectangle to show the viewport
+        pygame.draw.line(s, GRAY, (r-10,r), (r+10,r), width=1)  # crosshairs
+        pygame.draw.line(s, GRAY, (r,r-10), (r,r+10), width=1)
+        return s
+
+    def update(self, player, layers):
+        """layers is a list of (positions, color, blip radius)."""
+        #TODO show arrow towards station when it goes off the radar (?)
+        self.frame += 1
+        if self.frame < self.refresh:
+            return
+        self.frame = 0
+
+        self.blips.fill(VIOLET)
+        center = self.r + self.MARGIN
+        range_sq = self.RANGE ** 2
+        for positions, color, size in layers:
+            d = numpy.asarray(positions, dtype=float).reshape(-1, 2) - player.pos
+            near = d[(d*d).sum(axis=1) < range_sq] / self.SCALE + center
+            for x, y in zip(near[:, 0].tolist(), near[:, 1].tolist()):
+                pygame.draw.circle(self.blips, color, (x, y), size, width=2)
+        self.blips_changed = True
+
+    def draw(self, renderer):
+        renderer.blit('radar', self.chrome, self.pos)
+        renderer.blit('radar blips', self.blips, self.blips_pos)
+        if self.blips_changed:
+            renderer.invalidate(self.blips.get_rect(topleft=self.blips_pos))
+            self.blips_changed = False
 
 
 ##########################################################################
@@ -182,17 +204,32 @@ def terminate():
     sys.exit()
 
 
-def init(max_x, max_y, title = 'pyGame Template'):
+def init(max_x, max_y, title = 'pyGame Template', seed = None):
     pygame.init()
     clk = pygame.time.Clock()
     disp = pygame.display.set_mode((max_x, max_y))
     pygame.display.set_caption(title)
-    random.seed()
+    random.seed(seed)
     return disp, clk
 
 
-def handle_events(cmd):
-    for event in pygame.event.get():
+def asteroid_image(color):
+    return shapes.factory.polygon(32, ((31, 31), (0, 31), (0, 0), (31, 0)), color, 4,
+                                  colorkey=VIOLET)
+
+
+def orbit(world):
+    """System putting the asteroids that orbit the station (radius > 0) on
+    their circle, at their angle."""
+    radius = world.radius
+    rows = radius > 0
+    a = numpy.radians(world.angle[rows])
+    world.pos[rows] = numpy.column_stack((numpy.cos(a), numpy.sin(a))) * radius[rows, None]
+
+
+def handle_events(cmd, events, profile_overlay):
+    for event in events:
+        profile_overlay.handle_event(event)
 
         if event.type == QUIT:
             cmd['quit'] = True
@@ -216,52 +253,25 @@ def handle_events(cmd):
                 cmd['thrust'] = 0
 
 
-def draw_hud(disp, player):
+def draw_hud(renderer, player, glyphs):
     #pygame.draw.circle(disp, DARKGRAY, (MAX_X/2, MAX_Y/2), 500, width=1)
-    FONT = pygame.font.SysFont('arial', 20)
-    msg_disp = FONT.render(f"({player.pos[0]:.0f}, {player.pos[1]:.0f})", True, GRAY, BLACK)
-    w = msg_disp.get_width()
-    disp.blit(msg_disp, (210-w/2, 420))
-
-
-def draw_radar_hud(disp):
-    r = 200
-    s = pygame.Surface((r*2, r*2))
-    s.set_alpha(192)
-    s.fill(VIOLET)
-    s.set_colorkey(VIOLET)
-    pygame.draw.circle(s, DARKGRAY, (r,r), r)               # background
-    pygame.draw.circle(s, GRAY, (r,r), r, width=2)      # outer circle
-    #pygame.draw.circle(s, GRAY, (r,r), 50, width=1)     # inner circle
-    pts =[
-        (r-MAX_X/2/20, r-MAX_Y/2/20),
-        (r+MAX_X/2/20, r-MAX_Y/2/20),
-        (r+MAX_X/2/20, r+MAX_Y/2/20),
-        (r-MAX_X/2/20, r+MAX_Y/2/20)
-    ]
-    pygame.draw.polygon(s, GRAY, pts, 2)  # rectangle to show the viewport
-    pygame.draw.line(s, GRAY, (r-10,r), (r+10,r), width=1)  # crosshairs
-    pygame.draw.line(s, GRAY, (r,r-10), (r,r+10), width=1)
-    disp.blit(s, (10, 10))
-
-
-def draw_radar_objects(disp, player, objects, color, r):
-    #TODO show arrow towards station when it goes off the radar (?)
-    scale = 10
-    for obj in objects:
-        if obj.get_distance_from(player.pos) < 4000:
-            x = 210 + (obj.pos[0] - player.pos[0]) / 20
-            y = 210 + (obj.pos[1] - player.pos[1]) / 20
-            pygame.draw.circle(disp, color, (x, y), r, width=2)
-
+    msg = f"({player.pos[0]:.0f}, {player.pos[1]:.0f})"
+    w = glyphs.width(msg)
+    renderer.glyphs('hud', glyphs, msg, (210-w/2, 420))
 
 
 #---- main() -------------------------------------------------------------
 def main():
+    parser = options.create_parser('Miner 2525')
+    parser.add_argument('--asteroids', type=int, default=8, metavar='N',
+                        help='number of asteroids orbiting the station')
+    opts = options.parse(parser)
+    debug = DEBUG or opts.debug
     commands = {'quit': False, 'left': 0, 'right': 0, 'thrust': 0, 'fire': 0}
 
-    DISPLAY, CLOCK = init(MAX_X, MAX_Y)
-    FONT = pygame.font.SysFont('arial', 20)
+    DISPLAY, CLOCK = init(MAX_X, MAX_Y, seed=opts.seed)
+    FONT = fonts.registry.get('arial', 20)
+    HUD_GLYPHS = text.GlyphAtlas(FONT, True, GRAY, BLACK)
 
     player = Player()
     allsprites = pygame.sprite.Group(player)
@@ -269,50 +279,73 @@ def main():
     station = Station()
     allsprites.add(station)
 
-    asteroids = pygame.sprite.Group()
-    asteroids.add( Asteroid(vel=(-1,0.5), pos=(300,-250)) )
-    asteroids.add( Asteroid(vel=(1,0.5)) )
-
-    for n in range(8):
-        a = random.randint(0, 360)
-        r = random.randint(600, 1000)
-        v = random.randint(25, 150) / 100.0
-        p = PolarAsteroid(angle=a, radius=r, vel=v)
-        asteroids.add(p)
-
-    allsprites.add(asteroids)
+    # the asteroids are entities, radius is that of their orbit, 0 for drifting
+    asteroids = ecs.World(capacity=opts.asteroids + 2, radius=float)
+    drifting = asteroids.add_kind([asteroid_image(RED)])
+    orbiting = asteroids.add_kind([asteroid_image(YELLOW)])
+    asteroids.spawn(2, pos=((300, -250), (0, 0)), vel=((-1, 0.5), (1, 0.5)), kind=drifting)
+
+    orbits = [ (random.randint(0, 360), random.randint(600, 1000), random.randint(25, 150) / 100.0)
+               for n in range(opts.asteroids) ]
+    if orbits:
+        angle, radius, spin = zip(*orbits)
+        asteroids.spawn(len(orbits), angle=angle, radius=radius, spin=spin, kind=orbiting)
+    orbit(asteroids)
+    asteroid_sprites = ecs.SpriteGroup(asteroids, screen=DISPLAY.get_rect())
+    radar = Radar()
+    renderer = render.Renderer(DISPLAY, BGCOLOR, opts.dirty, enabled=not opts.no_draw)
+    timestep = loop.FixedStep(FPS, clock=CLOCK, realtime=not opts.headless)
+    driver = headless.Driver(opts, keys=(K_LEFT, K_RIGHT, K_UP), timestep=timestep)
+    profile_overlay = overlay.Overlay(FPS, pos=(10, MAX_Y - 130))
 
     #main game loop
     while True:
 
-        handle_events(commands)
+        profiler.frames.begin()
+        driver.frame()
+        handle_events(commands, driver.events(), profile_overlay)
 
         if commands['quit']:
             terminate()
+        profiler.frames.mark('events')
 
-        player.update(commands)
-        asteroids.update(player.pos)
-        station.update(player.pos)
+        for step in timestep.steps():
+            timestep.snapshot(allsprites, asteroid_sprites)
+            player.update(commands)
+            ecs.integrate(asteroids)
+            orbit(asteroids)
+            station.update(player.pos)
+            asteroid_sprites.sync((player.pos[0] - MAX_X/2, player.pos[1] - MAX_Y/2))
+            profiler.frames.mark('update')
 
         # draw main screen
-        DISPLAY.fill(BGCOLOR)
-        allsprites.draw(DISPLAY)
-
-        draw_hud(DISPLAY, player)
-        draw_radar_hud(DISPLAY)
-        draw_radar_objects(DISPLAY, player, asteroids.sprites(), RED, 2)
-        draw_radar_objects(DISPLAY, player, [station], BLUE, 6)
-        #draw_radar_objects(DISPLAY, player, [player], WHITE, 3)
-
-        i = 0
-        for s in allsprites.sprites():
-            msg_disp = FONT.render(f"{i}: {s}", True, GRAY, BLACK)
-            #DISPLAY.blit(msg_disp, (10, 10+i*30))
+        timestep.draw(renderer, allsprites)
+        timestep.draw(renderer, asteroid_sprites)
+        profiler.frames.mark('draw')
+
+        draw_hud(renderer, player, HUD_GLYPHS)
+        radar.update(player, ( (asteroids.pos, RED, 2), (station.pos, BLUE, 6) ))
+        radar.draw(renderer)
+
+        if debug is True:
+            i = 0
+            for s in allsprites.sprites():
+                msg_disp = FONT.render(f"{i}: {s}", True, GRAY, BLACK)
+                renderer.blit(('debug', i), msg_disp, (10, 10+i*30))
+                i += 1
+            msg = f"{i}: {len(asteroids)} asteroids, {len(asteroid_sprites)} on screen"
+            msg_disp = FONT.render(msg, True, GRAY, BLACK)
+            renderer.blit(('debug', i), msg_disp, (10, 10+i*30))
             i += 1
+            msg_disp = FONT.render(renderer.stats_text(), True, GRAY, BLACK)
+            renderer.blit('render', msg_disp, (10, 10+i*30))
+
+        profile_overlay.draw(renderer)
+        profiler.frames.mark('hud')
 
         # advance game frame
-        pygame.display.update()
-        CLOCK.tick(FPS)
+        renderer.update()
+        profiler.frames.end('flip')
 
 
     terminate()
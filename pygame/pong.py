@@ -2,6 +2,7 @@
 
 import pygame, sys, math, random
 from pygame.locals import *
+from engine import checksum, fonts, headless, loop, options, overlay, profiler, render, shapes, text
 
 FPS = 60
 MAX_X = 800
@@ -29,12 +30,11 @@ class Paddle(pygame.sprite.Sprite):
         self.speed = 8
 
     def load_sprite(self, color):
-        self.image = pygame.Surface((16, 80))
-        self.image.fill(BGCOLOR)
-        self.image.set_colorkey(BGCOLOR)
-        pygame.draw.rect(self.image, color, (0, 8, 16, 64))
-        pygame.draw.circle(self.image, color, (8, 8), 8)
-        pygame.draw.circle(self.image, color, (8, 72), 8)
+        self.image = shapes.factory.shape((16, 80), (
+            ('rect', color, (0, 8, 16, 64)),
+            ('circle', color, (8, 8), 8),
+            ('circle', color, (8, 72), 8),
+        ), colorkey=BGCOLOR)
         self.rect = self.image.get_rect()
 
     def set_cmd(self, index):
@@ -75,10 +75,7 @@ class Ball(pygame.sprite.Sprite):
         self.load_sprite()
 
     def load_sprite(self):
-        self.image = pygame.Surface((16, 16))
-        self.image.fill(BGCOLOR)
-        self.image.set_colorkey(BGCOLOR)
-        pygame.draw.circle(self.image, RED, (8, 8), 8)
+        self.image = shapes.factory.circle(8, RED, colorkey=BGCOLOR)
         self.rect = self.image.get_rect()
 
     def update(self):
@@ -107,12 +104,13 @@ def handle_events():
 
 #### main ################################################################
 def main():
+    opts = options.parse_args('Pong')
     pygame.init()
-    CLOCK = pygame.time.Clock()
     DISPLAY = pygame.display.set_mode((MAX_X, MAX_Y))
-    FONT1 = pygame.font.SysFont('courier', 45)
+    FONT1 = fonts.registry.get('courier', 45)
+    FONT2 = fonts.registry.get('courier', 15)
     pygame.display.set_caption('pyGame Template')
-    random.seed()
+    random.seed(opts.seed)
 
     player1 = Paddle((20, MAX_Y//2), BLUE)
     player2 = Paddle((MAX_X-20, MAX_Y//2), GREEN)
@@ -122,9 +120,51 @@ def main():
     arena = pygame.Rect(0, 0, MAX_X, MAX_Y)
     allsprites = pygame.sprite.Group(players, balls)
 
+    renderer = render.Renderer(DISPLAY, BGCOLOR, opts.dirty, enabled=not opts.no_draw)
+    net_img = pygame.Surface((1, MAX_Y))
+    net_img.fill(GRAY)
+    timestep = loop.FixedStep(FPS, realtime=not opts.headless)
+    driver = headless.Driver(opts, keys=(K_UP, K_DOWN, K_w, K_s), timestep=timestep)
+    profile_overlay = overlay.Overlay(FPS, pos=(10, 70))
+
+    def save_state():
+        """Everything the game needs to carry on, for replay keyframes."""
+        return {
+            'random': random.getstate(),
+            'players': [ (p.rect.topleft, list(p.cmd), p.score) for p in (player1, player2) ],
+            'balls': [ (list(b.pos), list(b.vel)) for b in balls.sprites() ],
+        }
+
+    def load_state(state):
+        random.setstate(state['random'])
+        for p, (topleft, cmd, score) in zip((player1, player2), state['players']):
+            p.rect.topleft = topleft
+            p.cmd = list(cmd)
+            p.score = score
+        balls.empty()
+        for pos, vel in state['balls']:
+            b = Ball(list(vel), list(pos))
+            b.rect.center = b.pos
+            balls.add(b)
+
+    driver.set_state_handlers(save_state, load_state)
+
+    def hash_state(frame):
+        """Log a hash of the state at the end of frame, for --hash-log."""
+        hashes.entities('players', (player1, player2),
+                        lambda p: (p.rect.topleft, tuple(p.cmd), p.score))
+        hashes.entities('balls', balls, lambda b: (tuple(b.pos), tuple(b.vel)))
+        hashes.value('random', checksum.random_state())
+        hashes.end_frame(frame)
+
+    hashes = checksum.FrameHash(opts.hash_log) if opts.hash_log else None
+
     while True:
         #event handling
-        for event in pygame.event.get():
+        profiler.frames.begin()
+        driver.frame()
+        for event in driver.events():
+            profile_overlay.handle_event(event)
             if event.type == QUIT:
                 terminate()
 
@@ -142,52 +182,66 @@ def main():
                 elif event.key == K_DOWN: player2.unset_cmd(1)
                 elif event.key == K_w:    player1.unset_cmd(0)
                 elif event.key == K_s:    player1.unset_cmd(1)
-
-        # update game state
-        players.update()
-        balls.update()
-
-
-        # detect ball colliding with walls or endzones
-        for b in balls:
-            if b.rect.top < 0 or b.rect.bottom > MAX_Y:
-                b.vel[1] = -b.vel[1]
-
-            if b.rect.right < 0:
-                player2.score += 1
-                b.kill()
-                balls.add(Ball([4, 5]))
-
-            if b.rect.left > MAX_X:
-                player1.score += 1
-                b.kill()
-                balls.add(Ball([-4, 5]))
-
-        # detect collision with paddles
-        for b in pygame.sprite.spritecollide(player1, balls, 0):
-            b.vel[0] = -b.vel[0]
-        for b in pygame.sprite.spritecollide(player2, balls, 0):
-            b.vel[0] = -b.vel[0]
-
+        profiler.frames.mark('events')
+
+        # update game state, in fixed steps
+        for step in timestep.steps():
+            timestep.snapshot(players, balls)
+            players.update()
+            balls.update()
+            profiler.frames.mark('update')
+
+            # detect ball colliding with walls or endzones
+            for b in balls:
+                if b.rect.top < 0 or b.rect.bottom > MAX_Y:
+                    b.vel[1] = -b.vel[1]
+
+                if b.rect.right < 0:
+                    player2.score += 1
+                    b.kill()
+                    balls.add(Ball([4, 5]))
+
+                if b.rect.left > MAX_X:
+                    player1.score += 1
+                    b.kill()
+                    balls.add(Ball([-4, 5]))
+
+            # detect collision with paddles
+            for b in pygame.sprite.spritecollide(player1, balls, 0):
+                b.vel[0] = -b.vel[0]
+            for b in pygame.sprite.spritecollide(player2, balls, 0):
+                b.vel[0] = -b.vel[0]
+            profiler.frames.mark('collide')
+
+        if hashes is not None:
+            hash_state(driver.frames)
+            profiler.frames.mark('update')
 
         # draw frame
-        DISPLAY.fill(BGCOLOR)
+        timestep.draw(renderer, players)
+        timestep.draw(renderer, balls)
+        profiler.frames.mark('draw')
 
-        players.draw(DISPLAY)
-        balls.draw(DISPLAY)
-
-        p1_img = FONT1.render("%d"%(player1.score), True, GRAY, BGCOLOR)
+        p1_img = text.cache.render(FONT1, "%d"%(player1.score), True, GRAY, BGCOLOR)
         p1_img_pos = ( MAX_X//4-p1_img.get_width(), 10 )
-        DISPLAY.blit(p1_img, p1_img_pos )
+        renderer.blit('p1 score', p1_img, p1_img_pos )
 
-        p2_img = FONT1.render("%d"%(player2.score), True, GRAY, BGCOLOR)
+        p2_img = text.cache.render(FONT1, "%d"%(player2.score), True, GRAY, BGCOLOR)
         p2_img_pos = ( MAX_X*3//4-p2_img.get_width(), 10 )
-        DISPLAY.blit(p2_img, p2_img_pos )
+        renderer.blit('p2 score', p2_img, p2_img_pos )
+
+        renderer.blit('net', net_img, (MAX_X//2, 0))
 
-        pygame.draw.line(DISPLAY, GRAY, (MAX_X//2, 0), (MAX_X//2, MAX_Y))
+        if opts.debug:
+            debug_img = FONT2.render(renderer.stats_text(), True, GRAY, BGCOLOR)
+            renderer.blit('debug', debug_img, (10, MAX_Y-20))
+            loop_img = FONT2.render(timestep.stats_text(), True, GRAY, BGCOLOR)
+            renderer.blit('loop', loop_img, (10, MAX_Y-40))
 
-        pygame.display.update()
-        CLOCK.tick(FPS)
+        profile_overlay.draw(renderer)
+        profiler.frames.mark('hud')
+        renderer.update()
+        profiler.frames.end('flip')
 
     terminate()
 
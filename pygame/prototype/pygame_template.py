@@ -1,8 +1,11 @@
 #!/usr/bin/env python
 
-import pygame, sys, math, random
+import pygame, sys, os, math, random
 from pygame.locals import *
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from engine import fonts
+
 FPS = 30
 MAX_X = 800
 MAX_Y = 600
@@ -32,7 +35,7 @@ def main():
     pygame.init()
     CLOCK = pygame.time.Clock()
     DISPLAY = pygame.display.set_mode((MAX_X, MAX_Y))
-    FONT1 = pygame.font.SysFont('courier', 15)
+    FONT1 = fonts.registry.get('courier', 15)
     pygame.display.set_caption('pyGame Template')
     random.seed()
 
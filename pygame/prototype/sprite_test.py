@@ -1,8 +1,11 @@
 #!/usr/bin/env python
 
-import pygame, sys, math, random
+import pygame, sys, os, math, random
 from pygame.locals import *
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from engine import atlas, fonts
+
 FPS = 30
 MAX_X = 800
 MAX_Y = 600
@@ -18,14 +21,13 @@ BGCOLOR   = BLACK
 pygame.init()
 FPSCLOCK = pygame.time.Clock()
 DISPLAYSURF = pygame.display.set_mode((MAX_X, MAX_Y))
-BASICFONT = pygame.font.SysFont('courier', 15)
+BASICFONT = fonts.registry.get('courier', 15)
 pygame.display.set_caption('pyGame Template')
 random.seed()
 
 
 class Asteroid():
 
-    ast_spritesheet = None
     ast_img = []
     pos = (0, 0)
     vel = (0, 0)
@@ -36,15 +38,8 @@ class Asteroid():
         s = random.randint(3, 10)
         self.vel = (random.randint(-s, s), random.randint(-s, s))
 
-        #TODO: have only 1 instance of the spritesheet.  use a class variable?
-
-        #load asteroid sprite
-        self.ast_spritesheet = pygame.image.load('assets/asteroid2.png')
-        self.ast_img = []
-        s = 64
-        for y in range(0,6):
-            for x in range (0, 5):
-                self.ast_img.append(self.ast_spritesheet.subsurface( (x*s,y*s,s,s) ))
+        #load asteroid sprite (shared by all instances)
+        self.ast_img = atlas.sprites.animation('asteroid')
 
     def update(self):
         x = self.pos[0] + self.vel[0]
@@ -72,14 +67,8 @@ class Explosion():
         self.pos = pos
         self.frame = 0
 
-        #load explosion sprite
-        self.exp_spritesheet = pygame.image.load('assets/explosion1_64x64.png')
-        self.exp_img = []
-        s = 64
-        for y in range(0, 5):
-            for x in range (0, 5):
-                self.exp_img.append(self.exp_spritesheet.subsurface( (x*s,y*s,s,s) ))
-
+        #load explosion sprite (shared by all instances)
+        self.exp_img = atlas.sprites.animation('explosion')
 
     def update(self):
         pass
@@ -1,8 +1,11 @@
 #!/usr/bin/env python
 
-import pygame, sys, math, random
+import pygame, sys, os, math, random
 from pygame.locals import *
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from engine import atlas, ecs, fonts, preload, rotation
+
 FPS = 30
 MAX_X = 800
 MAX_Y = 600
@@ -19,16 +22,17 @@ BLUE      = ( 0,    0, 255)
 VIOLET    = (255,   0, 255)
 BGCOLOR = BLACK
 
+ROTATIONS = rotation.RotationCache(resolution=10)
+
 #---- class: Spritesheet -------------------------------------------------
 class Spritesheet():
     """
     Helper class to manage loading sprite sheet image files, slicing
-    them up into frames.  Ensures only one copy exists in memory.
+    them up into frames.  Frames come from the shared sprite atlas so only
+    one copy of each sheet exists in memory.
     """
 
     sprites = { }
-    sheet1 = None
-    sheet2 = None
 
     def __init__(self):
         self.load_asteroid_sprites()
@@ -36,13 +40,11 @@ class Spritesheet():
         self.load_ship_sprite()
 
     def load_asteroid_sprites(self):
-        self.sheet1 = pygame.image.load('assets/asteroid2.png')
-        images = self._extract_sprites(self.sheet1, 64, 6, 5)
+        images = atlas.sprites.animation('asteroid')
         self.sprites['asteroid'] = images
 
     def load_explosion_sprites(self):
-        self.sheet2 = pygame.image.load('assets/explosion1_64x64.png')
-        images = self._extract_sprites(self.sheet2, 64, 5, 5)
+        images = atlas.sprites.animation('explosion')
         self.sprites['explosion'] = images
 
     def load_ship_sprite(self):
@@ -55,57 +57,11 @@ class Spritesheet():
         self.sprites['ship'] = img
 
 
-    @staticmethod
-    def _extract_sprites(sheet, size, rows, columns):
-        images = []
-        for y in range(0, rows):
-            for x in range (0, columns):
-                rect = (x*size, y*size, size, size)
-                img = sheet.subsurface(rect)
-                images.append(img)
-        return images
-
-
     def get_sprites(self, name):
         return self.sprites[name]
 
 
 
-#---- class: AnimatedSprite ----------------------------------------------
-class AnimatedSprite(pygame.sprite.Sprite):
-
-    frames = None  #list of ordered images used for animation
-    repeat = True  #loop through frames or stop at the last one?
-
-    @classmethod
-    def set_frames(cls, frame_images):
-        cls.frames = frame_images
-
-    def __init__(self):
-        pygame.sprite.Sprite.__init__(self)
-        self.index = 0
-        self.image = self.frames[self.index]
-        self.rect = self.image.get_rect()
-
-    def advance_frame(self, increment = 1):
-        self.index += increment
-        max_index = len(self.frames)-1
-        if self.index > max_index:
-            if self.repeat:
-                self.index = 0
-            else:
-                self.index = max_index
-
-    def is_done(self):
-        return not self.repeat and self.index >= len(self.frames)-1
-
-    def update(self, *args):
-        self.advance_frame()
-        self.image = self.frames[self.index]
-        if self.is_done():
-            self.kill()
-
-
 #---- class: GameObject --------------------------------------------------
 class GameObject():
     """
@@ -140,28 +96,6 @@ class GameObject():
 
 
 
-#---- class: Asteroid ----------------------------------------------------
-class Asteroid(AnimatedSprite, GameObject):
-
-    def __init__(self, pos=[0,0], vel=[0,0]):
-        AnimatedSprite.__init__(self)
-        GameObject.__init__(self, pos, vel)
-
-    def update(self, commands):
-        AnimatedSprite.update(self)
-        GameObject.update(self)
-        self.rect.center = self.pos
-
-
-#---- class: Explosion ---------------------------------------------------
-class Explosion(AnimatedSprite):
-
-    def __init__(self, pos):
-        AnimatedSprite.__init__(self)
-        self.repeat = False
-        self.rect.center = pos
-
-
 #---- class: Ship --------------------------------------------------------
 class Ship(pygame.sprite.Sprite, GameObject):
 
@@ -170,6 +104,7 @@ class Ship(pygame.sprite.Sprite, GameObject):
         GameObject.__init__(self)
         self.image = self.image_orig
         self.rect = self.image.get_rect()
+        self.drawn_angle = None
         self.reset()
 
     def reset(self):
@@ -184,13 +119,16 @@ class Ship(pygame.sprite.Sprite, GameObject):
 
         GameObject.update(self)
 
-        self.image = pygame.transform.rotate(self.image_orig, -self.angle)
-        self.rect = self.image.get_rect()
+        if self.angle != self.drawn_angle:
+            self.image = ROTATIONS.rotate(self.image_orig, -self.angle)
+            self.rect.size = self.image.get_size()
+            self.drawn_angle = self.angle
         self.rect.center = self.pos
 
     @classmethod
     def set_image(cls, img):
         cls.image_orig = img
+        ROTATIONS.prewarm(img)
 
 
 ##########################################################################
@@ -244,16 +182,22 @@ def main():
     commands = {'quit': False, 'left': 0, 'right': 0, 'thrust': 0, 'fire': 0}
 
     DISPLAY, CLOCK = init(MAX_X, MAX_Y)
-    FONT1 = pygame.font.SysFont('courier', 45)
-    FONT2 = pygame.font.SysFont('courier', 15)
+    FONT1 = fonts.registry.get('courier', 45)
+    FONT2 = fonts.registry.get('courier', 15)
 
+    preloader = preload.Preloader(('asteroid', 'explosion'))
+    preload.loading_screen(DISPLAY, CLOCK, preloader, FONT2)
     sheet = Spritesheet()
-    Asteroid.set_frames( sheet.sprites['asteroid'] )
-    Explosion.set_frames( sheet.get_sprites('explosion') )
     Ship.set_image( sheet.sprites['ship'] )
 
-    asteroids = pygame.sprite.RenderPlain()
-    asteroids.add( Asteroid([140, 0], [3, 4]))
+    # asteroids and explosions are entities, drawn through sprite groups
+    world = ecs.World()
+    rock = world.add_kind( sheet.sprites['asteroid'] )
+    boom = world.add_kind( sheet.get_sprites('explosion'), loop=False )
+    world.spawn(pos=(140, 0), vel=(3, 4), kind=rock)
+    asteroids = ecs.SpriteGroup(world, kinds=[rock])
+    explosions = ecs.SpriteGroup(world, kinds=[boom])
+
     ship = Ship()
     allsprites = pygame.sprite.Group(ship)
 
@@ -266,13 +210,17 @@ def main():
             terminate()
 
         allsprites.update(commands)
-        asteroids.update(commands)
+        ecs.integrate(world)
+        ecs.wrap(world, (MAX_X, MAX_Y))
+        ecs.animate(world)
+        asteroids.sync()
+        explosions.sync()
 
         # detect collisions
         #func = pygame.sprite.collide_cirle()
         for a in pygame.sprite.spritecollide(ship, asteroids, False):
             if ship.alive():
-                allsprites.add( Explosion(ship.pos) )
+                world.spawn(pos=ship.pos, kind=boom)
                 ship.kill()
 
 
@@ -281,6 +229,7 @@ def main():
         # draw main screen
         DISPLAY.fill(BGCOLOR)
         allsprites.draw(DISPLAY)
+        explosions.draw(DISPLAY)
         asteroids.draw(DISPLAY)
 
         # advance game frame
@@ -315,14 +264,15 @@ class Game():
         self.max_x = self.display.get_width()
         self.max_y = self.display.get_height()
 
-        self.asteroids = pygame.sprite.RenderPlain()
+        self.world = ecs.World()
+        self.rock = self.world.add_kind(Spritesheet.sprites['asteroid'])
+        self.asteroids = ecs.SpriteGroup(self.world)
         self.create_level()
 
     def create_level(self):
         for i in range(0, self.level):
             pos_x = random.randint(0, self.max_x)
-            a = Asteroid([pos_x, 0], [3,4])
-            self.asteroids.add(a)
+            self.world.spawn(pos=(pos_x, 0), vel=(3, 4), kind=self.rock)
 
 
     def main_loop(self):
@@ -334,7 +284,10 @@ class Game():
             self.clock.tick(FPS)
 
     def update(self):
-        self.asteroids.update()
+        ecs.integrate(self.world)
+        ecs.wrap(self.world, (self.max_x, self.max_y))
+        ecs.animate(self.world)
+        self.asteroids.sync()
 
     def detect_collisions(self):
         pass
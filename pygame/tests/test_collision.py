@@ -0,0 +1,59 @@
+"""
+Collisions across the edges of a wrapping world whose size isn't a whole
+number of grid cells.  Run from the pygame directory:
+
+    python -m unittest discover tests
+"""
+
+import random, unittest
+import pygame
+from engine import collision
+
+
+def group(*rects):
+    sprites = []
+    for r in rects:
+        spr = pygame.sprite.Sprite()
+        spr.rect = pygame.Rect(r)
+        sprites.append(spr)
+    return pygame.sprite.Group(sprites), sprites
+
+
+#---- class: WrappedSeamTest ----------------------------------------------
+class WrappedSeamTest(unittest.TestCase):
+
+    def setUp(self):
+        # the asteroids2 grid: 800/64 and 600/64 leave a narrow last cell
+        self.hash = collision.SpatialHash(64, world_size=(800, 600))
+
+    def assertCollide(self, ra, rb):
+        groupa, (a,) = group(ra)
+        groupb, (b,) = group(rb)
+        self.assertTrue(self.hash.overlap(a.rect, b.rect))
+        self.assertEqual(self.hash.groupcollide(groupa, groupb, False, False), {a: [b]})
+        self.assertEqual(self.hash.spritecollide(a, groupb, False), [b])
+
+    def test_right_seam(self):
+        self.assertCollide((795, 300, 20, 10), (5, 300, 10, 10))
+
+    def test_bottom_seam(self):
+        self.assertCollide((300, 595, 10, 20), (300, 5, 10, 10))
+
+    def test_corner(self):
+        self.assertCollide((795, 595, 20, 20), (5, 5, 10, 10))
+
+    def test_same_as_overlap(self):
+        """The grid finds every pair overlap() finds."""
+        rng = random.Random(1)
+        rects = [ (rng.randrange(-50, 850), rng.randrange(-50, 650),
+                   rng.randrange(1, 120), rng.randrange(1, 120)) for i in range(300) ]
+        groupa, sprites_a = group(*rects[:150])
+        groupb, sprites_b = group(*rects[150:])
+        found = self.hash.groupcollide(groupa, groupb, False, False)
+        for a in sprites_a:
+            expected = [ b for b in sprites_b if self.hash.overlap(a.rect, b.rect) ]
+            self.assertEqual(found.get(a, []), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
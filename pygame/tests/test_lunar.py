@@ -0,0 +1,71 @@
+"""
+Touching down flush with either end of a lunar_lander platform is a
+landing, not a crash, whatever the terrain next to the platform does.
+Run from the pygame directory:
+
+    python -m unittest discover tests
+"""
+
+import os, random, unittest
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+import pygame
+import lunar_lander
+from lunar_lander import Planet, Ship, Terrain
+
+
+def touch_down(ship, terrain, x):
+    """Put the ship at x just below the platform under it and run the
+    collision tests of a step, as the main loop does."""
+    plat = terrain.platform_under(x)
+    ship.reset(x)
+    ship.pos_y = plat[0][1] - 6 + 0.5       # the bottom is 6 below pos_y
+    ship.vel_y = -1
+    ship.detect_landing(plat)
+    ship.detect_crash(terrain)
+    return ship
+
+
+#---- class: FlushLandingTest ---------------------------------------------
+class FlushLandingTest(unittest.TestCase):
+
+    def assertLands(self, terrain, x):
+        ship = touch_down(Ship(), terrain, x)
+        self.assertTrue(ship.landed, f"no landing at x={x}")
+        self.assertFalse(ship.crashed, f"crashed landing at x={x}")
+
+    def test_planet(self):
+        w = Ship.HALF_WIDTH
+        for seed in range(200):
+            random.seed(seed)
+            planet = Planet()
+            (x1, y), (x2, _) = planet.platform
+            with self.subTest(seed=seed):
+                self.assertLands(planet, x1 + w)
+                self.assertLands(planet, x2 - w)
+                self.assertLands(planet, x2 - w - 0.4)
+
+    def test_endless_terrain(self):
+        pygame.display.init()
+        pygame.display.set_mode((lunar_lander.MAX_X, lunar_lander.MAX_Y))
+        self.addCleanup(pygame.display.quit)
+        w = Ship.HALF_WIDTH
+        for seed in range(20):
+            terrain = Terrain(seed)
+            for k in range(-2, 3):
+                (x1, y), (x2, _) = terrain.chunk_at(k * Terrain.CHUNK_W).platform
+                with self.subTest(seed=seed, chunk=k):
+                    self.assertLands(terrain, x1 + w)
+                    self.assertLands(terrain, x2 - w)
+
+    def test_crash_beside_platform(self):
+        random.seed(1)
+        planet = Planet()
+        ship = Ship()
+        ship.reset(0)
+        ship.pos_y = max(planet.heights[:Ship.HALF_WIDTH + 1])
+        ship.detect_crash(planet)
+        self.assertTrue(ship.crashed)
+
+
+if __name__ == '__main__':
+    unittest.main()